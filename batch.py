@@ -0,0 +1,194 @@
+"""
+Headless batch analysis of recorded video.
+
+Runs the optical flow analysis and/or the frame differencing motion
+detector over a video as fast as frames can be decoded, and streams the
+per-frame results into a results directory (see results.py).
+
+Example:
+    python batch.py recording.mp4 -o recording_results
+"""
+import argparse
+import time
+
+import cv2
+
+from diffrence import MotionDetector, draw_boxes
+from frames import FramePool, FrameReader
+from optical_flow import FLOW_BACKENDS, MotionAnalyzer, MotionPredictor, draw_flow
+from recording import open_capture
+from results import ResultWriter
+
+
+def open_video(video_path, start_frame=0):
+    """
+    Open a video or recording positioned at start_frame.
+
+    Falls back to decoding and dropping frames from the start when the
+    backend cannot seek exactly.
+    """
+    cap = open_capture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Error opening video file")
+
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start_frame:
+            cap.release()
+            cap = open_capture(video_path)
+            for _ in range(start_frame):
+                if not cap.grab():
+                    break
+
+    return cap
+
+
+def video_metadata(cap, video_path, flow, diff):
+    return {
+        'source': str(video_path),
+        'fps': cap.get(cv2.CAP_PROP_FPS),
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'flow': flow,
+        'diff': diff,
+    }
+
+
+def process_frames(cap, writer, start_frame=0, end_frame=None, record_from=None,
+                   flow=True, diff=True, show=False, max_points=1000, min_points=600,
+                   scale_factor=0.5, min_area=500, backend='lk', predict=False):
+    """
+    Analyze frames from a capture and write their results.
+
+    Args:
+        cap: Capture positioned at start_frame
+        writer: ResultWriter receiving one record per frame
+        start_frame: Index of the next frame cap will return
+        end_frame: Stop before this frame index, or None for the whole video
+        record_from: First frame index to write; earlier frames only warm up
+            the trackers. Defaults to start_frame.
+        flow: Run the optical flow analysis
+        diff: Run the frame differencing motion detector
+        show: Display each analyzed frame (slows processing down)
+        backend: Optical flow backend name, see optical_flow.FLOW_BACKENDS
+        predict: Seed LK with predicted point motion, see optical_flow.MotionPredictor
+
+    Returns:
+        Number of frames written
+    """
+    if record_from is None:
+        record_from = start_frame
+
+    predictor = MotionPredictor() if predict else None
+    analyzer = MotionAnalyzer(max_points, min_points, backend=backend, predictor=predictor) if flow else None
+    detector = MotionDetector(scale_factor, min_area) if diff else None
+
+    # Analysis finishes with each frame before the next is read, so one buffer is enough
+    pool = FramePool(count=1)
+    reader = FrameReader(cap, pool)
+
+    frame_index = start_frame
+    written = 0
+    try:
+        while end_frame is None or frame_index < end_frame:
+            frame = reader.read()
+            if frame is None:
+                break
+
+            flow_result = analyzer.process(frame) if analyzer else None
+            boxes = detector.process(frame) if detector else None
+
+            if frame_index >= record_from:
+                if flow_result is not None:
+                    writer.write(frame_index, *flow_result, boxes=boxes)
+                else:
+                    writer.write(frame_index, boxes=boxes)
+                written += 1
+
+            if show:
+                frame_vis = draw_flow(frame, flow_result) if flow_result is not None else frame.copy()
+                draw_boxes(frame_vis, boxes or [])
+                cv2.imshow('Batch', frame_vis)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+            pool.release(frame)
+            frame_index += 1
+    finally:
+        if analyzer is not None:
+            analyzer.close()
+
+    if show:
+        cv2.destroyAllWindows()
+
+    return written
+
+
+def run_batch(video_path, output_path, chunk_size=256, compress=False, **options):
+    """
+    Analyze every frame of a video and write the results.
+
+    Args:
+        video_path: Path to input video
+        output_path: Results directory to write
+        chunk_size: Number of frames per results chunk
+        compress: Compress the results chunks
+        options: Analysis options passed on to process_frames()
+
+    Returns:
+        Number of frames processed
+    """
+    cap = open_video(video_path)
+    metadata = video_metadata(cap, video_path, options.get('flow', True), options.get('diff', True))
+
+    start = time.perf_counter()
+    with ResultWriter(output_path, chunk_size, compress, metadata) as writer:
+        frames = process_frames(cap, writer, **options)
+    elapsed = time.perf_counter() - start
+    cap.release()
+
+    print(f"Processed {frames} frames in {elapsed:.1f}s "
+          f"({frames / max(elapsed, 1e-9):.1f} fps)")
+    return frames
+
+
+def add_analysis_arguments(parser):
+    parser.add_argument('--no-flow', action='store_true', help="skip the optical flow analysis")
+    parser.add_argument('--no-diff', action='store_true', help="skip the frame differencing detector")
+    parser.add_argument('--chunk-size', type=int, default=256, help="frames per results chunk")
+    parser.add_argument('--compress', action='store_true', help="compress results chunks")
+    parser.add_argument('--max-points', type=int, default=1000)
+    parser.add_argument('--min-points', type=int, default=600)
+    parser.add_argument('--scale-factor', type=float, default=0.5)
+    parser.add_argument('--min-area', type=int, default=500)
+    parser.add_argument('--backend', choices=sorted(FLOW_BACKENDS), default='lk', help="optical flow backend")
+    parser.add_argument('--predict', action='store_true',
+                        help="seed LK with predicted motion and track with fewer levels and iterations")
+
+
+def analysis_options(args):
+    return dict(
+        flow=not args.no_flow, diff=not args.no_diff,
+        max_points=args.max_points, min_points=args.min_points,
+        scale_factor=args.scale_factor, min_area=args.min_area, backend=args.backend,
+        predict=args.predict,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless batch motion analysis of a video file")
+    parser.add_argument('video', help="input video file")
+    parser.add_argument('-o', '--output', required=True, help="results directory")
+    add_analysis_arguments(parser)
+    parser.add_argument('--show', action='store_true', help="display frames while processing")
+    args = parser.parse_args()
+
+    run_batch(
+        args.video, args.output,
+        chunk_size=args.chunk_size, compress=args.compress, show=args.show,
+        **analysis_options(args)
+    )
+
+
+if __name__ == "__main__":
+    main()
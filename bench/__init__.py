@@ -0,0 +1,117 @@
+"""Benchmarks for the camera, HUD and framebuffer code.
+
+Run every suite with `python -m bench` from the repository root, or a
+single suite directly, e.g. `python -m bench.hud`.
+
+Suites are modules with `bench_*(benchmark, scene)` functions, written in
+the style of pytest-benchmark: `benchmark(fn, *args)` times fn and returns
+its result. `accuracy_*(scene)` functions return a dict of metrics checked
+against the scene's ground truth.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+# The Pi code in src/ is written to run with src/ as the working directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def measure(fn, rounds=200, warmup=10):
+    """Call fn repeatedly and return per-call timings in milliseconds."""
+    for i in range(warmup):
+        fn(i)
+
+    timings = np.empty(rounds)
+    for i in range(rounds):
+        start = time.perf_counter()
+        fn(i)
+        timings[i] = (time.perf_counter() - start) * 1000
+
+    return timings
+
+
+def report(name, timings):
+    """Print a one line summary of timings returned by measure()."""
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f"{name:<40} mean {timings.mean():8.3f} ms  "
+          f"p50 {p50:8.3f}  p95 {p95:8.3f}  p99 {p99:8.3f}")
+
+
+class Benchmark:
+    """pytest-benchmark style timer handed to bench_* functions."""
+
+    def __init__(self, rounds=200, warmup=10):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.name = None
+        self.results = {}
+
+    def __call__(self, fn, *args, **kwargs):
+        result = []
+
+        def step(i):
+            result[:] = [fn(*args, **kwargs)]
+
+        timings = measure(step, self.rounds, self.warmup)
+        self.results[self.name] = timings
+        report(self.name, timings)
+        return result[0]
+
+
+def suite_name(module):
+    return os.path.splitext(os.path.basename(module.__file__))[0]
+
+
+def run_suite(module, scene, rounds=200, warmup=10):
+    """Run the bench_* and accuracy_* functions of a suite module."""
+    benchmark = Benchmark(rounds, warmup)
+    metrics = {}
+
+    for name in dir(module):
+        if name.startswith('bench_'):
+            benchmark.name = f"{suite_name(module)}.{name[len('bench_'):]}"
+            getattr(module, name)(benchmark, scene)
+
+    for name in dir(module):
+        if name.startswith('accuracy_'):
+            result = getattr(module, name)(scene)
+            metrics[name[len('accuracy_'):]] = result
+            values = "  ".join(f"{key} {value:.3f}" for key, value in result.items())
+            print(f"{name[len('accuracy_'):]:<40} {values}")
+
+    return benchmark.results, metrics
+
+
+def main(modules=None):
+    """Command line entry point running the given suite modules on a synthetic scene."""
+    import argparse
+    from bench import diff, flow, framebuffer, frames, frontend, hud, overlay
+    from bench.synthetic import SyntheticScene
+
+    suites = {module.__name__.split('.')[-1]: module
+              for module in (flow, diff, hud, framebuffer, frames, frontend, overlay)}
+
+    parser = argparse.ArgumentParser(description="Run benchmarks on a synthetic scene")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--rounds', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    if modules is None:
+        parser.add_argument('--suite', action='append', choices=sorted(suites),
+                            help="suite to run, may be repeated (default: all)")
+    args = parser.parse_args()
+
+    if modules is None:
+        modules = [suites[name] for name in args.suite] if args.suite else list(suites.values())
+
+    scene = SyntheticScene(args.width, args.height, seed=args.seed)
+    print(f"Synthetic scene {args.width}x{args.height}, {args.rounds} rounds")
+    for module in modules:
+        print(f"--- {suite_name(module)}")
+        run_suite(module, scene, args.rounds, args.warmup)
@@ -0,0 +1,69 @@
+"""Frame differencing motion detection."""
+import itertools
+import os
+import tempfile
+
+import bench
+from bench.synthetic import write_video
+from batch import open_video, process_frames
+from diffrence import MotionDetector
+from results import ResultWriter
+
+ACCURACY_FRAMES = 60
+VIDEO_FRAMES = 60
+
+
+def bench_motion_detector(benchmark, scene):
+    frames = itertools.cycle(scene.with_camera().frames(2))
+    detector = MotionDetector()
+    detector.process(next(frames))
+    benchmark(lambda: detector.process(next(frames)))
+
+
+def bench_process_video(benchmark, scene):
+    # process_video needs a display, so time the same detector through the
+    # headless batch path on an encoded video
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene.with_camera(), path, VIDEO_FRAMES)
+
+        def run():
+            cap = open_video(path)
+            with ResultWriter(os.path.join(tmp, 'results')) as writer:
+                process_frames(cap, writer, flow=False)
+            cap.release()
+
+        benchmark(run)
+
+
+def accuracy_motion_boxes(scene):
+    """Share of objects covered by a detected box, and of boxes that hit an object."""
+    static = scene.with_camera()
+    detector = MotionDetector()
+    detector.process(static.frame(0))
+
+    objects_found = objects_total = 0
+    boxes_on_objects = boxes_total = 0
+    for i in range(1, ACCURACY_FRAMES):
+        boxes = detector.process(static.frame(i))
+        truth = static.object_boxes(i)
+
+        objects_total += len(truth)
+        objects_found += sum(any(overlaps(obj, box) for box in boxes) for obj in truth)
+        boxes_total += len(boxes)
+        boxes_on_objects += sum(any(overlaps(box, obj) for obj in truth) for box in boxes)
+
+    return {
+        'precision': boxes_on_objects / boxes_total if boxes_total else 1.0,
+        'recall': objects_found / objects_total if objects_total else 1.0,
+    }
+
+
+def overlaps(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+if __name__ == "__main__":
+    bench.main([bench.diff])
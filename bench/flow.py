@@ -0,0 +1,251 @@
+"""Optical flow stages: feature detection, LK tracking and outlier estimation."""
+import itertools
+
+import numpy as np
+
+import bench
+from bench.synthetic import precision_recall
+from motion_gate import GatedMotionAnalyzer
+from objects import ObjectTracker, cluster_outliers
+from optical_flow import (CAMERA_MODELS, FLOW_BACKENDS, CameraMotionEstimator, FlowTracker, MotionAnalyzer,
+                          MotionPredictor, calculate_optical_flow, detect_feature_points,
+                          estimate_camera_motion)
+
+ACCURACY_FRAMES = 60
+
+
+def bench_detect_feature_points(benchmark, scene):
+    benchmark(detect_feature_points, scene.frame(0))
+
+
+def bench_calculate_optical_flow(benchmark, scene):
+    prev, curr = scene.frame(0), scene.frame(1)
+    points = detect_feature_points(prev)
+    benchmark(calculate_optical_flow, prev, curr, points)
+
+
+def bench_flow_tracker(benchmark, scene):
+    frames = itertools.cycle(scene.frames(2))
+    tracker = FlowTracker()
+    tracker.push(next(frames))
+    points = detect_feature_points(tracker.curr_gray)
+
+    def step():
+        tracker.push(next(frames))
+        return tracker.track(points)
+
+    benchmark(step)
+
+
+def bench_estimate_camera_motion(benchmark, scene):
+    prev, curr = scene.frame(0), scene.frame(1)
+    curr_points, prev_points = calculate_optical_flow(prev, curr, detect_feature_points(prev))
+    benchmark(estimate_camera_motion, prev_points, curr_points)
+
+
+def bench_camera_motion_estimator(benchmark, scene):
+    prev, curr = scene.frame(0), scene.frame(1)
+    curr_points, prev_points = calculate_optical_flow(prev, curr, detect_feature_points(prev))
+    estimator = CameraMotionEstimator()
+    benchmark(estimator.estimate, prev_points, curr_points)
+
+
+def bench_camera_motion_estimator_5000(benchmark, scene):
+    # Five times the points: only the final per-point pass grows
+    prev, curr = scene.frame(0), scene.frame(1)
+    curr_points, prev_points = calculate_optical_flow(prev, curr, detect_feature_points(prev))
+    prev_points, curr_points = np.tile(prev_points, (5, 1)), np.tile(curr_points, (5, 1))
+    estimator = CameraMotionEstimator()
+    benchmark(estimator.estimate, prev_points, curr_points)
+
+
+def bench_camera_motion_estimator_affine(benchmark, scene):
+    prev, curr = scene.frame(0), scene.frame(1)
+    curr_points, prev_points = calculate_optical_flow(prev, curr, detect_feature_points(prev))
+    estimator = CameraMotionEstimator(model='affine')
+    benchmark(estimator.estimate, prev_points, curr_points)
+
+
+def bench_motion_analyzer(benchmark, scene):
+    frames = itertools.cycle(scene.frames(30))
+    analyzer = MotionAnalyzer()
+    analyzer.process(next(frames))
+    benchmark(lambda: analyzer.process(next(frames)))
+
+
+def bench_motion_analyzer_predicted(benchmark, scene):
+    frames = itertools.cycle(scene.frames(30))
+    analyzer = MotionAnalyzer(predictor=MotionPredictor())
+    analyzer.process(next(frames))
+    benchmark(lambda: analyzer.process(next(frames)))
+
+
+def bench_motion_analyzer_dis(benchmark, scene):
+    frames = itertools.cycle(scene.frames(30))
+    analyzer = MotionAnalyzer(backend='dis')
+    analyzer.process(next(frames))
+    benchmark(lambda: analyzer.process(next(frames)))
+
+
+def bench_motion_analyzer_tiled(benchmark, scene):
+    frames = itertools.cycle(scene.frames(30))
+    analyzer = MotionAnalyzer(backend='tiled')
+    analyzer.process(next(frames))
+    benchmark(lambda: analyzer.process(next(frames)))
+    analyzer.close()
+
+
+def bench_gated_motion_analyzer(benchmark, scene):
+    # Fixed camera, so only the moving objects open the gate
+    frames = itertools.cycle(scene.with_camera().frames(30))
+    gated = GatedMotionAnalyzer()
+    gated.process(next(frames))
+    benchmark(lambda: gated.process(next(frames)))
+
+
+def bench_cluster_outliers(benchmark, scene):
+    analyzer = MotionAnalyzer()
+    analyzer.process(scene.frame(0))
+    result = analyzer.process(scene.frame(1))
+    benchmark(cluster_outliers, result)
+
+
+def bench_object_tracker(benchmark, scene):
+    frames = itertools.cycle(scene.frames(30))
+    analyzer = MotionAnalyzer()
+    analyzer.process(next(frames))
+    results = [analyzer.process(next(frames)) for _ in range(29)]
+    tracker = ObjectTracker()
+    results = itertools.cycle(results)
+    benchmark(lambda: tracker.update(next(results)))
+
+
+def accuracy_objects(scene):
+    """
+    On a fixed camera: share of scene objects covered by a tracked object,
+    and track IDs started per scene object (1.0 means no ID switches).
+    """
+    static = scene.with_camera()
+    analyzer = MotionAnalyzer()
+    tracker = ObjectTracker()
+    analyzer.process(static.frame(0))
+
+    found = total = 0
+    for i in range(1, ACCURACY_FRAMES):
+        frame = static.frame(i)
+        objects = tracker.update(analyzer.process(frame), frame.shape)
+        for x, y, w, h in static.object_boxes(i):
+            total += 1
+            found += any(x <= obj.centroid[0] < x + w and y <= obj.centroid[1] < y + h for obj in objects)
+
+    ids_per_object = tracker.next_id / len(static.object_boxes(0))
+    assert ids_per_object <= 1.5, f"{ids_per_object:.2f} track IDs per object, tracks are being lost"
+    return {
+        'recall': found / total if total else 1.0,
+        'ids_per_object': ids_per_object,
+    }
+
+
+def accuracy_backends(scene):
+    """
+    Per flow backend: mean camera motion error and median endpoint error of
+    the background vectors, in pixels.
+    """
+    metrics = {}
+    for name in FLOW_BACKENDS:
+        analyzer = MotionAnalyzer(backend=name)
+        analyzer.process(scene.frame(0))
+
+        motion_error = []
+        endpoint_error = []
+        for i in range(1, ACCURACY_FRAMES):
+            result = analyzer.process(scene.frame(i))
+            motion_error.append(np.linalg.norm(result.camera_motion - scene.camera_motion(i)))
+
+            # Background points well clear of the objects
+            background = ~scene.on_objects(result.prev_points, i - 1, margin=-8)
+            expected = scene.camera_flow(result.prev_points[background], i)
+            endpoint_error.append(np.median(np.linalg.norm(result.points[background] - expected, axis=1)))
+
+        if hasattr(analyzer.tracker, 'close'):
+            analyzer.close()
+        metrics[f'{name}_motion_px'] = float(np.mean(motion_error))
+        metrics[f'{name}_endpoint_px'] = float(np.mean(endpoint_error))
+    return metrics
+
+
+def accuracy_predicted(scene):
+    """
+    Camera motion error with and without MotionPredictor, on the scene and on
+    a fast camera (10 px per frame), and the share of frames tracked from the
+    predictions with the reduced settings.
+    """
+    metrics = {}
+    for name, camera in (('', scene), ('fast_', scene.with_camera(shift=(8.0, 6.0)))):
+        for mode, predictor in (('full', None), ('predicted', MotionPredictor())):
+            analyzer = MotionAnalyzer(predictor=predictor)
+            analyzer.process(camera.frame(0))
+            motion_error = [np.linalg.norm(analyzer.process(camera.frame(i)).camera_motion - camera.camera_motion(i))
+                            for i in range(1, ACCURACY_FRAMES)]
+            metrics[f'{name}{mode}_motion_px'] = float(np.mean(motion_error))
+        stats = predictor.stats()
+        metrics[f'{name}predicted_share'] = stats['predicted'] / stats['frames']
+    return metrics
+
+
+def accuracy_outliers(scene):
+    """Outlier precision/recall against the objects, and camera motion error."""
+    analyzer = MotionAnalyzer()
+    analyzer.process(scene.frame(0))
+
+    predicted = []
+    actual = []
+    motion_error = []
+    for i in range(1, ACCURACY_FRAMES):
+        result = analyzer.process(scene.frame(i))
+        if len(result.points) == 0:
+            continue
+        predicted.append(result.outliers)
+        actual.append(scene.on_objects(result.prev_points, i - 1))
+        motion_error.append(np.linalg.norm(result.camera_motion - scene.camera_motion(i)))
+
+    precision, recall = precision_recall(np.concatenate(predicted), np.concatenate(actual))
+    return {
+        'precision': precision,
+        'recall': recall,
+        'camera_motion_error_px': float(np.mean(motion_error)),
+    }
+
+
+def accuracy_camera_models(scene):
+    """Outlier precision/recall per camera model, with the camera also rotating."""
+    rotating = scene.with_camera(shift=scene.camera_shift, rotation=0.3)
+    metrics = {}
+    for model in CAMERA_MODELS:
+        analyzer = MotionAnalyzer(camera_model=model)
+        analyzer.process(rotating.frame(0))
+
+        predicted = []
+        actual = []
+        for i in range(1, ACCURACY_FRAMES):
+            result = analyzer.process(rotating.frame(i))
+            predicted.append(result.outliers)
+            actual.append(rotating.on_objects(result.prev_points, i - 1))
+
+        precision, recall = precision_recall(np.concatenate(predicted), np.concatenate(actual))
+        metrics[f'{model}_precision'] = precision
+        metrics[f'{model}_recall'] = recall
+    return metrics
+
+
+def accuracy_gated(scene):
+    """Share of point tracking the motion gate saves on a fixed camera."""
+    gated = GatedMotionAnalyzer()
+    for frame in scene.with_camera().frames(ACCURACY_FRAMES):
+        gated.process(frame)
+    stats = gated.stats()
+    return dict(stats['modes'], points_saved=stats['points_saved'])
+
+
+if __name__ == "__main__":
+    bench.main([bench.flow])
@@ -0,0 +1,79 @@
+"""FrameBuffer.display_frame against a file-backed fake framebuffer."""
+import itertools
+import os
+import tempfile
+
+import cv2
+
+import bench
+from framebuffer import FrameBuffer, create_fake_framebuffer
+
+PIXEL_FORMATS = ('RGB565', 'BGR888', 'BGRA8888')
+
+
+def _bench_display(benchmark, frames, pixel_format, **kwargs):
+    height, width = frames[0].shape[:2]
+    yres_virtual = height * 2 if kwargs.get('double_buffer') else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fb0')
+        var_info, fix_info = create_fake_framebuffer(path, width, height, pixel_format, yres_virtual)
+        fb = FrameBuffer(path, var_info, fix_info, **kwargs)
+
+        frames = itertools.cycle(frames)
+        benchmark(lambda: fb.display_frame(next(frames)))
+        del fb
+
+
+def bench_display_frame(benchmark, scene):
+    frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in scene.frames(2)]
+    name = benchmark.name
+    for pixel_format in PIXEL_FORMATS:
+        benchmark.name = f"{name} {pixel_format}"
+        _bench_display(benchmark, frames, pixel_format)
+
+
+def bench_display_frame_double_buffer(benchmark, scene):
+    frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in scene.frames(2)]
+    _bench_display(benchmark, frames, 'RGB565', double_buffer=True)
+
+
+def bench_display_frame_dirty_tiles(benchmark, scene):
+    # Static background with only the moving objects changing
+    frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in scene.with_camera().frames(2)]
+    _bench_display(benchmark, frames, 'RGB565', tile_size=(32, 32))
+
+
+def accuracy_write_fraction(scene):
+    """
+    Framebuffer bytes written per frame, as a fraction of a full frame.
+    Double buffering must not write anything twice, so none may exceed 1.
+    """
+    moving = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in scene.frames(10)]
+    static = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in scene.with_camera().frames(10)]
+    height, width = moving[0].shape[:2]
+    configs = {
+        'single': (moving, {}),
+        'double': (moving, dict(double_buffer=True)),
+        'tiles': (static, dict(tile_size=(32, 32))),
+        'double_tiles': (static, dict(double_buffer=True, tile_size=(32, 32))),
+    }
+
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fb0')
+        for name, (frames, kwargs) in configs.items():
+            yres_virtual = height * 2 if kwargs.get('double_buffer') else None
+            var_info, fix_info = create_fake_framebuffer(path, width, height, 'RGB565', yres_virtual)
+            fb = FrameBuffer(path, var_info, fix_info, **kwargs)
+            for frame in frames:
+                fb.display_frame(frame)
+            metrics[name] = fb.write_stats()['fraction_of_full_frame']
+            del fb
+
+    assert all(fraction <= 1.0 for fraction in metrics.values()), metrics
+    return metrics
+
+
+if __name__ == "__main__":
+    bench.main([bench.framebuffer])
@@ -0,0 +1,177 @@
+"""
+Frame buffer reuse: capture, resize and color conversion with and without a
+FramePool, and reading frames from a video against a raw recording.
+"""
+import os
+import tempfile
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import bench
+from bench.synthetic import write_video
+from frames import FramePool, FrameReader
+from recording import FrameReplay, record
+
+VIDEO_FRAMES = 30
+DISPLAY_SIZE = (800, 480)
+
+
+def plain_step(cap):
+    ret, frame = cap.read()
+    if not ret:
+        return False
+    frame = cv2.resize(frame, DISPLAY_SIZE, interpolation=cv2.INTER_LINEAR)
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    frame_vis = frame.copy()
+    return True
+
+
+def pooled_step(reader, pool):
+    frame = reader.read()
+    if frame is None:
+        return False
+    shape = (DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3)
+    resized = pool.acquire(shape)
+    cv2.resize(frame, DISPLAY_SIZE, dst=resized, interpolation=cv2.INTER_LINEAR)
+    pool.release(frame)
+    rgb = pool.acquire(shape)
+    cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=rgb)
+    pool.release(resized)
+    frame_vis = pool.acquire(shape)
+    np.copyto(frame_vis, rgb)
+    pool.release(rgb)
+    pool.release(frame_vis)
+    return True
+
+
+def looping(path):
+    """Open a video, returning the capture and a function rewinding it."""
+    cap = cv2.VideoCapture(path)
+
+    def rewind():
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    return cap, rewind
+
+
+def bench_plain_loop(benchmark, scene):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene, path, VIDEO_FRAMES)
+        cap, rewind = looping(path)
+
+        def step():
+            if not plain_step(cap):
+                rewind()
+
+        benchmark(step)
+        cap.release()
+
+
+def bench_pooled_loop(benchmark, scene):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene, path, VIDEO_FRAMES)
+        cap, rewind = looping(path)
+        pool = FramePool()
+        reader = FrameReader(cap, pool)
+
+        def step():
+            if not pooled_step(reader, pool):
+                rewind()
+
+        benchmark(step)
+        cap.release()
+
+
+def bench_video_read(benchmark, scene):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene, path, VIDEO_FRAMES)
+        cap, rewind = looping(path)
+
+        def step():
+            if not cap.read()[0]:
+                rewind()
+
+        benchmark(step)
+        cap.release()
+
+
+def bench_replay_read(benchmark, scene):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene, path, VIDEO_FRAMES)
+        record(path, os.path.join(tmp, 'scene.rec'))
+        replay = FrameReplay(os.path.join(tmp, 'scene.rec'), loop=True)
+        benchmark(replay.read)
+        replay.release()
+
+
+def bench_replay_reader(benchmark, scene):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene, path, VIDEO_FRAMES)
+        record(path, os.path.join(tmp, 'scene.rec'))
+        replay = FrameReplay(os.path.join(tmp, 'scene.rec'), loop=True)
+        pool = FramePool()
+        reader = FrameReader(replay, pool)
+
+        def step():
+            pool.release(reader.read())
+
+        benchmark(step)
+        replay.release()
+
+
+def peak_allocations(step, frames):
+    """
+    Bytes allocated on top of what is already held, at the peak of each
+    step, traced with tracemalloc. Returns the mean over frames.
+    """
+    tracemalloc.start()
+    peaks = []
+    for _ in range(frames):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - current)
+    tracemalloc.stop()
+    return float(np.mean(peaks))
+
+
+def accuracy_allocations(scene):
+    """
+    Peak extra memory per frame in steady state, in display frames, with and
+    without a pool. The pooled loop should allocate no frame buffers at all.
+    """
+    frame_bytes = DISPLAY_SIZE[0] * DISPLAY_SIZE[1] * 3
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scene.avi')
+        write_video(scene, path, VIDEO_FRAMES)
+
+        cap = cv2.VideoCapture(path)
+        plain_step(cap)
+        plain = peak_allocations(lambda: plain_step(cap), VIDEO_FRAMES - 2)
+        cap.release()
+
+        cap = cv2.VideoCapture(path)
+        pool = FramePool()
+        reader = FrameReader(cap, pool)
+        pooled_step(reader, pool)
+        pooled_step(reader, pool)
+        pooled = peak_allocations(lambda: pooled_step(reader, pool), VIDEO_FRAMES - 3)
+        cap.release()
+
+    return {
+        'plain_frames': plain / frame_bytes,
+        'pooled_frames': pooled / frame_bytes,
+        'pool_grown': pool.grown,
+    }
+
+
+if __name__ == "__main__":
+    bench.main([bench.frames])
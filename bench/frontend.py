@@ -0,0 +1,69 @@
+"""pygame frontend (pygame-video.py), rendered with SDL's dummy video driver."""
+import importlib.util
+import os
+
+import cv2
+import numpy as np
+
+import bench
+
+
+def load_frontend():
+    """Import pygame-video.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location('pygame_video', os.path.join(bench.ROOT, 'pygame-video.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def setup():
+    frontend = load_frontend()
+    width, height = frontend.size
+    screen = frontend.init_display(width, height, headless=True)
+    return frontend, screen, frontend.CameraSurface(width, height), frontend.PitchYawHUD()
+
+
+def bench_render_frame(benchmark, scene):
+    frontend, screen, camera_surface, hud = setup()
+    frame = scene.frame(0)
+    benchmark(lambda: frontend.render_frame(screen, camera_surface, hud, frame, 10, 45))
+
+
+def bench_camera_surface_upload(benchmark, scene):
+    frontend, screen, camera_surface, hud = setup()
+    frame = scene.frame(0)
+    benchmark(lambda: screen.blit(camera_surface.upload(frame), (0, 0)))
+
+
+def bench_surfarray_upload(benchmark, scene):
+    # The per-frame conversion and transpose the frontend used to do
+    frontend, screen, camera_surface, hud = setup()
+    frame = scene.frame(0)
+    size = frontend.size
+
+    def upload():
+        resized = cv2.resize(frame, dsize=(size[0], size[1]), interpolation=cv2.INTER_CUBIC)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        frontend.pygame.surfarray.blit_array(screen, rgb.swapaxes(0, 1))
+
+    benchmark(upload)
+
+
+def accuracy_upload(scene):
+    """
+    Largest pixel difference between the persistent surface and a surfarray
+    upload, both resizing the camera frame with the same interpolation.
+    """
+    frontend, screen, camera_surface, hud = setup()
+    width, height = frontend.size
+    frame = scene.frame(0)
+
+    screen.blit(camera_surface.upload(frame), (0, 0))
+    shown = frontend.pygame.surfarray.array3d(screen).swapaxes(0, 1)
+    resized = cv2.resize(frame, dsize=(width, height), interpolation=cv2.INTER_CUBIC)
+    expected = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    return {'max_error': float(np.abs(shown.astype(int) - expected).max())}
+
+
+if __name__ == "__main__":
+    bench.main([bench.frontend])
@@ -0,0 +1,29 @@
+"""Compare the pre-rendered HUD tapes against drawing every tick per frame."""
+import itertools
+
+import bench
+from hud import PitchYawHUD
+
+
+def _bench_update(benchmark, scene, use_tapes):
+    hud = PitchYawHUD(width=scene.width, height=scene.height, use_tapes=use_tapes)
+    img = scene.frame(0)
+    angles = itertools.count()
+
+    def step():
+        i = next(angles)
+        return hud.update(img, (i * 3) % 360 - 180, i * 7)
+
+    benchmark(step)
+
+
+def bench_update_draw(benchmark, scene):
+    _bench_update(benchmark, scene, use_tapes=False)
+
+
+def bench_update_tapes(benchmark, scene):
+    _bench_update(benchmark, scene, use_tapes=True)
+
+
+if __name__ == "__main__":
+    bench.main([bench.hud])
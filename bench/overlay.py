@@ -0,0 +1,76 @@
+"""Compare batched drawing of flow results against drawing point by point."""
+import cv2
+import numpy as np
+
+import bench
+from hud import PitchYawHUD
+from optical_flow import MotionAnalyzer
+from overlay import FlowRenderer
+
+
+def _result(scene):
+    analyzer = MotionAnalyzer()
+    analyzer.process(scene.frame(0))
+    return analyzer.process(scene.frame(1))
+
+
+def draw_flow_loop(frame_vis, result):
+    """The former per-point drawing loop, kept as the baseline."""
+    for i, (new, old) in enumerate(zip(result.points, result.prev_points)):
+        a, b = new.ravel()
+        c, d = old.ravel()
+        color = (0, 0, 255) if result.outliers[i] else (0, 255, 0)
+        cv2.line(frame_vis, (int(c), int(d)), (int(a), int(b)), color, 2)
+        cv2.circle(frame_vis, (int(a), int(b)), 3, color, -1)
+    return frame_vis
+
+
+def bench_draw_flow_loop(benchmark, scene):
+    frame, result = scene.frame(1), _result(scene)
+    out = np.empty_like(frame)
+
+    def step():
+        np.copyto(out, frame)
+        return draw_flow_loop(out, result)
+
+    benchmark(step)
+
+
+def bench_draw_flow_batched(benchmark, scene):
+    frame, result = scene.frame(1), _result(scene)
+    out = np.empty_like(frame)
+    renderer = FlowRenderer()
+    benchmark(renderer.render, frame, result, out=out)
+
+
+def bench_draw_flow_every_3(benchmark, scene):
+    # Mean cost per frame when only every third frame is drawn
+    frame, result = scene.frame(1), _result(scene)
+    out = np.empty_like(frame)
+    renderer = FlowRenderer(every=3)
+    benchmark(renderer.render, frame, result, out=out)
+
+
+def bench_draw_flow_with_hud(benchmark, scene):
+    frame, result = scene.frame(1), _result(scene)
+    out = np.empty_like(frame)
+    renderer = FlowRenderer()
+    hud = PitchYawHUD(width=scene.width, height=scene.height)
+
+    def step():
+        renderer.render(frame, result, out=out)
+        return hud.update(out, 5, 40)
+
+    benchmark(step)
+
+
+def accuracy_draw_flow(scene):
+    """Share of pixels where the batched drawing differs from the per-point loop."""
+    frame, result = scene.frame(1), _result(scene)
+    expected = draw_flow_loop(frame.copy(), result)
+    drawn = FlowRenderer().render(frame, result)
+    return {'pixels_differing': float(np.any(expected != drawn, axis=2).mean())}
+
+
+if __name__ == "__main__":
+    bench.main([bench.overlay])
@@ -0,0 +1,146 @@
+"""Synthetic video with known camera motion and independently moving objects."""
+import numpy as np
+import cv2
+
+
+class SyntheticScene:
+    """
+    Textured scene seen by a camera that translates and rotates at a
+    constant rate, with rectangular textured objects moving on their own.
+
+    Frame i is fully determined by the constructor arguments, so the same
+    scene can be regenerated anywhere.
+
+    Args:
+        width: frame width in pixels
+        height: frame height in pixels
+        camera_shift: (dx, dy) camera translation per frame, in pixels
+        camera_rotation: camera rotation per frame, in degrees
+        objects: number of independently moving objects
+        object_size: (width, height) of each object in pixels
+        object_speed: maximum object speed in pixels per frame
+        seed: random seed for the textures and object motion
+    """
+
+    def __init__(self, width=640, height=480, camera_shift=(2.0, 1.0), camera_rotation=0.0,
+                 objects=3, object_size=(60, 40), object_speed=6.0, seed=0):
+        self.params = dict(width=width, height=height, camera_shift=camera_shift,
+                           camera_rotation=camera_rotation, objects=objects, object_size=object_size,
+                           object_speed=object_speed, seed=seed)
+        self.width = width
+        self.height = height
+        self.camera_shift = np.asarray(camera_shift, dtype=np.float64)
+        self.camera_rotation = camera_rotation
+        self.object_size = object_size
+
+        rng = np.random.default_rng(seed)
+
+        # Background world, large enough for long camera paths
+        world_size = (height * 3, width * 3)
+        self.world = texture(rng, world_size)
+        self.world_center = np.array([world_size[1] / 2, world_size[0] / 2])
+        self.frame_center = np.array([width / 2, height / 2])
+
+        # Objects bounce around inside the frame
+        ow, oh = object_size
+        self.object_textures = [texture(rng, (oh, ow), brightness=(0, 255)) for _ in range(objects)]
+        self.object_start = rng.uniform((0, 0), (width - ow, height - oh), size=(objects, 2))
+        speed = rng.uniform(object_speed / 2, object_speed, size=objects)
+        angle = rng.uniform(0, 2 * np.pi, size=objects)
+        self.object_velocity = np.stack([np.cos(angle), np.sin(angle)], axis=1) * speed[:, None]
+
+    def with_camera(self, shift=(0.0, 0.0), rotation=0.0):
+        """The same world and objects seen by a camera moving differently."""
+        return SyntheticScene(**dict(self.params, camera_shift=shift, camera_rotation=rotation))
+
+    def camera_matrix(self, i):
+        """Affine 2x3 matrix mapping world coordinates to frame i coordinates."""
+        angle = np.deg2rad(self.camera_rotation * i)
+        c, s = np.cos(angle), np.sin(angle)
+        rotation = np.array([[c, s], [-s, c]])
+        origin = self.world_center + self.camera_shift * i
+        translation = self.frame_center - rotation @ origin
+        return np.hstack([rotation, translation[:, None]])
+
+    def object_positions(self, i):
+        """Top-left corners of the objects in frame i, shape (objects, 2)."""
+        ow, oh = self.object_size
+        limits = np.array([self.width - ow, self.height - oh], dtype=np.float64)
+
+        # Reflect the straight-line path back into [0, limit]
+        pos = self.object_start + self.object_velocity * i
+        pos = np.mod(pos, 2 * limits)
+        return np.where(pos > limits, 2 * limits - pos, pos)
+
+    def object_boxes(self, i):
+        """Integer (x, y, w, h) boxes of the objects in frame i."""
+        ow, oh = self.object_size
+        return [(int(x), int(y), ow, oh) for x, y in self.object_positions(i)]
+
+    def frame(self, i):
+        """Render frame i as a BGR uint8 image."""
+        img = cv2.warpAffine(self.world, self.camera_matrix(i), (self.width, self.height),
+                             flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+        for (x, y, w, h), tex in zip(self.object_boxes(i), self.object_textures):
+            img[y:y + h, x:x + w] = tex
+        return img
+
+    def frames(self, count, start=0):
+        return [self.frame(i) for i in range(start, start + count)]
+
+    def camera_flow(self, points, i):
+        """
+        Where points of frame i - 1 move to in frame i if they belong to the
+        background.
+        """
+        prev = self.camera_matrix(i - 1)
+        curr = self.camera_matrix(i)
+
+        # Frame i - 1 -> world -> frame i
+        xy = points.reshape(-1, 2).astype(np.float64)
+        world = (xy - prev[:, 2]) @ np.linalg.inv(prev[:, :2]).T
+        return world @ curr[:, :2].T + curr[:, 2]
+
+    def camera_motion(self, i):
+        """Displacement of the frame center between frame i - 1 and frame i."""
+        return self.camera_flow(self.frame_center, i)[0] - self.frame_center
+
+    def on_objects(self, points, i, margin=2):
+        """
+        Boolean mask of the points (in frame i coordinates) that lie on a
+        moving object, with margin pixels of tolerance inside the edges.
+        """
+        xy = points.reshape(-1, 2)
+        inside = np.zeros(len(xy), dtype=bool)
+        for x, y, w, h in self.object_boxes(i):
+            inside |= ((xy[:, 0] >= x + margin) & (xy[:, 0] < x + w - margin) &
+                       (xy[:, 1] >= y + margin) & (xy[:, 1] < y + h - margin))
+        return inside
+
+
+def texture(rng, shape, brightness=(40, 215)):
+    """Blurred random texture with enough corners to track."""
+    low, high = brightness
+    noise = rng.integers(low, high, size=(shape[0] // 4 + 1, shape[1] // 4 + 1, 3), dtype=np.uint8)
+    img = cv2.resize(noise, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return cv2.GaussianBlur(img, (3, 3), 0)
+
+
+def write_video(scene, path, count, fps=30):
+    """Write count frames of a scene to a video file (MJPG)."""
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (scene.width, scene.height))
+    if not out.isOpened():
+        raise ValueError(f"Could not open {path} for writing")
+    for i in range(count):
+        out.write(scene.frame(i))
+    out.release()
+
+
+def precision_recall(predicted, actual):
+    """Precision and recall of a boolean prediction against ground truth."""
+    true_positives = np.count_nonzero(predicted & actual)
+    predicted_positives = np.count_nonzero(predicted)
+    actual_positives = np.count_nonzero(actual)
+    precision = true_positives / predicted_positives if predicted_positives else 1.0
+    recall = true_positives / actual_positives if actual_positives else 1.0
+    return precision, recall
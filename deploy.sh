@@ -1,5 +1,12 @@
 sshpass -p Bookshelf scp -r src/ username@10.42.0.1:~/
+sshpass -p Bookshelf scp timing.py username@10.42.0.1:~/src/
+sshpass -p Bookshelf scp quality.py username@10.42.0.1:~/src/
+sshpass -p Bookshelf scp frames.py username@10.42.0.1:~/src/
+sshpass -p Bookshelf scp recording.py username@10.42.0.1:~/src/
+sshpass -p Bookshelf scp optical_flow.py objects.py shared_ring.py overlay.py username@10.42.0.1:~/src/
 
 echo "########## Starting #########"
 
-sshpass -p Bookshelf ssh username@10.42.0.1 "cd src && python3 main.py"
+# Compile once here so the first start does not pay for it; the warm-up cache
+# in ~/.cache survives deploys
+sshpass -p Bookshelf ssh username@10.42.0.1 "cd src && python3 -m compileall -q . && python3 main.py --startup-log ~/startup.jsonl"
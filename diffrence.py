@@ -1,24 +1,156 @@
 import cv2
 import numpy as np
 
-def process_video(video_path, scale_factor=0.5, min_area=500):
+from overlay import FlowRenderer
+from recording import open_capture
+from timing import NULL_TIMINGS, Timings
+
+class MotionDetector:
+    """
+    Frame differencing motion detector, with no display attached.
+
+    The whole mask pipeline (difference, threshold, dilation, contours) runs
+    on the downscaled frames. Only the resulting bounding boxes are scaled
+    back up to frame coordinates, and min_area is converted to downscaled
+    pixels. Buffers are allocated on the first frame and reused afterwards.
+
+    Args:
+        scale_factor: Factor to downscale the frames
+        min_area: Minimum motion area, in full resolution pixels
+        threshold: Minimum grayscale difference for a pixel to count as changed
+        interpolation: cv2 interpolation used to downscale. INTER_AREA
+            averages away noise at very small scale factors but costs more.
+        timings: Timings collecting per-stage latencies
+    """
+
+    def __init__(self, scale_factor=0.5, min_area=500, threshold=50,
+                 interpolation=cv2.INTER_LINEAR, timings=None):
+        self.scale_factor = scale_factor
+        self.min_area = min_area
+        self.threshold = threshold
+        self.interpolation = interpolation
+        self.timings = timings or NULL_TIMINGS
+
+        # Dilation kernel, built once
+        self.kernel = np.ones((3,3), np.uint8)
+
+        self.frame_size = None
+        self.prev_small = None
+
+    def allocate(self, frame_width, frame_height):
+        """Set up the downscaled geometry and buffers for a frame size."""
+        small_width = max(1, int(round(frame_width * self.scale_factor)))
+        small_height = max(1, int(round(frame_height * self.scale_factor)))
+
+        self.frame_size = (frame_width, frame_height)
+        self.small_size = (small_width, small_height)
+
+        # Scale from downscaled pixels back to frame pixels, per axis
+        self.scale_x = frame_width / small_width
+        self.scale_y = frame_height / small_height
+        self.min_area_small = self.min_area / (self.scale_x * self.scale_y)
+
+        self.gray = np.empty((frame_height, frame_width), dtype=np.uint8)
+        self.small = [np.empty((small_height, small_width), dtype=np.uint8) for _ in range(2)]
+        self.diff = np.empty((small_height, small_width), dtype=np.uint8)
+        self.mask = np.empty((small_height, small_width), dtype=np.uint8)
+        self.dilated = np.empty((small_height, small_width), dtype=np.uint8)
+        self.current = 0
+        self.prev_small = None
+
+    def process(self, frame):
+        """
+        Detect motion between the previous frame and this one.
+        Returns a list of (x, y, w, h) boxes, or None for the first frame.
+        """
+        frame_height, frame_width = frame.shape[:2]
+        if self.frame_size != (frame_width, frame_height):
+            self.allocate(frame_width, frame_height)
+        timings = self.timings
+
+        with timings.stage('downscale'):
+            # Convert to grayscale
+            if len(frame.shape) == 3:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+            else:
+                np.copyto(self.gray, frame)
+
+            # Downscale into the buffer not holding the previous frame
+            curr_small = self.small[self.current]
+            cv2.resize(self.gray, self.small_size, dst=curr_small, interpolation=self.interpolation)
+
+        if self.prev_small is None:
+            self.prev_small = curr_small
+            self.current = 1 - self.current
+            return None
+
+        with timings.stage('diff'):
+            # Calculate absolute difference
+            cv2.absdiff(curr_small, self.prev_small, dst=self.diff)
+
+            # Apply threshold to difference
+            cv2.threshold(self.diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self.mask)
+
+            # Dilate to fill in holes
+            cv2.dilate(self.mask, self.kernel, dst=self.dilated, iterations=2)
+
+        with timings.stage('regions'):
+            # Outer contours of the motion regions. On mostly empty masks this is
+            # several times cheaper than connectedComponentsWithStats, which
+            # has to write a label for every pixel.
+            contours, _ = cv2.findContours(self.dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+            # Keep motion areas that are large enough
+            rects = [cv2.boundingRect(contour) for contour in contours
+                     if cv2.contourArea(contour) > self.min_area_small]
+            boxes = self.scale_boxes(np.array(rects, dtype=np.int64).reshape(-1, 4))
+
+        # Update previous frame
+        self.prev_small = curr_small
+        self.current = 1 - self.current
+
+        return boxes
+
+    def scale_boxes(self, boxes):
+        """Scale downscaled (x, y, w, h) boxes out to frame coordinates."""
+        frame_width, frame_height = self.frame_size
+        x0 = np.floor(boxes[:, 0] * self.scale_x).astype(int)
+        y0 = np.floor(boxes[:, 1] * self.scale_y).astype(int)
+        x1 = np.minimum(np.ceil((boxes[:, 0] + boxes[:, 2]) * self.scale_x).astype(int), frame_width)
+        y1 = np.minimum(np.ceil((boxes[:, 1] + boxes[:, 3]) * self.scale_y).astype(int), frame_height)
+        return list(zip(x0.tolist(), y0.tolist(), (x1 - x0).tolist(), (y1 - y0).tolist()))
+
+# Shared by draw_boxes; draws every frame
+BOX_RENDERER = FlowRenderer()
+
+def draw_boxes(frame, boxes, color=(0, 255, 0)):
+    """
+    Draw motion boxes onto the frame in place, in one batch.
+    """
+    return BOX_RENDERER.draw_boxes(frame, boxes, color)
+
+def process_video(video_path, scale_factor=0.5, min_area=500, timings=None, draw_every=1):
     """
     Process video for motion detection.
     
     Args:
-        video_path: Path to input video
+        video_path: Path to input video or recording
         output_path: Path to save processed video
         scale_factor: Factor to downscale the frames
         min_area: Minimum contour area to be considered as motion
+        timings: Timings collecting per-stage latencies, reported at the end
+        draw_every: Draw and display every Nth frame only; detection still
+            runs on every frame
     """
+    timings = timings or NULL_TIMINGS
+    renderer = FlowRenderer(every=draw_every)
+
     # Open video
-    cap = cv2.VideoCapture(video_path)
+    cap = open_capture(video_path, realtime=True)
     if not cap.isOpened():
         raise ValueError("Error opening video file")
     
     # Get video properties
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     
     # Create video writer
@@ -31,63 +163,47 @@ def process_video(video_path, scale_factor=0.5, min_area=500):
         raise ValueError("Error reading first frame")
     
     # Process first frame
-    prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-    prev_small = cv2.resize(prev_gray, None, fx=scale_factor, fy=scale_factor)
+    detector = MotionDetector(scale_factor, min_area, timings=timings)
+    detector.process(prev_frame)
     
     while True:
         # Read current frame
-        ret, curr_frame = cap.read()
+        with timings.stage('capture'):
+            ret, curr_frame = cap.read()
         if not ret:
             break
-            
-        # Convert to grayscale
-        curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY)
-        
-        # Downscale
-        curr_small = cv2.resize(curr_gray, None, fx=scale_factor, fy=scale_factor)
-        
-        # Calculate absolute difference
-        frame_diff = cv2.absdiff(curr_small, prev_small)
-        
-        # Apply threshold to difference
-        _, thresh = cv2.threshold(frame_diff, 50, 255, cv2.THRESH_BINARY)
-        
-        # Dilate to fill in holes
-        kernel = np.ones((3,3), np.uint8)
-        dilated = cv2.dilate(thresh, kernel, iterations=2)
-        
-        # Scale back up to original size
-        motion_mask = cv2.resize(dilated, (frame_width, frame_height))
-        
-        # Find contours
-        contours, _ = cv2.findContours(motion_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
+
+        boxes = detector.process(curr_frame)
+
         # Draw motion areas on original frame
-        for contour in contours:
-            if cv2.contourArea(contour) > min_area:
-                x, y, w, h = cv2.boundingRect(contour)
-                cv2.rectangle(curr_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-        
-        # Write frame to output video
-        cv2.imshow("e",curr_frame)
+        with timings.stage('draw'):
+            frame_vis = renderer.render(curr_frame, boxes=boxes, out=curr_frame)
 
+        if frame_vis is not None:
+            # Write frame to output video
+            with timings.stage('display'):
+                cv2.imshow("e", frame_vis)
+                key = cv2.waitKey(30)
 
-        # Exit if 'q' is pressed
-        if cv2.waitKey(30) & 0xFF == ord('q'):
-            break
+            # Exit if 'q' is pressed
+            if key & 0xFF == ord('q'):
+                break
 
-        # Update previous frame
-        prev_small = curr_small
+        timings.tick()
         
     # Release resources
     cap.release()
     cv2.destroyAllWindows()
 
+    if timings.enabled:
+        print(timings.format_report())
+        timings.dump()
+
 def main():
     # Example usage
     input_video = 0
     try:
-        process_video(input_video)
+        process_video(input_video, timings=Timings())
         print("Motion detection completed successfully")
     except Exception as e:
         print(f"Error processing video: {str(e)}")
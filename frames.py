@@ -0,0 +1,138 @@
+"""
+Preallocated frame buffers.
+
+A FramePool hands out arrays from fixed rings, one ring per (shape, dtype),
+so a loop that captures, converts and draws frames reuses the same few
+buffers instead of allocating new ones every iteration:
+
+    pool = FramePool()
+    reader = FrameReader(cap, pool)
+    while True:
+        frame = reader.read()                           # owned by the caller
+        small = pool.acquire((h, w, 3))
+        cv2.resize(frame, (w, h), dst=small)
+        pool.release(frame)
+        ...
+        pool.release(small)
+
+Ownership is explicit: whoever acquired a buffer releases it when done, and
+must not touch it afterwards. Releasing an array that does not belong to the
+pool is a no-op, so code can release whatever it was handed.
+"""
+import threading
+
+import numpy as np
+
+
+class FramePool:
+    """
+    Rings of preallocated arrays, one per shape and dtype.
+
+    A ring is allocated the first time its shape is asked for. When every
+    buffer of a ring is in use, the ring grows by one buffer and `grown`
+    is incremented; in a loop with balanced acquire/release this only
+    happens while warming up.
+
+    Args:
+        count: Buffers allocated per ring
+    """
+
+    def __init__(self, count=4):
+        self.count = count
+        self.lock = threading.Lock()
+        self.rings = {}
+        self.owner = {}
+        self.in_use = set()
+        self.grown = 0
+
+    def _allocate(self, key):
+        buf = np.empty(key[0], dtype=key[1])
+        self.owner[id(buf)] = (key, buf)
+        return buf
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Take a free buffer of the given shape and dtype. Its contents are undefined."""
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            free = self.rings.get(key)
+            if free is None:
+                free = self.rings[key] = [self._allocate(key) for _ in range(self.count)]
+            if free:
+                buf = free.pop()
+            else:
+                buf = self._allocate(key)
+                self.grown += 1
+            self.in_use.add(id(buf))
+        return buf
+
+    def release(self, buf):
+        """Give a buffer back to its ring. Arrays not from this pool are ignored."""
+        if buf is None:
+            return
+        with self.lock:
+            if id(buf) not in self.in_use:
+                return
+            key, owned = self.owner[id(buf)]
+            if owned is not buf:
+                return
+            self.in_use.discard(id(buf))
+            self.rings[key].append(buf)
+
+    def owns(self, buf):
+        return id(buf) in self.owner and self.owner[id(buf)][1] is buf
+
+    def stats(self):
+        with self.lock:
+            return {
+                'rings': len(self.rings),
+                'buffers': len(self.owner),
+                'in_use': len(self.in_use),
+                'grown': self.grown,
+            }
+
+
+class FrameReader:
+    """
+    Read frames from a capture into buffers taken from a FramePool.
+
+    The first frame is read normally to learn the capture's frame shape;
+    later frames are decoded straight into pool buffers with
+    cap.read(image=...). Frames returned by read() belong to the caller,
+    who releases them to the pool.
+
+    Captures with a true `zero_copy` attribute, like recording.FrameReplay,
+    already hand out frames without decoding them; their frames are
+    returned as they are instead of being copied into a pool buffer.
+    Releasing them to the pool is a no-op.
+
+    Args:
+        cap: cv2.VideoCapture, or anything with a compatible read()
+        pool: FramePool the frames are taken from
+    """
+
+    def __init__(self, cap, pool):
+        self.cap = cap
+        self.pool = pool
+        self.shape = None
+        self.zero_copy = getattr(cap, 'zero_copy', False)
+
+    def read(self):
+        """Return the next frame, or None when the capture has no frame."""
+        if self.shape is None or self.zero_copy:
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+            self.shape = frame.shape
+            return frame
+
+        buf = self.pool.acquire(self.shape)
+        ret, frame = self.cap.read(image=buf)
+        if not ret:
+            self.pool.release(buf)
+            return None
+
+        if frame is not buf:
+            # The capture changed resolution and allocated a new frame
+            self.pool.release(buf)
+            self.shape = frame.shape
+        return frame
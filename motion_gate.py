@@ -0,0 +1,239 @@
+"""
+Motion-gated optical flow.
+
+The downscaled frame differencing detector from diffrence.py is cheap
+compared to pyramidal LK on a full point budget. It runs first on every
+frame, and the fraction of changed pixels decides how much tracking that
+frame gets:
+
+    skip     almost nothing changed: no LK at all, points keep their positions
+    regions  a few movers: only points in and around the motion boxes, plus a
+             thin background sample for the camera motion estimate
+    full     the scene is busy (or the camera moves): the normal analysis
+
+Every refresh_interval frames a full pass runs regardless, so the feature
+grid is replenished and the camera motion estimate stays valid.
+
+Example:
+    python motion_gate.py recording.mp4
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from diffrence import MotionDetector, draw_boxes
+from optical_flow import MotionAnalyzer, draw_flow
+from recording import open_capture, parse_source
+from timing import NULL_TIMINGS, Timings
+
+MODES = ('skip', 'regions', 'full')
+
+
+class GatedMotionAnalyzer:
+    """
+    Run MotionAnalyzer only as much as the frame differencing result asks for.
+
+    Args:
+        analyzer: MotionAnalyzer to gate, created with defaults if None
+        detector: MotionDetector used as the gate, created with defaults if None
+        refresh_interval: Force a full pass at least every this many frames
+        still_fraction: Below this fraction of changed pixels, skip tracking
+        busy_fraction: At or above this fraction, run the full analysis
+        reduced_points: Maximum number of points tracked in regions mode
+        region_margin: Pixels added around each motion box when selecting points
+        background_points: Points kept outside the motion boxes in regions mode
+        timings: Timings collecting per-stage latencies
+    """
+
+    def __init__(self, analyzer=None, detector=None, refresh_interval=15,
+                 still_fraction=0.002, busy_fraction=0.05, reduced_points=300,
+                 region_margin=20, background_points=60, timings=None):
+        self.timings = timings or NULL_TIMINGS
+        self.analyzer = analyzer or MotionAnalyzer(timings=self.timings)
+        self.detector = detector or MotionDetector(timings=self.timings)
+        self.refresh_interval = refresh_interval
+        self.still_fraction = still_fraction
+        self.busy_fraction = busy_fraction
+        self.reduced_points = reduced_points
+        self.region_margin = region_margin
+        self.background_points = background_points
+
+        self.since_full = 0
+        self.boxes = []
+        self.motion_fraction = 0.0
+
+        # Compute-saved statistics
+        self.mode_counts = dict.fromkeys(MODES, 0)
+        self.points_available = 0
+        self.points_tracked = 0
+
+    def motion_level(self):
+        """Fraction of changed pixels in the detector's last mask."""
+        mask = self.detector.dilated
+        return cv2.countNonZero(mask) / mask.size
+
+    def choose_mode(self):
+        if self.since_full >= self.refresh_interval:
+            return 'full'
+        if self.motion_fraction >= self.busy_fraction:
+            return 'full'
+        if self.motion_fraction < self.still_fraction and not self.boxes:
+            return 'skip'
+        return 'regions'
+
+    def select_regions(self, points):
+        """Mask of the points near a motion box plus a strided background sample."""
+        xy = points.reshape(-1, 2)
+        near = np.zeros(len(xy), dtype=bool)
+        m = self.region_margin
+        for x, y, w, h in self.boxes:
+            near |= ((xy[:, 0] >= x - m) & (xy[:, 0] < x + w + m) &
+                     (xy[:, 1] >= y - m) & (xy[:, 1] < y + h + m))
+
+        # Points in the regions first, up to the budget
+        budget = self.reduced_points
+        near_budget = max(0, budget - self.background_points)
+        near_idx = np.flatnonzero(near)
+        if len(near_idx) > near_budget:
+            near_idx = near_idx[np.linspace(0, len(near_idx) - 1, near_budget).astype(int)]
+
+        # A spread-out sample of the rest, so the camera motion still has a reference
+        background_idx = np.flatnonzero(~near)
+        count = min(len(background_idx), budget - len(near_idx))
+        if count > 0:
+            background_idx = background_idx[np.linspace(0, len(background_idx) - 1, count).astype(int)]
+        else:
+            background_idx = background_idx[:0]
+
+        selected = np.zeros(len(xy), dtype=bool)
+        selected[near_idx] = True
+        selected[background_idx] = True
+        return selected
+
+    def process(self, frame):
+        """
+        Analyze the next frame.
+
+        Returns:
+            (flow_result, boxes, mode) where flow_result is a FlowResult or
+            None when tracking was skipped or for the first frame, boxes are
+            the motion detector's (x, y, w, h) boxes and mode is one of MODES.
+        """
+        boxes = self.detector.process(frame)
+        if boxes is None:
+            # First frame: nothing to compare against yet
+            self.analyzer.process(frame)
+            self.since_full = 0
+            self.mode_counts['full'] += 1
+            return None, [], 'full'
+
+        self.boxes = boxes
+        self.motion_fraction = self.motion_level()
+        mode = self.choose_mode()
+        self.mode_counts[mode] += 1
+
+        available = len(self.analyzer.points) if self.analyzer.points is not None else 0
+        if mode == 'skip':
+            self.analyzer.skip(frame)
+            result = None
+            tracked = 0
+        elif mode == 'regions':
+            result = self.analyzer.process(frame, select=self.select_regions, replenish=False)
+            tracked = len(result.prev_points) if result is not None else 0
+        else:
+            result = self.analyzer.process(frame)
+            tracked = len(result.prev_points) if result is not None else 0
+            self.since_full = 0
+
+        if mode != 'full':
+            self.since_full += 1
+        self.points_available += available
+        self.points_tracked += tracked
+
+        return result, boxes, mode
+
+    def stats(self):
+        """Frames per mode and the share of point tracking that was avoided."""
+        frames = sum(self.mode_counts.values())
+        saved = 1.0 - self.points_tracked / self.points_available if self.points_available else 0.0
+        return {
+            'frames': frames,
+            'modes': dict(self.mode_counts),
+            'points_available': self.points_available,
+            'points_tracked': self.points_tracked,
+            'points_saved': saved,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        modes = ", ".join(f"{mode} {count}" for mode, count in s['modes'].items())
+        return (f"{s['frames']} frames ({modes}), tracked {s['points_tracked']} of "
+                f"{s['points_available']} points ({s['points_saved'] * 100:.0f}% saved)")
+
+
+def analyze_gated(video_path, timings=None, **options):
+    """
+    Display motion-gated analysis of a video.
+
+    Args:
+        video_path: Path to input video or recording, or camera index
+        timings: Timings collecting per-stage latencies
+        options: GatedMotionAnalyzer arguments
+    """
+    timings = timings or NULL_TIMINGS
+    cap = open_capture(video_path, realtime=True)
+    if not cap.isOpened():
+        print("Error opening video file")
+        return
+
+    gated = GatedMotionAnalyzer(timings=timings, **options)
+    colors = {'skip': (128, 128, 128), 'regions': (0, 255, 255), 'full': (0, 255, 0)}
+
+    while True:
+        with timings.stage('capture'):
+            ret, frame = cap.read()
+        if not ret:
+            break
+
+        result, boxes, mode = gated.process(frame)
+
+        with timings.stage('draw'):
+            frame_vis = draw_flow(frame, result) if result is not None else frame.copy()
+            draw_boxes(frame_vis, boxes)
+            cv2.putText(frame_vis, mode, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, colors[mode], 2)
+
+        with timings.stage('display'):
+            cv2.imshow('Gated Motion Analysis', frame_vis)
+            key = cv2.waitKey(1) & 0xFF
+        timings.tick()
+        if key == ord('q'):
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+    print(gated.format_stats())
+    if timings.enabled:
+        print(timings.format_report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motion-gated optical flow analysis")
+    parser.add_argument('video', nargs='?', default=0, help="input video file or recording (default: camera 0)")
+    parser.add_argument('--refresh-interval', type=int, default=15, help="frames between forced full passes")
+    parser.add_argument('--still-fraction', type=float, default=0.002, help="changed pixel fraction below which tracking is skipped")
+    parser.add_argument('--busy-fraction', type=float, default=0.05, help="changed pixel fraction from which all points are tracked")
+    parser.add_argument('--reduced-points', type=int, default=300, help="point budget around motion regions")
+    parser.add_argument('--region-margin', type=int, default=20, help="pixels around each motion box")
+    args = parser.parse_args()
+
+    analyze_gated(
+        parse_source(args.video), timings=Timings(),
+        refresh_interval=args.refresh_interval, still_fraction=args.still_fraction,
+        busy_fraction=args.busy_fraction, reduced_points=args.reduced_points,
+        region_margin=args.region_margin,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Group outlier points into moving objects and follow them across frames.
+
+Clustering hashes every outlier point into a uniform grid of cell_size
+pixels. Occupied cells that touch (8-connectivity) form one cluster, found
+with cv2.connectedComponents on the small cell grid, so the cost grows
+with the number of points and the grid size instead of with the number of
+point pairs.
+
+    tracker = ObjectTracker()
+    for frame in frames:
+        result = analyzer.process(frame)
+        if result is not None:
+            for obj in tracker.update(result, frame.shape):
+                print(obj.track_id, obj.bbox, obj.flow)
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# A cluster of outlier points in one frame. bbox is (x, y, w, h), flow is
+# the mean motion of the points after removing the camera motion and count
+# is the number of points.
+Cluster = namedtuple('Cluster', ['bbox', 'centroid', 'flow', 'count'])
+
+# A cluster matched to a track that persists across frames
+TrackedObject = namedtuple('TrackedObject', ['track_id', 'bbox', 'centroid', 'flow', 'count', 'age'])
+
+
+def cluster_points(points, flow, cell_size=24, min_points=3, shape=None):
+    """
+    Cluster points with a uniform grid hash.
+
+    Args:
+        points: (N, 2) point positions
+        flow: (N, 2) residual flow of each point
+        cell_size: Grid cell size in pixels; points in touching cells are
+            joined, so clusters merge across gaps up to about one cell
+        min_points: Clusters with fewer points are dropped as noise
+        shape: Frame shape; points outside the frame are dropped. The grid
+            spans the points, so without it one stray point tracked far
+            off the frame makes the grid as large as its distance.
+
+    Returns:
+        List of Cluster, largest first
+    """
+    xy = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    flow = np.asarray(flow, dtype=np.float32).reshape(-1, 2)
+    if shape is not None:
+        h, w = shape[:2]
+        inside = (xy[:, 0] >= 0) & (xy[:, 0] < w) & (xy[:, 1] >= 0) & (xy[:, 1] < h)
+        xy, flow = xy[inside], flow[inside]
+    if len(xy) < min_points:
+        return []
+
+    # Hash the points into cells of a grid covering their extent
+    origin = xy.min(axis=0)
+    cells = ((xy - origin) // cell_size).astype(np.intp)
+    cols, rows = cells.max(axis=0) + 1
+    grid = np.zeros((rows, cols), dtype=np.uint8)
+    grid[cells[:, 1], cells[:, 0]] = 1
+
+    count, labels = cv2.connectedComponents(grid, connectivity=8)
+    point_labels = labels[cells[:, 1], cells[:, 0]] - 1
+
+    # Per-cluster sums and extents in one pass over the sorted points
+    sizes = np.bincount(point_labels, minlength=count - 1)
+    order = np.argsort(point_labels, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    sorted_xy = xy[order]
+    low = np.minimum.reduceat(sorted_xy, starts, axis=0)
+    high = np.maximum.reduceat(sorted_xy, starts, axis=0)
+    centroids = np.add.reduceat(sorted_xy, starts, axis=0) / sizes[:, None]
+    flows = np.add.reduceat(flow[order], starts, axis=0) / sizes[:, None]
+
+    clusters = []
+    for i in np.argsort(-sizes, kind='stable'):
+        if sizes[i] < min_points:
+            break
+        x0, y0 = low[i]
+        x1, y1 = high[i]
+        bbox = (int(x0), int(y0), int(np.ceil(x1 - x0)) + 1, int(np.ceil(y1 - y0)) + 1)
+        clusters.append(Cluster(bbox, centroids[i], flows[i], int(sizes[i])))
+    return clusters
+
+
+def cluster_outliers(result, cell_size=24, min_points=3, shape=None):
+    """
+    Cluster the outlier points of a FlowResult by their residual flow.
+    Pass the frame shape to leave out points tracked off the frame.
+    """
+    outliers = result.outliers
+    points = result.points.reshape(-1, 2)[outliers]
+    flow = points - result.prev_points.reshape(-1, 2)[outliers] - result.camera_motion
+    return cluster_points(points, flow, cell_size, min_points, shape)
+
+
+def box_overlaps(boxes, others):
+    """
+    Intersection over union of every (x, y, w, h) box in boxes with every
+    box in others, shape (len(boxes), len(others)).
+    """
+    a = np.asarray(boxes, dtype=np.float64).reshape(-1, 1, 4)
+    b = np.asarray(others, dtype=np.float64).reshape(1, -1, 4)
+    w = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    h = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+class Track:
+    """
+    State of one track: its predicted centroid and box in the next frame.
+    track_id stays None until the track is confirmed.
+    """
+
+    __slots__ = ('track_id', 'centroid', 'bbox', 'flow', 'age', 'missed', 'hidden')
+
+    def __init__(self, centroid, bbox, flow):
+        self.track_id = None
+        self.centroid = np.asarray(centroid, dtype=np.float64)
+        self.bbox = np.asarray(bbox, dtype=np.float64)
+        self.flow = np.asarray(flow, dtype=np.float64)
+        self.age = 0
+        self.missed = 0
+        self.hidden = 0
+
+    def coast(self):
+        """Move the prediction one frame along the last known motion."""
+        self.centroid = self.centroid + self.flow
+        self.bbox = self.bbox + (self.flow[0], self.flow[1], 0, 0)
+
+
+class ObjectTracker:
+    """
+    Give clusters persistent track IDs.
+
+    Each track predicts its next box and centroid from its last residual
+    flow. Clusters are matched one to one to the tracks, best box overlap
+    first and then nearest centroid. A cluster that does not overlap a
+    prediction is still matched within a distance gate, max_distance or
+    half the cluster's diagonal for large clusters.
+
+    Outlier clusters split and merge as objects pass each other or lose
+    points: clusters left over that overlap a matched track are fragments
+    of it and join it, and tracks hidden inside another track's cluster
+    coast along without ageing out for up to max_hidden frames, to be
+    picked up again when the objects separate. Other unmatched clusters
+    start new tracks, and tracks unmatched for more than max_missed frames,
+    not counting the hidden ones, are dropped.
+
+    A new track gets its ID and is reported once it has been matched in
+    min_hits frames in a row, so outliers that show up for a single frame,
+    like noise at the frame border, do not use up IDs.
+
+    Args:
+        cell_size: Grid cell size used to cluster outliers
+        min_points: Smallest cluster reported as an object
+        max_distance: Smallest distance gate, in pixels, for matching a
+            cluster's centroid to a track's prediction
+        max_missed: Frames a track survives without a matching cluster
+        max_hidden: Frames a track survives hidden in another track's
+            cluster before those frames count as missed too
+        min_hits: Frames a new track has to be matched in before it is reported
+    """
+
+    def __init__(self, cell_size=24, min_points=3, max_distance=40.0, max_missed=5, max_hidden=30,
+                 min_hits=2):
+        self.cell_size = cell_size
+        self.min_points = min_points
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.max_hidden = max_hidden
+        self.min_hits = min_hits
+
+        # IDs are only given to confirmed tracks; tracks are keyed by a serial number
+        self.next_id = 0
+        self.next_key = 0
+        self.tracks = {}
+
+    def update(self, result, shape=None):
+        """
+        Cluster a FlowResult's outliers and return this frame's TrackedObjects.
+        shape is the frame's shape, see cluster_points().
+        """
+        return self.associate(cluster_outliers(result, self.cell_size, self.min_points, shape))
+
+    def associate(self, clusters):
+        """
+        Match clusters to the existing tracks. Returns a TrackedObject per
+        cluster of a confirmed track.
+        """
+        keys = list(self.tracks)
+        assigned = [None] * len(clusters)
+        # Whether the cluster was matched one to one, rather than joined as a fragment
+        primary = [True] * len(clusters)
+
+        if keys and clusters:
+            boxes = np.array([c.bbox for c in clusters], dtype=np.float64)
+            predicted_boxes = np.array([self.tracks[t].bbox for t in keys])
+            overlaps = box_overlaps(boxes, predicted_boxes)
+            # Boxes grown by a cell, as clusters within a cell of each other are joined
+            pad = self.cell_size
+            near = box_overlaps(boxes, predicted_boxes + (-pad, -pad, 2 * pad, 2 * pad))
+
+            centroids = np.array([c.centroid for c in clusters])
+            predicted = np.array([self.tracks[t].centroid for t in keys])
+            distances = np.linalg.norm(centroids[:, None, :] - predicted[None, :, :], axis=2)
+            # The gate grows with the cluster and track sizes and the track's speed
+            sizes = np.maximum(np.hypot(boxes[:, 2], boxes[:, 3])[:, None],
+                               np.hypot(predicted_boxes[:, 2], predicted_boxes[:, 3])[None, :]) / 2
+            speeds = np.array([np.linalg.norm(self.tracks[t].flow) for t in keys])
+            gates = np.maximum(self.max_distance, sizes) + speeds[None, :]
+
+            # Greedy matching, best overlap first, then closest
+            candidates = (near > 0) | (distances <= gates)
+            cs, ts = np.nonzero(candidates)
+            used_tracks = set()
+            for k in np.lexsort((distances[cs, ts], -overlaps[cs, ts])):
+                c, t = int(cs[k]), int(ts[k])
+                if assigned[c] is not None or t in used_tracks:
+                    continue
+                assigned[c] = keys[t]
+                used_tracks.add(t)
+
+            # Left over clusters within a cell of a matched track are fragments of it
+            matched_tracks = sorted(used_tracks)
+            for c in range(len(clusters)):
+                if assigned[c] is None and matched_tracks:
+                    best = max(matched_tracks, key=lambda t: near[c, t])
+                    if near[c, best] > 0:
+                        assigned[c] = keys[best]
+                        primary[c] = False
+
+        objects = []
+        updated = set()
+        for cluster, key, is_primary in zip(clusters, assigned, primary):
+            if key is None:
+                key = self.next_key
+                self.next_key += 1
+                self.tracks[key] = Track(cluster.centroid, cluster.bbox, cluster.flow)
+            track = self.tracks[key]
+            if is_primary:
+                # Fragments only share the ID of the track their one to one match updates
+                track.centroid = np.asarray(cluster.centroid, dtype=np.float64)
+                track.bbox = np.asarray(cluster.bbox, dtype=np.float64)
+                track.flow = np.asarray(cluster.flow, dtype=np.float64)
+                track.age += 1
+                track.missed = 0
+                track.hidden = 0
+                updated.add(key)
+                if track.track_id is None and track.age >= self.min_hits:
+                    track.track_id = self.next_id
+                    self.next_id += 1
+            if track.track_id is not None:
+                objects.append(TrackedObject(track.track_id, cluster.bbox, cluster.centroid,
+                                             cluster.flow, cluster.count, track.age))
+
+        seen = np.array([c.bbox for c in clusters], dtype=np.float64).reshape(-1, 4)
+        for key in list(self.tracks):
+            track = self.tracks[key]
+            if key in updated:
+                track.coast()
+                continue
+            if track.track_id is None:
+                # A new track has to be matched in consecutive frames
+                del self.tracks[key]
+                continue
+            # A track merged into another one's cluster is kept while it stays
+            # hidden there, but not for good: a stale track sitting on a
+            # long-lived object would otherwise never go away
+            hidden = len(seen) and box_overlaps(track.bbox, seen).max() > 0
+            if hidden and track.hidden < self.max_hidden:
+                track.hidden += 1
+            else:
+                track.missed += 1
+            if track.missed > self.max_missed:
+                del self.tracks[key]
+            else:
+                track.coast()
+
+        return objects
+
+
+def draw_objects(frame, objects, color=(0, 0, 255)):
+    """Draw tracked objects in place: bounding box, ID and flow direction."""
+    for obj in objects:
+        x, y, w, h = obj.bbox
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        cx, cy = int(obj.centroid[0]), int(obj.centroid[1])
+        fx, fy = obj.flow * 5
+        cv2.arrowedLine(frame, (cx, cy), (int(cx + fx), int(cy + fy)), color, 2)
+        cv2.putText(frame, str(obj.track_id), (x, y - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame
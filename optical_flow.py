@@ -1,5 +1,20 @@
+import argparse
+import os
+import time
 import numpy as np
 import cv2
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from frames import FramePool, FrameReader
+from objects import ObjectTracker, draw_objects
+from overlay import FlowRenderer
+from quality import QualityController
+from recording import open_capture, parse_source
+from timing import NULL_TIMINGS, Timings
+
+# Per-frame output of MotionAnalyzer
+FlowResult = namedtuple('FlowResult', ['points', 'prev_points', 'outliers', 'camera_motion'])
 
 def detect_feature_points(frame, max_corners=1000):
     """
@@ -22,122 +37,1059 @@ def detect_feature_points(frame, max_corners=1000):
     
     return corners
 
+class FeatureManager:
+    """
+    Keep tracked points spread over a grid of cells.
+
+    Each cell has a target of max_points / cells points. When a cell drops
+    below min_points / cells, new corners are detected only inside that
+    cell's ROI, away from the points it still has, so the cost of
+    replenishing follows the number of points that were lost.
+    """
+
+    def __init__(self, grid=(8, 6), max_points=1000, min_points=600,
+                 quality_level=0.001, min_distance=10, block_size=7):
+        self.grid = grid
+        self.quality_level = quality_level
+        self.min_distance = min_distance
+        self.block_size = block_size
+        self.set_budget(max_points, min_points)
+
+        # Number of cells refilled by the last call, and in total
+        self.cells_refilled = 0
+        self.total_cells_refilled = 0
+
+    def set_budget(self, max_points, min_points):
+        """Change the number of points kept when cells are refilled."""
+        self.max_points = max_points
+        self.min_points = min_points
+
+        cells = self.grid[0] * self.grid[1]
+        self.target_per_cell = max(1, -(-max_points // cells))
+        self.min_per_cell = min(self.target_per_cell, max(1, -(-min_points // cells)))
+
+    def cell_indices(self, points, shape):
+        """Return the grid cell index of every point."""
+        h, w = shape[:2]
+        cols_n, rows_n = self.grid
+        xy = points.reshape(-1, 2)
+        cols = np.clip((xy[:, 0] * cols_n / w).astype(np.intp), 0, cols_n - 1)
+        rows = np.clip((xy[:, 1] * rows_n / h).astype(np.intp), 0, rows_n - 1)
+        return rows * cols_n + cols
+
+    def prune(self, points, shape):
+        """
+        Mask of the points to keep: inside the frame, at most target_per_cell
+        per cell and max_points in total. Points drift with the motion and pile up
+        in some cells; the ones tracked longest, first in the array, are kept.
+        """
+        h, w = shape[:2]
+        xy = points.reshape(-1, 2)
+        keep = (xy[:, 0] >= 0) & (xy[:, 0] < w) & (xy[:, 1] >= 0) & (xy[:, 1] < h)
+
+        cells = self.cell_indices(points, shape)
+        cells[~keep] = -1
+        order = np.argsort(cells, kind='stable')
+        sorted_cells = cells[order]
+        # Rank of every point within its cell, in array order
+        starts = np.searchsorted(sorted_cells, sorted_cells, side='left')
+        rank = np.empty(len(xy), dtype=np.intp)
+        rank[order] = np.arange(len(xy)) - starts
+        keep &= rank < self.target_per_cell
+        # target_per_cell rounds up, so full cells can add up to a little over max_points
+        keep[np.flatnonzero(keep)[self.max_points:]] = False
+        return keep
+
+    def replenish(self, gray, points):
+        """
+        Top up cells that are running low on points.
+        Returns the existing points followed by the new ones, shape (N, 1, 2).
+        """
+        if points is None:
+            points = np.empty((0, 1, 2), dtype=np.float32)
+
+        h, w = gray.shape[:2]
+        cols_n, rows_n = self.grid
+
+        cells = self.cell_indices(points, gray.shape)
+        counts = np.bincount(cells, minlength=cols_n * rows_n)
+        low_cells = np.flatnonzero(counts < self.min_per_cell)
+
+        self.cells_refilled = len(low_cells)
+        self.total_cells_refilled += len(low_cells)
+        if len(low_cells) == 0:
+            return points
+
+        xy = points.reshape(-1, 2)
+        found = [points.astype(np.float32, copy=False)]
+        for cell in low_cells:
+            row, col = divmod(int(cell), cols_n)
+            x0, x1 = col * w // cols_n, (col + 1) * w // cols_n
+            y0, y1 = row * h // rows_n, (row + 1) * h // rows_n
+
+            # Keep new corners away from the points the cell still has
+            mask = None
+            existing = xy[cells == cell]
+            if len(existing):
+                mask = np.full((y1 - y0, x1 - x0), 255, dtype=np.uint8)
+                for x, y in existing:
+                    cv2.circle(mask, (int(x) - x0, int(y) - y0), self.min_distance, 0, -1)
+
+            corners = cv2.goodFeaturesToTrack(
+                gray[y0:y1, x0:x1],
+                maxCorners=int(self.target_per_cell - counts[cell]),
+                qualityLevel=self.quality_level,
+                minDistance=self.min_distance,
+                mask=mask,
+                blockSize=self.block_size
+            )
+            if corners is not None:
+                corners += (x0, y0)
+                found.append(corners)
+
+        return np.concatenate(found)
+
+class FlowTracker:
+    """
+    Lucas-Kanade tracker that carries the previous frame between calls.
+
+    Each frame is converted to grayscale once, when it is pushed, and reused
+    as the "prev" side of the next tracking step. Grayscale images are
+    written into two preallocated buffers used in turn, so the previous
+    frame never has to be copied.
+
+    The pyramids themselves are rebuilt by calcOpticalFlowPyrLK: the Python
+    bindings only accept single images, not the level lists returned by
+    cv2.buildOpticalFlowPyramid.
+
+    This is the sparse flow backend. Dense backends subclass it and set
+    `dense`, see DenseFlowTracker.
+    """
+
+    dense = False
+
+    def __init__(self, win_size=(15, 15), max_level=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)):
+        self.win_size = win_size
+        self.max_level = max_level
+        self.criteria = criteria
+
+        # Ping-pong grayscale buffers
+        self.gray_buffers = [None, None]
+        self.current = 1
+        self.frames = 0
+
+    @property
+    def curr_gray(self):
+        """Grayscale image of the most recently pushed frame."""
+        return self.gray_buffers[self.current]
+
+    @property
+    def prev_gray(self):
+        """Grayscale image of the frame pushed before the most recent one."""
+        return self.gray_buffers[1 - self.current]
+
+    def reset(self):
+        self.frames = 0
+
+    def set_iterations(self, iterations):
+        """Change the maximum number of LK iterations per pyramid level."""
+        criteria_type, _, epsilon = self.criteria
+        self.criteria = (criteria_type, iterations, epsilon)
+
+    def push(self, frame):
+        """
+        Convert a new frame to grayscale.
+        The previously pushed frame becomes the "prev" side of track().
+        """
+        self.current = 1 - self.current
+
+        gray = self.gray_buffers[self.current]
+        if gray is None or gray.shape != frame.shape[:2]:
+            gray = np.empty(frame.shape[:2], dtype=np.uint8)
+            self.gray_buffers[self.current] = gray
+
+        # Convert frame to grayscale if it's not already
+        if len(frame.shape) == 3:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        else:
+            np.copyto(gray, frame)
+
+        self.frames += 1
+
+        return gray
+
+    def track(self, prev_points, initial_points=None, max_level=None, iterations=None,
+              return_status=False):
+        """
+        Track points from the previous frame into the most recent one.
+        Returns the matched (new, old) points, like calculate_optical_flow.
+        With return_status, the per-point found mask and the LK match error
+        (mean absolute patch difference) of the matched points follow.
+
+        Args:
+            prev_points: (N, 1, 2) points in the previous frame
+            initial_points: Predicted positions in the current frame to start
+                the search from, instead of the points' previous positions
+            max_level, iterations: Override the tracker's settings for this call
+        """
+        if self.frames < 2:
+            raise ValueError("FlowTracker needs two frames before tracking")
+
+        criteria = self.criteria
+        if iterations is not None:
+            criteria = (criteria[0], iterations, criteria[2])
+
+        flags = 0
+        if initial_points is not None:
+            # LK writes its result into nextPts, keep the caller's predictions
+            initial_points = initial_points.astype(np.float32, copy=True)
+            flags = cv2.OPTFLOW_USE_INITIAL_FLOW
+
+        # Calculate optical flow using Lucas-Kanade method
+        curr_points, status, error = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray,
+            self.curr_gray,
+            prev_points,
+            initial_points,
+            winSize=self.win_size,
+            maxLevel=self.max_level if max_level is None else max_level,
+            criteria=criteria,
+            flags=flags
+        )
+
+        # Filter out points where flow wasn't found
+        found = status.ravel() == 1
+        good_new = curr_points[found].reshape(-1, 2)
+        good_old = prev_points[found].reshape(-1, 2)
+
+        if return_status:
+            return good_new, good_old, found, error.ravel()[found]
+        return good_new, good_old
+
+class DenseFlowTracker(FlowTracker):
+    """
+    Base class of the dense flow backends.
+
+    Subclasses implement compute_flow(), returning a flow field between the
+    previous and current grayscale frames. track() samples that field at the
+    given points, so a dense backend gives the same (new, old) point pairs
+    as the sparse tracker and the outlier estimation works unchanged.
+    Instead of detected features, sample_points() supplies a regular grid
+    that also covers low-texture areas.
+
+    Args:
+        step: Spacing of the sample grid in pixels
+    """
+
+    dense = True
+
+    def __init__(self, step=16):
+        super().__init__()
+        self.step = step
+        self.grid = None
+
+    def sample_points(self, shape):
+        """Regular grid of sample points for a frame shape, shape (N, 1, 2)."""
+        h, w = shape[:2]
+        if self.grid is None or self.grid_shape != (h, w):
+            ys, xs = np.mgrid[self.step // 2:h:self.step, self.step // 2:w:self.step]
+            self.grid = np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32).reshape(-1, 1, 2)
+            self.grid_shape = (h, w)
+        return self.grid
+
+    def compute_flow(self):
+        """
+        Return (flow, scale): the flow field from prev_gray to curr_gray,
+        computed on images resized by scale.
+        """
+        raise NotImplementedError
+
+    def track(self, prev_points):
+        if self.frames < 2:
+            raise ValueError("FlowTracker needs two frames before tracking")
+
+        flow, scale = self.compute_flow()
+
+        # Nearest sample of the field at every point, in frame pixels
+        xy = prev_points.reshape(-1, 2)
+        fh, fw = flow.shape[:2]
+        xs = np.clip((xy[:, 0] * scale).astype(np.intp), 0, fw - 1)
+        ys = np.clip((xy[:, 1] * scale).astype(np.intp), 0, fh - 1)
+        vectors = flow[ys, xs] / scale
+
+        return xy + vectors, xy
+
+class DISFlowTracker(DenseFlowTracker):
+    """
+    Dense inverse search flow on downscaled frames.
+
+    Args:
+        scale: Factor the grayscale frames are resized by before computing flow
+        preset: cv2.DISOPTICAL_FLOW_PRESET_* speed/quality preset
+        step: Spacing of the sample grid in pixels
+    """
+
+    def __init__(self, scale=0.5, preset=cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST, step=16):
+        super().__init__(step)
+        self.scale = scale
+        self.dis = cv2.DISOpticalFlow_create(preset)
+        self.small_buffers = [None, None]
+
+    def push(self, frame):
+        gray = super().push(frame)
+
+        h, w = gray.shape
+        size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        small = self.small_buffers[self.current]
+        if small is None or small.shape != (size[1], size[0]):
+            small = self.small_buffers[self.current] = np.empty((size[1], size[0]), dtype=np.uint8)
+        cv2.resize(gray, size, dst=small, interpolation=cv2.INTER_AREA)
+
+        return gray
+
+    def compute_flow(self):
+        prev_small = self.small_buffers[1 - self.current]
+        curr_small = self.small_buffers[self.current]
+        # No initial flow: DIS would otherwise start from the previous field
+        flow = self.dis.calc(prev_small, curr_small, None)
+        return flow, curr_small.shape[1] / self.curr_gray.shape[1]
+
+class TiledFlowTracker(DenseFlowTracker):
+    """
+    Dense Farneback (or DIS) flow computed tile by tile on a thread pool.
+
+    The frame is split into a grid of tiles, each grown by `overlap` pixels
+    on every side so the flow near the seams sees enough context. Tiles are
+    computed in parallel (OpenCV releases the GIL), and only each tile's
+    core, without the overlap, is written into the stitched flow field.
+
+    Args:
+        tiles: (columns, rows) of tiles
+        overlap: Pixels of context added around each tile
+        scale: Factor the grayscale frames are resized by before computing flow
+        method: 'farneback' or 'dis'
+        workers: Threads in the pool, defaults to the CPU count
+        step: Spacing of the sample grid in pixels
+    """
+
+    def __init__(self, tiles=(2, 2), overlap=16, scale=0.5, method='farneback', workers=None, step=16):
+        super().__init__(step)
+        if method not in ('farneback', 'dis'):
+            raise ValueError(f"Unknown tiled flow method: {method}")
+        self.tiles = tiles
+        self.overlap = overlap
+        self.scale = scale
+        self.method = method
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+
+        # DIS instances are not thread safe, so every tile gets its own
+        self.dis = [cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_FAST)
+                    for _ in range(tiles[0] * tiles[1])]
+        self.small = [None, None]
+        self.flow = None
+        self.rects = None
+
+    def push(self, frame):
+        gray = super().push(frame)
+        if self.scale == 1:
+            self.small[self.current] = gray
+            return gray
+
+        h, w = gray.shape
+        size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        small = self.small[self.current]
+        if small is None or small.shape != (size[1], size[0]) or small is gray:
+            small = self.small[self.current] = np.empty((size[1], size[0]), dtype=np.uint8)
+        cv2.resize(gray, size, dst=small, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def tile_rects(self, shape):
+        """(core, expanded) rectangles as (x0, y0, x1, y1) for every tile."""
+        h, w = shape[:2]
+        cols, rows = self.tiles
+        rects = []
+        for row in range(rows):
+            for col in range(cols):
+                x0, x1 = col * w // cols, (col + 1) * w // cols
+                y0, y1 = row * h // rows, (row + 1) * h // rows
+                expanded = (max(0, x0 - self.overlap), max(0, y0 - self.overlap),
+                            min(w, x1 + self.overlap), min(h, y1 + self.overlap))
+                rects.append(((x0, y0, x1, y1), expanded))
+        return rects
+
+    def _tile_flow(self, i):
+        (x0, y0, x1, y1), (ex0, ey0, ex1, ey1) = self.rects[i]
+        prev = self.small[1 - self.current][ey0:ey1, ex0:ex1]
+        curr = self.small[self.current][ey0:ey1, ex0:ex1]
+
+        if self.method == 'farneback':
+            flow = cv2.calcOpticalFlowFarneback(prev, curr, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        else:
+            flow = self.dis[i].calc(prev, curr, None)
+
+        # Keep only the core; the overlap was context
+        self.flow[y0:y1, x0:x1] = flow[y0 - ey0:y1 - ey0, x0 - ex0:x1 - ex0]
+
+    def compute_flow(self):
+        shape = self.small[self.current].shape
+        if self.flow is None or self.flow.shape[:2] != shape:
+            self.flow = np.zeros(shape + (2,), dtype=np.float32)
+            self.rects = self.tile_rects(shape)
+
+        # Tiles write disjoint parts of self.flow
+        list(self.pool.map(self._tile_flow, range(len(self.rects))))
+        return self.flow, shape[1] / self.curr_gray.shape[1]
+
+    def close(self):
+        self.pool.shutdown()
+
+# Flow backends by name, see create_flow_tracker()
+FLOW_BACKENDS = {
+    'lk': FlowTracker,
+    'dis': DISFlowTracker,
+    'tiled': TiledFlowTracker,
+}
+
+def create_flow_tracker(backend='lk', **options):
+    """
+    Create a flow backend by name ('lk', 'dis' or 'tiled').
+    Options are passed to the backend's constructor.
+    """
+    if backend not in FLOW_BACKENDS:
+        raise ValueError(f"Unknown flow backend: {backend}")
+    return FLOW_BACKENDS[backend](**options)
+
 def calculate_optical_flow(prev_frame, curr_frame, prev_points):
     """
     Calculate optical flow for given points between two frames.
     """
-    # Convert frames to grayscale
-    if len(prev_frame.shape) == 3:
-        prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-        curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY)
-    else:
-        prev_gray = prev_frame
-        curr_gray = curr_frame
-    
-    # Calculate optical flow using Lucas-Kanade method
-    curr_points, status, error = cv2.calcOpticalFlowPyrLK(
-        prev_gray,
-        curr_gray,
-        prev_points,
-        None,
-        winSize=(15, 15),
-        maxLevel=2,
-        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
-    )
-    
-    # Filter out points where flow wasn't found
-    good_new = curr_points[status == 1]
-    good_old = prev_points[status == 1]
-    
-    return good_new, good_old
+    tracker = FlowTracker()
+    tracker.push(prev_frame)
+    tracker.push(curr_frame)
+    return tracker.track(prev_points)
 
-def estimate_camera_motion(prev_points, curr_points, threshold=5.0):
+CAMERA_MODELS = ('translation', 'affine', 'homography')
+
+class CameraMotionEstimator:
+    """
+    Split tracked points into camera motion and outliers at a bounded cost.
+
+    The camera motion and the spread of the points around it are estimated
+    from at most `sample_size` points drawn at random, with np.partition
+    instead of full sorts, so that part of the cost does not grow with the
+    number of points. Only the final residual and threshold pass touches
+    every point, in buffers reused from frame to frame.
+
+    The camera model is either a pure translation (the median motion) or an
+    affine transform or homography fitted with RANSAC on at most
+    `fit_points` of the sampled points. The latter two take camera rotation
+    and zoom out of the residuals.
+
+    The spread is the median absolute deviation (MAD) of the residual
+    lengths, smoothed across frames. When nearly every point moves the same
+    way the MAD collapses towards zero and any sub-pixel noise would make
+    an outlier; `min_spread` keeps the threshold above that noise.
+
+    Args:
+        threshold: Outlier threshold, in multiples of the spread
+        model: One of CAMERA_MODELS
+        sample_size: Points the motion and the spread are estimated from
+        fit_points: Points the affine or homography model is fitted on
+        min_spread: Smallest spread used, in pixels
+        smoothing: Weight of each frame's spread in the running estimate
+        motion_smoothing: Same for the camera motion; 1 follows every frame,
+            which suits MotionPredictor, already filtering the motion
+        seed: Seed of the random subsample
+    """
+
+    def __init__(self, threshold=5.0, model='translation', sample_size=512, fit_points=128,
+                 min_spread=0.1, smoothing=0.3, motion_smoothing=1.0, seed=0):
+        if model not in CAMERA_MODELS:
+            raise ValueError(f"Unknown camera model: {model}")
+        self.threshold = threshold
+        self.model = model
+        self.sample_size = sample_size
+        self.fit_points = fit_points
+        self.min_spread = min_spread
+        self.smoothing = smoothing
+        self.motion_smoothing = motion_smoothing
+        self.rng = np.random.default_rng(seed)
+
+        self.motion = None
+        self.spread = None
+        # Model fitted on the last frame, None for translation or when the fit failed
+        self.transform = None
+
+        self.capacity = 0
+        self._reserve(1024)
+        self.scratch = np.empty(sample_size, dtype=np.float32)
+
+    def _reserve(self, count):
+        """Grow the per-point buffers to hold at least count points."""
+        if count <= self.capacity:
+            return
+        self.capacity = max(count, 2 * self.capacity)
+        self.vectors = np.empty((self.capacity, 2), dtype=np.float32)
+        self.distances = np.empty(self.capacity, dtype=np.float32)
+        self.outliers = np.empty(self.capacity, dtype=bool)
+
+    def reset(self):
+        self.motion = None
+        self.spread = None
+        self.transform = None
+
+    def _median(self, values):
+        """Median of a 1-D array, by selection in the scratch buffer."""
+        n = len(values)
+        scratch = self.scratch[:n]
+        np.copyto(scratch, values)
+        k = n // 2
+        if n % 2:
+            scratch.partition(k)
+            return float(scratch[k])
+        scratch.partition([k - 1, k])
+        return 0.5 * float(scratch[k - 1] + scratch[k])
+
+    def _fit(self, prev_sample, curr_sample):
+        """Fit the camera model on the sample. Returns the transform or None."""
+        prev_sample = prev_sample[:self.fit_points]
+        curr_sample = curr_sample[:self.fit_points]
+        if self.model == 'affine':
+            if len(prev_sample) < 3:
+                return None
+            transform, _ = cv2.estimateAffine2D(prev_sample, curr_sample, method=cv2.RANSAC,
+                                                ransacReprojThreshold=1.0)
+        else:
+            if len(prev_sample) < 4:
+                return None
+            transform, _ = cv2.findHomography(prev_sample, curr_sample, cv2.RANSAC, 1.0)
+        return transform
+
+    def _expected(self, prev_points, transform):
+        """Where the camera model moves the points, shape (N, 2)."""
+        if self.model == 'affine':
+            return cv2.transform(prev_points.reshape(-1, 1, 2), transform).reshape(-1, 2)
+        return cv2.perspectiveTransform(prev_points.reshape(-1, 1, 2), transform).reshape(-1, 2)
+
+    def estimate(self, prev_points, curr_points):
+        """
+        Estimate the camera motion between matched points.
+
+        Returns:
+            (outliers mask, camera motion). The mask is a view into a buffer
+            reused on the next call; copy it to keep it longer.
+        """
+        prev_points = np.asarray(prev_points, dtype=np.float32).reshape(-1, 2)
+        curr_points = np.asarray(curr_points, dtype=np.float32).reshape(-1, 2)
+        n = len(prev_points)
+        self._reserve(n)
+        vectors = self.vectors[:n]
+        distances = self.distances[:n]
+        outliers = self.outliers[:n]
+
+        np.subtract(curr_points, prev_points, out=vectors)
+
+        if n > self.sample_size:
+            sample = self.rng.integers(0, n, self.sample_size)
+        else:
+            sample = slice(None)
+
+        # Camera motion: median motion, or the fitted model
+        sample_vectors = vectors[sample]
+        motion = np.array([self._median(sample_vectors[:, 0]), self._median(sample_vectors[:, 1])],
+                          dtype=np.float32)
+        self.transform = None
+        if self.model != 'translation':
+            self.transform = self._fit(prev_points[sample], curr_points[sample])
+
+        if self.transform is not None:
+            np.subtract(curr_points, self._expected(prev_points, self.transform), out=vectors)
+            residuals = vectors
+        else:
+            if self.motion is not None and self.motion_smoothing < 1:
+                motion = self.motion + self.motion_smoothing * (motion - self.motion)
+            residuals = np.subtract(vectors, motion, out=vectors)
+        self.motion = motion
+
+        # Residual lengths of every point
+        np.hypot(residuals[:, 0], residuals[:, 1], out=distances)
+
+        # Median absolute deviation of the sampled residual lengths
+        sample_distances = distances[sample]
+        center = self._median(sample_distances)
+        spread = self._median(np.abs(sample_distances - center))
+        self.spread = spread if self.spread is None else self.spread + self.smoothing * (spread - self.spread)
+
+        # Points with motion significantly different from the camera motion
+        # are considered outliers (using modified z-score)
+        np.greater(distances, self.threshold * max(self.spread, self.min_spread), out=outliers)
+        return outliers, motion
+
+def estimate_camera_motion(prev_points, curr_points, threshold=5.0, return_motion=False):
     """
     Estimate camera motion and identify outlier points.
-    Returns mask of points that don't follow the dominant motion pattern.
+    Returns mask of points that don't follow the dominant motion pattern,
+    and the median motion vector as well if return_motion is set.
+
+    Stateless: every call starts a new CameraMotionEstimator. Use one
+    estimator across frames to reuse its buffers and smooth the spread.
     """
-    # Calculate motion vectors
-    motion_vectors = curr_points - prev_points
-    
-    # Calculate median motion as an estimate of camera motion
-    median_motion = np.median(motion_vectors, axis=0)
-    
-    # Calculate the difference from median motion for each point
-    motion_differences = np.linalg.norm(motion_vectors - median_motion, axis=1)
-    
-    # Calculate the median absolute deviation (MAD)
-    mad = np.median(np.abs(motion_differences - np.median(motion_differences)))
-    
-    # Points with motion significantly different from the camera motion
-    # are considered outliers (using modified z-score)
-    outliers_mask = motion_differences > (threshold * mad)
-    
+    outliers_mask, median_motion = CameraMotionEstimator(threshold).estimate(prev_points, curr_points)
+    outliers_mask = outliers_mask.copy()
+
+    if return_motion:
+        return outliers_mask, median_motion
     return outliers_mask
 
-def analyze_motion(video_path):
+class MotionPredictor:
+    """
+    Predict where tracked points land in the next frame, to seed LK.
+
+    The camera motion follows a constant-velocity model: a Kalman filter per
+    axis on the per-frame displacement, fed the median motion measured by
+    estimate_camera_motion. Every point also keeps its own residual velocity,
+    its motion minus the camera's, so objects moving on their own are
+    predicted too.
+
+    Once `warmup` measurements in a row have agreed with the predictions,
+    LK starts from the predicted positions and runs with at most `levels`
+    pyramid levels and `iterations` iterations. A frame has diverged when
+    its camera motion ends up more than `max_error` pixels from the
+    prediction, when it loses more than `max_lost` of its points, or when
+    the median LK match error grows past `error_ratio` times its usual
+    level: LK that cannot reach the true motion from a bad prediction tends
+    to stay near it, so the match error is what gives it away. A diverged
+    frame is tracked again with the full settings, from zero, and the
+    filter has to lock on again.
+
+    Args:
+        levels: Pyramid levels used while the predictions hold
+        iterations: LK iterations per level while the predictions hold
+        warmup: Agreeing frames needed before the predictions are used
+        max_error: Largest prediction error of the camera motion, in pixels
+        max_lost: Largest share of points LK may fail to track
+        error_ratio: Largest median match error, relative to its running level
+        min_error: Match error always accepted, for nearly noiseless video
+        process_noise: Variance the camera velocity may change by per frame
+        measurement_noise: Variance of the measured median motion
+        smoothing: Weight of the latest residual in each point's velocity
+    """
+
+    def __init__(self, levels=1, iterations=5, warmup=3, max_error=2.0, max_lost=0.2,
+                 error_ratio=2.0, min_error=4.0, process_noise=1.0, measurement_noise=0.25,
+                 smoothing=0.5):
+        self.levels = levels
+        self.iterations = iterations
+        self.warmup = warmup
+        self.max_error = max_error
+        self.max_lost = max_lost
+        self.error_ratio = error_ratio
+        self.min_error = min_error
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.smoothing = smoothing
+
+        self.frames = 0
+        self.predicted_frames = 0
+        self.fallbacks = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the camera velocity; predictions wait for a new lock."""
+        self.velocity = np.zeros(2, dtype=np.float32)
+        self.variance = 1e3
+        self.agreeing = 0
+        self.match_error = None
+
+    @property
+    def locked(self):
+        """True while the predictions are trusted to seed LK."""
+        return self.agreeing >= self.warmup
+
+    def predict(self, points, residuals):
+        """Predicted positions of (N, 1, 2) points with (N, 2) residual velocities."""
+        return points + (self.velocity + residuals).reshape(-1, 1, 2)
+
+    def diverged(self, found, motion, match_error):
+        """
+        Check a frame tracked from the predictions.
+
+        Args:
+            found: Per-point mask of the points LK tracked
+            motion: Median motion of the tracked points
+            match_error: LK match error of the tracked points
+        """
+        if found.mean() < 1 - self.max_lost:
+            return True
+        if np.linalg.norm(motion - self.velocity) > self.max_error:
+            return True
+        error = float(np.median(match_error)) if len(match_error) else 0.0
+        return self.match_error is not None and error > max(self.min_error, self.error_ratio * self.match_error)
+
+    def update(self, camera_motion, match_error=None):
+        """
+        Feed the measured camera motion of a frame, and the LK match error
+        of its points to follow their usual level.
+        Returns False when the motion is further than max_error from the prediction.
+        """
+        self.frames += 1
+        if match_error is not None and len(match_error):
+            error = float(np.median(match_error))
+            self.match_error = error if self.match_error is None else 0.9 * self.match_error + 0.1 * error
+
+        error = float(np.linalg.norm(camera_motion - self.velocity))
+
+        # Constant velocity: the prediction keeps the state, only the uncertainty grows
+        self.variance += self.process_noise
+        gain = self.variance / (self.variance + self.measurement_noise)
+        self.velocity = self.velocity + gain * (camera_motion - self.velocity)
+        self.variance *= 1 - gain
+
+        agrees = error <= self.max_error
+        self.agreeing = self.agreeing + 1 if agrees else 0
+        return agrees
+
+    def update_residuals(self, residuals, motion, camera_motion):
+        """Blend each point's latest motion, relative to the camera, into its velocity."""
+        return residuals + self.smoothing * (motion - camera_motion - residuals)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'predicted': self.predicted_frames,
+            'fallbacks': self.fallbacks,
+        }
+
+class MotionAnalyzer:
+    """
+    Frame by frame optical flow analysis, with no display attached.
+
+    Feed frames to process() in order. Each call tracks the points from the
+    previous frame, splits them into camera motion and outliers, and tops
+    the grid back up for the next frame.
+
+    Stages are timed into `timings` when one is given. With a
+    quality.QualityController, the time of every process() call is fed to
+    it and the point budget and LK parameters follow its quality level.
+
+    The flow backend is a FLOW_BACKENDS name or a tracker instance. Dense
+    backends track their own sample grid instead of detected features.
+
+    With a MotionPredictor, the sparse backend starts LK from the predicted
+    point positions, with fewer pyramid levels and iterations while the
+    predictions hold. Dense backends ignore it.
+
+    Outliers are split off by a CameraMotionEstimator using camera_model,
+    one of CAMERA_MODELS.
+    """
+
+    def __init__(self, max_points=1000, min_points=600, grid=(8, 6), threshold=5.0,
+                 timings=None, controller=None, backend='lk', predictor=None,
+                 camera_model='translation'):
+        self.tracker = create_flow_tracker(backend) if isinstance(backend, str) else backend
+        self.features = FeatureManager(grid, max_points, min_points)
+        self.estimator = CameraMotionEstimator(threshold, model=camera_model)
+        self.timings = timings or NULL_TIMINGS
+        self.controller = controller
+        self.predictor = predictor if not self.tracker.dense else None
+        self.points = None
+        # Residual velocity of every point, kept in step with self.points
+        self.residuals = None
+
+        if controller is not None:
+            self.configure(controller.settings)
+
+    @property
+    def quality(self):
+        """Current quality level, or None without a controller."""
+        return self.controller.level if self.controller is not None else None
+
+    def configure(self, settings):
+        """Apply quality.QualitySettings to the feature grid and the tracker."""
+        self.features.set_budget(settings.max_points, settings.min_points)
+        self.tracker.win_size = settings.win_size
+        self.tracker.max_level = settings.max_level
+        self.tracker.set_iterations(settings.iterations)
+
+        # Drop evenly spread points when the budget shrinks
+        if self.points is not None and len(self.points) > settings.max_points:
+            keep = np.linspace(0, len(self.points) - 1, settings.max_points).astype(int)
+            self.points = self.points[keep]
+            if self.residuals is not None:
+                self.residuals = self.residuals[keep]
+
+    def close(self):
+        """Release the tracker's resources, e.g. the worker threads of the tiled backend."""
+        if hasattr(self.tracker, 'close'):
+            self.tracker.close()
+
+    def skip(self, frame):
+        """
+        Take in a frame without tracking anything.
+        Points keep their positions, which suits a camera that is not moving.
+        """
+        with self.timings.stage('gray'):
+            self.tracker.push(frame)
+
+    def process(self, frame, select=None, replenish=True):
+        """
+        Analyze the next frame.
+        Returns a FlowResult, or None for the first frame.
+
+        Args:
+            frame: Next video frame
+            select: Optional function taking the (N, 1, 2) points and returning
+                a boolean mask of the ones to track. The others keep their
+                positions and are not part of the result.
+            replenish: Top up grid cells that ran low before tracking
+        """
+        timings = self.timings
+        start = time.perf_counter()
+
+        if self.tracker.frames == 0:
+            self.skip(frame)
+            return None
+
+        if self.tracker.dense:
+            prev_points = self.tracker.sample_points(self.tracker.curr_gray.shape)
+        elif replenish or self.points is None:
+            # Top up grid cells that lost points, on the previous frame's grayscale image
+            with timings.stage('features'):
+                prev_points = self.features.replenish(self.tracker.curr_gray, self.points)
+        else:
+            prev_points = self.points
+
+        predictor = self.predictor
+        residuals = held_residuals = None
+        if predictor is not None:
+            # New points start out moving with the camera
+            residuals = np.zeros((len(prev_points), 2), dtype=np.float32)
+            if self.residuals is not None:
+                kept = min(len(self.residuals), len(prev_points))
+                residuals[:kept] = self.residuals[:kept]
+
+        held_points = None
+        if select is not None:
+            selected = select(prev_points)
+            held_points = prev_points[~selected]
+            prev_points = prev_points[selected]
+            if residuals is not None:
+                held_residuals = residuals[~selected]
+                residuals = residuals[selected]
+
+        # Calculate optical flow
+        with timings.stage('gray'):
+            self.tracker.push(frame)
+        with timings.stage('flow'):
+            if len(prev_points) == 0:
+                curr_points = prev_points_matched = np.empty((0, 2), dtype=np.float32)
+            elif predictor is None:
+                curr_points, prev_points_matched = self.tracker.track(prev_points)
+            else:
+                curr_points, prev_points_matched, found, match_error = self._track_predicted(
+                    prev_points, residuals)
+
+        if len(curr_points) > 0:
+            # Find points not moving with camera
+            with timings.stage('outliers'):
+                outliers_mask, camera_motion = self.estimator.estimate(prev_points_matched, curr_points)
+                # The estimator reuses its mask; results may outlive the next frame
+                outliers_mask = outliers_mask.copy()
+        else:
+            outliers_mask = np.zeros(0, dtype=bool)
+            camera_motion = np.zeros(2, dtype=np.float32)
+
+        if predictor is not None and len(prev_points) > 0:
+            predictor.update(camera_motion, match_error)
+            residuals = residuals[found]
+            if len(curr_points) > 0:
+                residuals = predictor.update_residuals(
+                    residuals, curr_points - prev_points_matched, camera_motion)
+
+        # Update for next iteration
+        self.points = curr_points.reshape(-1, 1, 2)
+        if held_points is not None and len(held_points):
+            self.points = np.concatenate([self.points, held_points])
+        if residuals is not None:
+            if held_residuals is not None and len(held_residuals):
+                residuals = np.concatenate([residuals, held_residuals])
+            self.residuals = residuals
+
+        if not self.tracker.dense and len(self.points):
+            # Hold the point budget: drop points that left the frame and thin out crowded cells
+            keep = self.features.prune(self.points, frame.shape)
+            if not keep.all():
+                self.points = self.points[keep]
+                if self.residuals is not None:
+                    self.residuals = self.residuals[keep]
+
+        if self.controller is not None and self.controller.update(time.perf_counter() - start):
+            self.configure(self.controller.settings)
+
+        return FlowResult(curr_points, prev_points_matched, outliers_mask, camera_motion)
+
+    def _track_predicted(self, prev_points, residuals):
+        """
+        Track from the predicted positions with the reduced settings, falling
+        back to the full settings from zero when the predictions diverge.
+        Returns the matched (new, old) points, the found mask and the match error.
+        """
+        predictor = self.predictor
+        if predictor.locked:
+            curr_points, prev_matched, found, match_error = self.tracker.track(
+                prev_points, predictor.predict(prev_points, residuals),
+                max_level=min(predictor.levels, self.tracker.max_level),
+                iterations=min(predictor.iterations, self.tracker.criteria[1]),
+                return_status=True
+            )
+
+            motion = np.median(curr_points - prev_matched, axis=0) if len(curr_points) else predictor.velocity
+            if not predictor.diverged(found, motion, match_error):
+                predictor.predicted_frames += 1
+                return curr_points, prev_matched, found, match_error
+
+            predictor.fallbacks += 1
+            predictor.reset()
+
+        return self.tracker.track(prev_points, return_status=True)
+
+class AttitudeIntegrator:
+    """
+    Integrate the per-frame camera motion into pitch and yaw angles.
+
+    Image motion is converted to angles with the camera's field of view.
+    The scene moving left in the image means the camera turned right.
+
+    Args:
+        width: Frame width in pixels
+        height: Frame height in pixels
+        fov: (horizontal, vertical) field of view in degrees, by default
+            the Raspberry Pi camera module v2
+    """
+
+    def __init__(self, width, height, fov=(62.2, 48.8)):
+        self.degrees_per_pixel = (fov[0] / width, fov[1] / height)
+        self.pitch = 0.0
+        self.yaw = 0.0
+
+    def update(self, camera_motion):
+        """Add one frame's camera motion. Returns (pitch, yaw) in degrees."""
+        dx, dy = camera_motion
+        self.yaw = (self.yaw - dx * self.degrees_per_pixel[0]) % 360
+        self.pitch = float(np.clip(self.pitch + dy * self.degrees_per_pixel[1], -90, 90))
+        return self.pitch, self.yaw
+
+# Shared by draw_flow; draws every frame
+FLOW_RENDERER = FlowRenderer()
+
+def draw_flow(frame, result, out=None):
+    """
+    Draw tracked points on a copy of the frame, outliers in red.
+    The copy is made into out when given, e.g. a buffer reused every frame.
+    Points are drawn in batches, see overlay.FlowRenderer.
+    """
+    if out is None:
+        frame_vis = frame.copy()
+    else:
+        frame_vis = out
+        np.copyto(frame_vis, frame)
+
+    return FLOW_RENDERER.draw_vectors(frame_vis, result.points, result.prev_points, result.outliers)
+
+def analyze_motion(video_path, max_points=1000, min_points=600, grid=(8, 6), timings=None,
+                   budget_ms=None, track_objects=True, backend='lk', predict=False, draw_every=1):
     """
     Analyze motion in video and detect objects moving differently from camera motion.
+
+    Args:
+        video_path: Path to input video or recording, or camera index
+        max_points: Number of points to track when every grid cell is full
+        min_points: Cells are refilled when they fall below their share of this
+        grid: (columns, rows) of the grid the points are spread over
+        timings: Timings collecting per-stage latencies, reported at the end
+        budget_ms: Per-frame analysis time to hold by adapting the quality.
+            Overrides max_points and min_points when set.
+        track_objects: Group outliers into objects with persistent IDs and draw them
+        backend: Flow backend name, see FLOW_BACKENDS
+        predict: Seed LK with predicted point motion, see MotionPredictor
+        draw_every: Draw and display every Nth frame only; the analysis
+            still runs on every frame
     """
-    cap = cv2.VideoCapture(video_path)
+    timings = timings or NULL_TIMINGS
+    controller = QualityController(budget_ms) if budget_ms else None
+
+    cap = open_capture(video_path, realtime=True)
+
+    # Frames are decoded into a small ring of buffers and drawn into one reused buffer
+    pool = FramePool(count=2)
+    reader = FrameReader(cap, pool)
     
     # Read first frame
-    ret, prev_frame = cap.read()
-    if not ret:
+    prev_frame = reader.read()
+    if prev_frame is None:
         raise ValueError("Could not read video")
 
-    prev_points = None
+    analyzer = MotionAnalyzer(max_points, min_points, grid, timings=timings, controller=controller,
+                              backend=backend, predictor=MotionPredictor() if predict else None)
+    try:
+        analyzer.process(prev_frame)
+        pool.release(prev_frame)
+        tracker = ObjectTracker() if track_objects else None
+        renderer = FlowRenderer(every=draw_every)
+        frame_vis = pool.acquire(prev_frame.shape)
     
-    while True:
-        ret, curr_frame = cap.read()
-        if not ret:
-            break
+        while True:
+            with timings.stage('capture'):
+                curr_frame = reader.read()
+            if curr_frame is None:
+                break
 
-        
-        # Detect initial points
-        if prev_points is None:        
-            prev_points = detect_feature_points(prev_frame)
-        elif  curr_points.shape[0] < 600:
-            prev_points = detect_feature_points(prev_frame)
-        
+            result = analyzer.process(curr_frame)
 
-        print(prev_points.shape)
-                
-        # Calculate optical flow
-        curr_points, prev_points_matched = calculate_optical_flow(
-            prev_frame, curr_frame, prev_points
-        )
+            objects = []
+            if tracker is not None:
+                with timings.stage('objects'):
+                    objects = tracker.update(result, curr_frame.shape)
         
-        if len(curr_points) > 0 and len(prev_points_matched) > 0:
-            # Find points not moving with camera
-            outliers_mask = estimate_camera_motion(prev_points_matched, curr_points)
-            
-            # Visualize results
-            frame_vis = curr_frame.copy()
-            
-            # Draw all tracked points
-            for i, (new, old) in enumerate(zip(curr_points, prev_points_matched)):
-                a, b = new.ravel()
-                c, d = old.ravel()
-                
-                # Draw line between old and new position
-                color = (0, 0, 255) if outliers_mask[i] else (0, 255, 0)
-                cv2.line(frame_vis, (int(c), int(d)), (int(a), int(b)), color, 2)
-                cv2.circle(frame_vis, (int(a), int(b)), 3, color, -1)
-            
-            cv2.imshow('Frame', frame_vis)
-            
-            # Exit if 'q' is pressed
-            if cv2.waitKey(30) & 0xFF == ord('q'):
-                break
-        
-        # Update for next iteration
-        prev_frame = curr_frame.copy()
-        prev_points = curr_points.reshape(-1, 1, 2)
+            if len(result.points) > 0:
+                # Visualize results, on every draw_every-th frame
+                with timings.stage('draw'):
+                    if frame_vis.shape != curr_frame.shape:
+                        pool.release(frame_vis)
+                        frame_vis = pool.acquire(curr_frame.shape)
+                    drawn = renderer.render(curr_frame, result, out=frame_vis)
+                    if drawn is not None:
+                        draw_objects(frame_vis, objects)
+                        if controller is not None:
+                            cv2.putText(frame_vis, f"quality {analyzer.quality}", (10, 30),
+                                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+
+                if drawn is not None:
+                    with timings.stage('display'):
+                        cv2.imshow('Frame', frame_vis)
+                        key = cv2.waitKey(30)
+
+                    # Exit if 'q' is pressed
+                    if key & 0xFF == ord('q'):
+                        break
+
+            pool.release(curr_frame)
+            timings.tick()
+    finally:
+        analyzer.close()
     
     cap.release()
     cv2.destroyAllWindows()
 
+    if timings.enabled:
+        print(timings.format_report())
+        timings.dump()
+
 if __name__ == "__main__":
-    # Example usage
-    video_path = 0
-    analyze_motion(video_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Optical flow outlier analysis")
+    parser.add_argument('video', nargs='?', default=0, help="input video file or recording (default: camera 0)")
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="adapt the point budget to hold this analysis time per frame (default: fixed quality)")
+    args = parser.parse_args()
+    analyze_motion(parse_source(args.video), timings=Timings(), budget_ms=args.budget_ms)
@@ -0,0 +1,169 @@
+"""
+Batched drawing of analysis results: motion vectors, points and boxes.
+
+Drawing point by point from Python costs a cv2.line and a cv2.circle call,
+plus the conversions, for every tracked point. FlowRenderer draws all the
+vectors of one color with a single cv2.polylines call and stamps the dots
+with one indexed assignment into the frame, so the cost per point stays in
+numpy and OpenCV.
+
+Layers draw in place into one output buffer, so they compose with the
+other overlays, e.g. the pitch/yaw HUD:
+
+    renderer = FlowRenderer(every=2)
+    for frame in frames:
+        result = analyzer.process(frame)     # tracking runs on every frame
+        vis = renderer.render(frame, result, boxes, out=buffer)
+        if vis is not None:                  # drawn on every other frame
+            hud.update(vis, pitch, yaw)
+            show(vis)
+"""
+import cv2
+import numpy as np
+
+INLIER_COLOR = (0, 255, 0)
+OUTLIER_COLOR = (0, 0, 255)
+BOX_COLOR = (0, 255, 0)
+
+
+def disk_offsets(radius):
+    """(dy, dx) offsets of the pixels of a filled circle, as cv2.circle draws it."""
+    stamp = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+    cv2.circle(stamp, (radius, radius), radius, 1, -1)
+    dy, dx = np.nonzero(stamp)
+    return dy - radius, dx - radius
+
+
+class FlowRenderer:
+    """
+    Draw flow results and boxes in batches.
+
+    Args:
+        every: Draw every Nth frame; render() returns None on the others,
+            so the caller can skip displaying them as well
+        radius: Radius of the dots at the points' current positions
+        thickness: Line thickness of the motion vectors and boxes
+        inlier_color: Color of the points moving with the camera
+        outlier_color: Color of the outlier points
+        box_color: Default color of the boxes
+    """
+
+    def __init__(self, every=1, radius=3, thickness=2, inlier_color=INLIER_COLOR,
+                 outlier_color=OUTLIER_COLOR, box_color=BOX_COLOR):
+        self.every = max(1, int(every))
+        self.radius = radius
+        self.thickness = thickness
+        self.inlier_color = inlier_color
+        self.outlier_color = outlier_color
+        self.box_color = box_color
+
+        self.disk_dy, self.disk_dx = disk_offsets(radius)
+        # Flat pixel offsets of the disk, cached per image width
+        self.offsets_width = None
+        self.offsets = None
+
+        self.frames = 0
+        self.rendered = 0
+
+    def due(self):
+        """Count a frame. Returns True if it is one to draw."""
+        self.frames += 1
+        return (self.frames - 1) % self.every == 0
+
+    def render(self, frame, result=None, boxes=None, out=None):
+        """
+        Draw a FlowResult and motion boxes over the frame, if this frame is due.
+
+        Args:
+            frame: Frame to draw over; left untouched unless it is also out
+            result: FlowResult from MotionAnalyzer, or None
+            boxes: (x, y, w, h) boxes, e.g. from diffrence.MotionDetector
+            out: Buffer to draw into, e.g. one reused every frame. Defaults to
+                a copy of the frame; pass the frame itself to draw in place.
+
+        Returns:
+            The drawn image, or None when the frame is skipped
+        """
+        if not self.due():
+            return None
+
+        if out is None:
+            out = frame.copy()
+        elif out is not frame:
+            np.copyto(out, frame)
+
+        if result is not None:
+            self.draw_vectors(out, result.points, result.prev_points, result.outliers)
+        if boxes is not None:
+            self.draw_boxes(out, boxes)
+
+        self.rendered += 1
+        return out
+
+    def draw_vectors(self, img, points, prev_points=None, outliers=None):
+        """
+        Draw points in place, with a line from their previous positions when given.
+        Outliers, a boolean mask over the points, are drawn in outlier_color.
+        """
+        curr = np.asarray(points).reshape(-1, 2).astype(np.int32)
+        if len(curr) == 0:
+            return img
+        prev = None if prev_points is None else np.asarray(prev_points).reshape(-1, 2).astype(np.int32)
+
+        if outliers is None:
+            classes = ((slice(None), self.inlier_color),)
+        else:
+            outliers = np.asarray(outliers, dtype=bool)
+            classes = ((~outliers, self.inlier_color), (outliers, self.outlier_color))
+
+        for mask, color in classes:
+            if prev is not None:
+                # One two-point polyline per vector, all in a single call
+                segments = np.stack([prev[mask], curr[mask]], axis=1)
+                if len(segments):
+                    cv2.polylines(img, segments, False, color, self.thickness)
+            self.draw_dots(img, curr[mask], color)
+        return img
+
+    def draw_dots(self, img, xy, color):
+        """Stamp a filled disk at each (x, y) integer position, in place."""
+        if len(xy) == 0:
+            return img
+        h, w = img.shape[:2]
+        r = self.radius
+        if self.offsets_width != w:
+            self.offsets = (self.disk_dy * w + self.disk_dx).astype(np.intp)
+            self.offsets_width = w
+
+        # One value per channel, as cv2.circle takes the color: a grayscale
+        # image gets the first component, missing components are 0
+        channels = img.shape[2] if img.ndim == 3 else 1
+        value = np.zeros(channels, dtype=img.dtype)
+        components = np.atleast_1d(color)[:channels]
+        value[:len(components)] = components
+
+        inside = (xy[:, 0] >= r) & (xy[:, 0] < w - r) & (xy[:, 1] >= r) & (xy[:, 1] < h - r)
+        if img.flags.c_contiguous:
+            base = xy[inside, 1].astype(np.intp) * w + xy[inside, 0]
+            img.reshape(h * w, channels)[(base[:, None] + self.offsets).ravel()] = value
+        else:
+            # A view into a larger image cannot be flattened without a copy
+            ys = (xy[inside, 1, None] + self.disk_dy).ravel()
+            xs = (xy[inside, 0, None] + self.disk_dx).ravel()
+            img[ys, xs] = value if img.ndim == 3 else value[0]
+
+        # The few disks crossing the border are clipped by OpenCV
+        for x, y in xy[~inside]:
+            cv2.circle(img, (int(x), int(y)), r, color, -1)
+        return img
+
+    def draw_boxes(self, img, boxes, color=None):
+        """Draw (x, y, w, h) boxes in place, all with one cv2.polylines call."""
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        if len(boxes) == 0:
+            return img
+        x, y, w, h = boxes.T
+        corners = np.stack([np.stack([x, y], axis=1), np.stack([x + w, y], axis=1),
+                            np.stack([x + w, y + h], axis=1), np.stack([x, y + h], axis=1)], axis=1)
+        cv2.polylines(img, corners, True, color or self.box_color, self.thickness)
+        return img
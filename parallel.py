@@ -0,0 +1,135 @@
+"""
+Multi-process analysis of long video files.
+
+The video is split into frame ranges that are analyzed independently by a
+pool of worker processes, each with its own capture. Every range starts
+`overlap` frames early so the trackers are warmed up by the time its first
+recorded frame arrives. Range boundaries depend only on the video length,
+range size and overlap, never on the worker count, so results are the same
+whatever the number of workers.
+
+Example:
+    python parallel.py recording.mp4 -o recording_results --workers 4
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from batch import add_analysis_arguments, analysis_options, open_video, process_frames, video_metadata
+from recording import open_capture
+from results import ResultReader, ResultWriter
+
+
+def plan_ranges(frame_count, range_frames, overlap):
+    """
+    Split frame_count frames into ranges.
+    Returns a list of (warmup_start, start, end) frame indices.
+    """
+    ranges = []
+    for start in range(0, frame_count, range_frames):
+        end = min(start + range_frames, frame_count)
+        ranges.append((max(0, start - overlap), start, end))
+    return ranges
+
+
+def _init_worker():
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def _analyze_range(job):
+    video_path, part_path, (warmup_start, start, end), chunk_size, compress, options = job
+
+    cap = open_video(video_path, warmup_start)
+    with ResultWriter(part_path, chunk_size, compress) as writer:
+        process_frames(cap, writer, start_frame=warmup_start, end_frame=end,
+                       record_from=start, **options)
+    cap.release()
+
+    return part_path
+
+
+def _merge_part(part_path, output_path, writer):
+    """Move the chunks of a finished part into the output, in frame order."""
+    part = ResultReader(part_path)
+    for chunk in part.chunks:
+        name = f"chunk_{len(writer.chunks):06d}.npz"
+        shutil.move(os.path.join(part_path, chunk['file']), os.path.join(output_path, name))
+        writer.chunks.append(dict(chunk, file=name))
+        writer.frames += chunk['frames']
+    shutil.rmtree(part_path)
+
+
+def run_parallel(video_path, output_path, workers=None, range_frames=900, overlap=15,
+                 chunk_size=256, compress=False, **options):
+    """
+    Analyze a video with a pool of worker processes.
+
+    Args:
+        video_path: Path to input video
+        output_path: Results directory to write
+        workers: Number of worker processes, defaults to the CPU count
+        range_frames: Number of frames analyzed by each job
+        overlap: Frames decoded before each range to warm up the trackers
+        chunk_size: Number of frames per results chunk
+        compress: Compress the results chunks
+        options: Analysis options passed on to batch.process_frames()
+
+    Returns:
+        Number of frames processed
+    """
+    cap = open_capture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Error opening video file")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    metadata = video_metadata(cap, video_path, options.get('flow', True), options.get('diff', True))
+    cap.release()
+
+    if frame_count <= 0:
+        raise ValueError("Could not determine the number of frames")
+
+    metadata.update(range_frames=range_frames, overlap=overlap)
+    ranges = plan_ranges(frame_count, range_frames, overlap)
+    jobs = [
+        (video_path, os.path.join(output_path, f"part_{i:05d}"), frame_range, chunk_size, compress, options)
+        for i, frame_range in enumerate(ranges)
+    ]
+
+    start = time.perf_counter()
+    writer = ResultWriter(output_path, chunk_size, compress, metadata)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # map() yields in submission order, so parts are merged in frame order
+        for part_path in pool.map(_analyze_range, jobs):
+            _merge_part(part_path, output_path, writer)
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"Processed {writer.frames} frames in {len(ranges)} ranges in {elapsed:.1f}s "
+          f"({writer.frames / max(elapsed, 1e-9):.1f} fps)")
+    return writer.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel motion analysis of a video file")
+    parser.add_argument('video', help="input video file")
+    parser.add_argument('-o', '--output', required=True, help="results directory")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--range-frames', type=int, default=900, help="frames per job")
+    parser.add_argument('--overlap', type=int, default=15, help="warm-up frames before each range")
+    add_analysis_arguments(parser)
+    args = parser.parse_args()
+
+    run_parallel(
+        args.video, args.output,
+        workers=args.workers, range_frames=args.range_frames, overlap=args.overlap,
+        chunk_size=args.chunk_size, compress=args.compress,
+        **analysis_options(args)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,13 @@
 from pygame.locals import KEYDOWN, K_ESCAPE, K_q
 import pygame
+import numpy as np
 import cv2
+import argparse
+import os
 import sys
 
 size = [400, 300]
 
-camera = cv2.VideoCapture(0)
-pygame.init()
-pygame.display.set_caption("OpenCV camera stream on Pygame")
-screen = pygame.display.set_mode(size)
-
-font = pygame.font.SysFont('Arial', 12)
-
 MAJOR_TICK_LENGTH = 15
 MINOR_TICK_LENGTH = 8
 LABEL_OFFSET = 20
@@ -23,6 +19,42 @@ GRAY = (128, 128, 128)
 YAW_HEIGHT = 1
 PITCH_WIDTH = 10
 
+class LabelCache:
+    """
+    Rendered text surfaces, kept so each label is only rendered once.
+    """
+    def __init__(self, font, color=WHITE):
+        self.font = font
+        self.color = color
+        self.surfaces = {}
+
+    def get(self, text):
+        surface = self.surfaces.get(text)
+        if surface is None:
+            surface = self.surfaces[text] = self.font.render(text, True, self.color)
+        return surface
+
+class CameraSurface:
+    """
+    Persistent surface showing camera frames.
+
+    The surface is created once over a BGR buffer with
+    pygame.image.frombuffer, so resizing a frame into that buffer updates
+    the surface directly: no color conversion, no transpose for surfarray
+    and no new surface per frame.
+    """
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.buffer = np.zeros((height, width, 3), dtype=np.uint8)
+        self.surface = pygame.image.frombuffer(self.buffer, self.size, 'BGR')
+
+    def upload(self, frame, interpolation=cv2.INTER_CUBIC):
+        if frame.shape[:2] == self.buffer.shape[:2]:
+            np.copyto(self.buffer, frame)
+        else:
+            cv2.resize(frame, self.size, dst=self.buffer, interpolation=interpolation)
+        return self.surface
+
 class PitchYawHUD:
     def __init__(self, screen_width=800, screen_height=600):
         # pygame.init()
@@ -44,12 +76,19 @@ class PitchYawHUD:
         
         # Font
         self.font = pygame.font.SysFont('Arial', 12)
+        self.labels = LabelCache(self.font, self.WHITE)
         
         # Cardinal directions for yaw
         self.cardinal_directions = {
             0: "N", 45: "NE", 90: "E", 135: "SE",
             180: "S", 225: "SW", 270: "W", 315: "NW"
         }
+
+        # Render every label up front so drawing never calls font.render()
+        for text in self.cardinal_directions.values():
+            self.labels.get(text)
+        for angle in range(-180, 181, 30):
+            self.labels.get(str(angle))
     
     def draw_yaw_indicator(self, screen, yaw_angle):
         # Normalize yaw angle to 0-360
@@ -69,7 +108,7 @@ class PitchYawHUD:
                 tick_length = self.MAJOR_TICK_LENGTH
                 # Draw direction label
                 if angle in self.cardinal_directions:
-                    label = self.font.render(self.cardinal_directions[angle], True, self.WHITE)
+                    label = self.labels.get(self.cardinal_directions[angle])
                     screen.blit(label, (x_pos - label.get_width()/2, self.LABEL_OFFSET))
             else:
                 tick_length = self.MINOR_TICK_LENGTH
@@ -103,7 +142,7 @@ class PitchYawHUD:
             if angle % 30 == 0:  # Major ticks
                 tick_length = self.MAJOR_TICK_LENGTH
                 # Draw angle label
-                label = self.font.render(str(angle), True, self.WHITE)
+                label = self.labels.get(str(angle))
                 screen.blit(label,
                                (screen.get_width() - self.PITCH_WIDTH - label.get_width() - 5,
                                 y_pos - label.get_height()/2))
@@ -116,47 +155,82 @@ class PitchYawHUD:
                            (screen.get_width() - self.PITCH_WIDTH + tick_length, y_pos))
 
     def update(self, screen, pitch, yaw):
+        """
+        Draw the HUD onto the screen surface. Presenting the frame is left
+        to the caller, so each frame is flipped exactly once.
+        """
         # screen.fill((0, 0, 0))  # Clear screen
         self.draw_yaw_indicator(screen, yaw)
         self.draw_pitch_indicator(screen, pitch)
-        pygame.display.flip()
-
-
-
-hud = PitchYawHUD()
-
-pitch = 0
-yaw = 0
 
+def init_display(width, height, headless=False):
+    """
+    Initialize pygame and open the window.
+    With headless set, SDL's dummy video driver is used so no display is needed.
+    """
+    if headless:
+        # Read by SDL when the display is initialized
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+    pygame.init()
+    pygame.display.set_caption("OpenCV camera stream on Pygame")
+    return pygame.display.set_mode((width, height))
+
+def render_frame(screen, camera_surface, hud, frame, pitch, yaw):
+    """
+    Compose one frame (camera image, then HUD) and present it once.
+    """
+    screen.blit(camera_surface.upload(frame), (0, 0))
+    hud.update(screen, pitch, yaw)
+    pygame.display.flip()
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera stream with a pitch/yaw HUD on pygame")
+    parser.add_argument('--video', default=0, help="video file or camera index (default: camera 0)")
+    parser.add_argument('--headless', action='store_true', help="render with SDL's dummy video driver")
+    parser.add_argument('--frames', type=int, default=None, help="stop after this many frames")
+    args = parser.parse_args()
+
+    video = int(args.video) if str(args.video).isdigit() else args.video
+    camera = cv2.VideoCapture(video)
+    screen = init_display(size[0], size[1], args.headless)
+
+    camera_surface = CameraSurface(size[0], size[1])
+    hud = PitchYawHUD()
+
+    pitch = 0
+    yaw = 0
+    frames = 0
+
+    try:
+        while args.frames is None or frames < args.frames:
+
+            ret, frame = camera.read()
+
+            if not ret:
+                if isinstance(video, str):
+                    break
+                continue
 
+            render_frame(screen, camera_surface, hud, frame, pitch, yaw)
+            frames += 1
 
-try:
-    while True:
-
-        ret, frame = camera.read()
-
-        if not ret: continue
-
-        screen.fill([0, 0, 0])
-        frame = cv2.resize(frame, dsize=(size[0], size[1]), interpolation=cv2.INTER_CUBIC)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frame = frame.swapaxes(0, 1)
-        pygame.surfarray.blit_array(screen, frame)
-        pygame.display.update()
-
-        hud.update(screen, pitch, yaw)
-
-        pitch += 1
-        yaw += 1
+            pitch += 1
+            yaw += 1
 
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                sys.exit(0)
-            elif event.type == KEYDOWN:
-                if event.key == K_ESCAPE or event.key == K_q:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
                     sys.exit(0)
-
-except (KeyboardInterrupt, SystemExit):
-    pygame.quit()
-    cv2.destroyAllWindows()
\ No newline at end of file
+                elif event.type == KEYDOWN:
+                    if event.key == K_ESCAPE or event.key == K_q:
+                        sys.exit(0)
+
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        camera.release()
+        pygame.quit()
+
+if __name__ == "__main__":
+    main()
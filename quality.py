@@ -0,0 +1,116 @@
+"""
+Adaptive quality control against a per-frame time budget.
+
+    controller = QualityController(budget_ms=33)
+    while True:
+        start = time.perf_counter()
+        ...  # work done with controller.settings
+        controller.update(time.perf_counter() - start)
+
+The controller steps through QUALITY_LEVELS one level at a time. It steps
+down as soon as a window of frames at the current level runs over budget,
+but steps back up only when the frames stay well under budget (lower)
+for a cooldown period, so it settles instead of oscillating between two
+levels. A step up that has to be undone straight away doubles that
+cooldown.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Tunable parameters of the analysis, from cheapest to best
+QualitySettings = namedtuple('QualitySettings', [
+    'max_points', 'min_points', 'max_level', 'win_size', 'iterations', 'interpolation',
+])
+
+QUALITY_LEVELS = [
+    QualitySettings(150, 90, 1, (9, 9), 4, cv2.INTER_NEAREST),
+    QualitySettings(300, 180, 1, (11, 11), 5, cv2.INTER_LINEAR),
+    QualitySettings(500, 300, 2, (13, 13), 7, cv2.INTER_LINEAR),
+    QualitySettings(750, 450, 2, (15, 15), 10, cv2.INTER_LINEAR),
+    # The fixed defaults used before the controller existed
+    QualitySettings(1000, 600, 2, (15, 15), 10, cv2.INTER_CUBIC),
+    QualitySettings(1000, 600, 3, (21, 21), 20, cv2.INTER_CUBIC),
+]
+DEFAULT_LEVEL = 4
+
+
+class QualityController:
+    """
+    Pick a quality level that keeps the per-frame time under a budget.
+
+    Args:
+        budget_ms: Target processing time per frame, in milliseconds
+        levels: QualitySettings from cheapest to best
+        level: Starting level index, defaults to DEFAULT_LEVEL
+        window: Number of recent frames the decisions are based on
+        upper: Step down when the recent mean exceeds upper * budget
+        lower: Step up when the recent mean stays below lower * budget
+        cooldown: Frames to wait after a change before stepping up again
+        max_cooldown: Limit for the cooldown as failed step ups double it
+    """
+
+    def __init__(self, budget_ms=33.0, levels=QUALITY_LEVELS, level=None, window=10,
+                 upper=1.0, lower=0.7, cooldown=30, max_cooldown=480):
+        self.budget = budget_ms / 1000
+        self.levels = levels
+        self.level = min(DEFAULT_LEVEL, len(levels) - 1) if level is None else level
+        self.window = window
+        self.upper = upper
+        self.lower = lower
+        self.cooldown = cooldown
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.last_step = 0
+
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.since_change = 0
+        self.changes = 0
+
+    @property
+    def settings(self):
+        """QualitySettings of the current level."""
+        return self.levels[self.level]
+
+    def mean(self):
+        """Mean of the recent frame times, in seconds."""
+        n = min(self.count, self.window)
+        return self.samples[:n].mean() if n else 0.0
+
+    def update(self, seconds):
+        """
+        Record the processing time of one frame.
+        Returns True when the quality level changed.
+        """
+        self.samples[self.count % self.window] = seconds
+        self.count += 1
+        self.since_change += 1
+
+        if self.count < self.window:
+            return False
+
+        mean = self.mean()
+        if mean > self.upper * self.budget and self.level > 0:
+            if self.last_step > 0 and self.since_change <= self.window:
+                # The level just stepped up to is too slow, wait longer before retrying
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            step = -1
+        elif (mean < self.lower * self.budget and self.since_change >= self.cooldown
+              and self.level < len(self.levels) - 1):
+            if self.last_step > 0:
+                # Two step ups in a row: the earlier one held, so the load eased
+                self.cooldown = self.base_cooldown
+            step = 1
+        else:
+            return False
+
+        self.level += step
+        self.last_step = step
+
+        # Judge the new level on its own frames only
+        self.since_change = 0
+        self.count = 0
+        self.changes += 1
+        return True
@@ -0,0 +1,350 @@
+"""
+Raw frame recordings that can be replayed in place of a camera.
+
+A recording is one file: a fixed header followed by fixed-size records,
+each holding a sequence number, a timestamp and the raw frame bytes.
+
+    offset 0              header (HEADER_SIZE bytes)
+    offset HEADER_SIZE    record 0: sequence u8, timestamp f8, frame
+                          record 1 ...
+
+The header's frame count is updated after every record is written, so a
+recording cut short by a crash or power loss is still readable up to the
+last complete frame. Records are laid out as a numpy structured array, so
+the replay side maps the file and indexes it without copying: frames,
+timestamps and sequence numbers are all views into the mmap.
+
+Record from a camera, then analyze the recording:
+
+    python recording.py record capture.rec --source 0 --frames 600
+    python recording.py info capture.rec
+    python batch.py capture.rec -o capture_results
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import cv2
+import numpy as np
+
+MAGIC = b'OFREC\x00\x00\x01'
+FORMAT_VERSION = 1
+
+# magic, version, width, height, channels, frame count, record size, fps, start time
+HEADER_FORMAT = '<8sIIIIQQdd'
+HEADER_SIZE = 4096
+COUNT_OFFSET = struct.calcsize('<8sIIII')
+
+RECORD_ALIGNMENT = 64
+
+
+def record_dtype(width, height, channels):
+    """Structured dtype of one record, padded to RECORD_ALIGNMENT bytes."""
+    frame_shape = (height, width, channels) if channels > 1 else (height, width)
+    fields = np.dtype([('sequence', '<u8'), ('timestamp', '<f8'), ('frame', np.uint8, frame_shape)])
+    itemsize = -(-fields.itemsize // RECORD_ALIGNMENT) * RECORD_ALIGNMENT
+    return np.dtype({'names': fields.names, 'formats': [fields.fields[n][0] for n in fields.names],
+                     'offsets': [fields.fields[n][1] for n in fields.names], 'itemsize': itemsize})
+
+
+def is_recording(path):
+    """True if path is a file starting with the recording magic."""
+    if not isinstance(path, (str, os.PathLike)) or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class FrameRecorder:
+    """
+    Append raw frames to a recording file.
+
+    The file is grown `grow_frames` records at a time and written through a
+    memory map, so appending a frame is one copy into the map.
+
+    Args:
+        path: Recording file to create
+        width: Frame width in pixels
+        height: Frame height in pixels
+        channels: 3 for BGR frames, 1 for grayscale
+        fps: Nominal frame rate stored in the header
+        grow_frames: Records added to the file each time it fills up
+    """
+
+    def __init__(self, path, width, height, channels=3, fps=30.0, grow_frames=64):
+        self.path = path
+        self.dtype = record_dtype(width, height, channels)
+        self.grow_frames = grow_frames
+        self.frame_shape = self.dtype['frame'].shape
+        self.start = time.perf_counter()
+        self.frames = 0
+
+        self.file = open(path, 'wb+')
+        header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, width, height, channels,
+                             0, self.dtype.itemsize, fps, time.time())
+        self.file.write(header.ljust(HEADER_SIZE, b'\x00'))
+        self.file.flush()
+
+        self.map = None
+        self.records = None
+        self.capacity = 0
+        self._grow()
+
+    def _grow(self):
+        self._unmap()
+        self.capacity += self.grow_frames
+        self.file.truncate(HEADER_SIZE + self.capacity * self.dtype.itemsize)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.records = np.frombuffer(self.map, dtype=self.dtype, count=self.capacity, offset=HEADER_SIZE)
+
+    def _unmap(self):
+        # Views into the map have to go before it can be closed
+        self.records = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def write(self, frame, timestamp=None):
+        """
+        Append a frame. The timestamp defaults to the seconds since the
+        recorder was created.
+        """
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the recording {self.frame_shape}")
+        if self.frames == self.capacity:
+            self._grow()
+
+        if timestamp is None:
+            timestamp = time.perf_counter() - self.start
+
+        index = self.frames
+        self.records['sequence'][index] = index
+        self.records['timestamp'][index] = timestamp
+        np.copyto(self.records['frame'][index], frame)
+
+        # Publish the frame only once it is complete
+        self.frames += 1
+        struct.pack_into('<Q', self.map, COUNT_OFFSET, self.frames)
+
+    def close(self):
+        """Trim the unused records off the end of the file."""
+        if self.file is None:
+            return
+        self._unmap()
+        self.file.truncate(HEADER_SIZE + self.frames * self.dtype.itemsize)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameReplay:
+    """
+    Replay a recording through the parts of the cv2.VideoCapture interface
+    used here (read, grab, get, set, isOpened, release).
+
+    read() returns views straight into the memory map. The map is opened
+    copy-on-write, so code drawing on a frame in place only copies the
+    pages it touches and never changes the file.
+
+    Args:
+        path: Recording file
+        realtime: Pace read() by the recorded timestamps instead of
+            returning frames as fast as possible
+        loop: Start over at the end instead of stopping
+    """
+
+    # Frames are views, so frames.FrameReader takes them as they are
+    zero_copy = True
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        (magic, version, self.width, self.height, self.channels, count, record_size,
+         self.fps, self.start_time) = struct.unpack_from(HEADER_FORMAT, self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a frame recording")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version: {version}")
+
+        dtype = record_dtype(self.width, self.height, self.channels)
+        if dtype.itemsize != record_size:
+            raise ValueError(f"Corrupt recording header in {path}")
+
+        # Never trust the count beyond what the file holds
+        count = min(count, (len(self.map) - HEADER_SIZE) // record_size)
+        self.records = np.frombuffer(self.map, dtype=dtype, count=count, offset=HEADER_SIZE)
+        self.frames = self.records['frame']
+        self.timestamps = self.records['timestamp']
+        self.sequence = self.records['sequence']
+
+        self.position = 0
+        self.clock_start = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def isOpened(self):
+        return self.map is not None
+
+    def grab(self):
+        if self.position >= len(self.records):
+            if not self.loop or len(self.records) == 0:
+                return False
+            self.position = 0
+            self.clock_start = None
+        self.position += 1
+        return True
+
+    def read(self, image=None):
+        """
+        Return (True, frame) for the next frame, or (False, None) at the end.
+        The frame is a view into the recording unless image is given, in which
+        case it is copied there.
+        """
+        if not self.grab():
+            return False, None
+        index = self.position - 1
+
+        if self.realtime:
+            self._wait(index)
+
+        frame = self.frames[index]
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def _wait(self, index):
+        """Sleep until frame index is due, relative to the first frame played."""
+        now = time.perf_counter()
+        if self.clock_start is None:
+            self.clock_start = now - self.timestamps[index]
+        delay = self.clock_start + self.timestamps[index] - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.records))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_POS_MSEC and self.position > 0:
+            return float(self.timestamps[self.position - 1] * 1000)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(min(max(value, 0), len(self.records)))
+            self.clock_start = None
+            return True
+        # Camera settings have no meaning for a recording
+        return False
+
+    def release(self):
+        self.records = self.frames = self.timestamps = self.sequence = None
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # Frames handed out are still alive; the map closes when they go
+                pass
+            self.map = None
+
+
+def open_capture(source, realtime=False):
+    """
+    Open a camera index, video file or recording as a capture.
+    Recordings are replayed with FrameReplay, anything else goes to cv2.VideoCapture.
+    """
+    if is_recording(source):
+        return FrameReplay(source, realtime=realtime)
+    return cv2.VideoCapture(source)
+
+
+def parse_source(value):
+    """Command line source argument: a camera index or a path."""
+    return int(value) if str(value).isdigit() else value
+
+
+def record(source, path, frames=None, duration=None):
+    """
+    Record frames from a capture source until it ends, frames have been
+    written or duration seconds have passed.
+
+    Returns:
+        Number of frames recorded
+    """
+    cap = open_capture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open {source}")
+
+    ret, frame = cap.read()
+    if not ret:
+        raise ValueError(f"Could not read from {source}")
+
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    # Frames from a file keep the file's own timing rather than the decode speed
+    from_file = isinstance(source, str)
+
+    start = time.perf_counter()
+    with FrameRecorder(path, width, height, channels, fps) as recorder:
+        while ret:
+            recorder.write(frame, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 if from_file else None)
+            if frames is not None and recorder.frames >= frames:
+                break
+            if duration is not None and time.perf_counter() - start >= duration:
+                break
+            ret, frame = cap.read()
+    cap.release()
+
+    print(f"Recorded {recorder.frames} frames of {width}x{height} to {path}")
+    return recorder.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and inspect raw frame recordings")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="record frames from a camera or video")
+    record_parser.add_argument('output', help="recording file to write")
+    record_parser.add_argument('--source', default='0', help="camera index or video file (default: 0)")
+    record_parser.add_argument('--frames', type=int, default=None, help="stop after this many frames")
+    record_parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+
+    info_parser = commands.add_parser('info', help="print a recording's header")
+    info_parser.add_argument('recording')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(parse_source(args.source), args.output, args.frames, args.duration)
+    else:
+        replay = FrameReplay(args.recording)
+        span = replay.timestamps[-1] - replay.timestamps[0] if len(replay) else 0.0
+        print(f"{args.recording}: {len(replay)} frames of {replay.width}x{replay.height}x{replay.channels}, "
+              f"{span:.1f}s, nominal {replay.fps:.1f} fps, recorded {time.ctime(replay.start_time)}")
+        replay.release()
+
+
+if __name__ == "__main__":
+    main()
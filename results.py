@@ -0,0 +1,186 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# One analyzed frame as read back from a results directory
+FrameRecord = namedtuple('FrameRecord', [
+    'frame_index', 'points', 'prev_points', 'outliers', 'camera_motion', 'boxes',
+])
+
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+
+
+class ResultWriter:
+    """
+    Write per-frame analysis results as a directory of columnar .npz chunks.
+
+    Every chunk holds `chunk_size` frames. Variable length data (points,
+    boxes) is stored flat, with an offsets array giving each frame's slice.
+    index.json lists the chunks and the frame range each one covers.
+
+    Args:
+        path: Output directory, created if needed
+        chunk_size: Number of frames per chunk
+        compress: Use np.savez_compressed instead of np.savez
+        metadata: Extra JSON-serializable information stored in the index
+    """
+
+    def __init__(self, path, chunk_size=256, compress=False, metadata=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.metadata = metadata or {}
+
+        os.makedirs(path, exist_ok=True)
+        self.chunks = []
+        self.frames = 0
+        self._reset()
+
+    def _reset(self):
+        self.frame_index = []
+        self.points = []
+        self.prev_points = []
+        self.outliers = []
+        self.camera_motion = []
+        self.boxes = []
+
+    def write(self, frame_index, points=None, prev_points=None, outliers=None,
+              camera_motion=None, boxes=None):
+        """
+        Add the results of one frame. Missing values are stored as empty
+        arrays, and a missing camera motion as NaN.
+        """
+        if points is None:
+            points = np.empty((0, 2), dtype=np.float32)
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+
+        if prev_points is None:
+            prev_points = np.empty((0, 2), dtype=np.float32)
+        prev_points = np.asarray(prev_points, dtype=np.float32).reshape(-1, 2)
+
+        if outliers is None:
+            outliers = np.zeros(len(points), dtype=bool)
+
+        if camera_motion is None:
+            camera_motion = (np.nan, np.nan)
+
+        if boxes is None:
+            boxes = np.empty((0, 4), dtype=np.int32)
+
+        self.frame_index.append(frame_index)
+        self.points.append(points)
+        self.prev_points.append(prev_points)
+        self.outliers.append(np.asarray(outliers, dtype=bool))
+        self.camera_motion.append(camera_motion)
+        self.boxes.append(np.asarray(boxes, dtype=np.int32).reshape(-1, 4))
+        self.frames += 1
+
+        if len(self.frame_index) >= self.chunk_size:
+            self.flush()
+
+    def write_record(self, record):
+        self.write(*record)
+
+    def flush(self):
+        """Write the buffered frames as a new chunk."""
+        if not self.frame_index:
+            return
+
+        name = f"chunk_{len(self.chunks):06d}.npz"
+        save = np.savez_compressed if self.compress else np.savez
+        save(
+            os.path.join(self.path, name),
+            frame_index=np.asarray(self.frame_index, dtype=np.int64),
+            point_offsets=_offsets(self.points),
+            points=np.concatenate(self.points),
+            prev_points=np.concatenate(self.prev_points),
+            outliers=np.concatenate(self.outliers),
+            camera_motion=np.asarray(self.camera_motion, dtype=np.float32),
+            box_offsets=_offsets(self.boxes),
+            boxes=np.concatenate(self.boxes),
+        )
+
+        self.chunks.append({
+            'file': name,
+            'first_frame': int(self.frame_index[0]),
+            'last_frame': int(self.frame_index[-1]),
+            'frames': len(self.frame_index),
+        })
+        self._reset()
+
+    def close(self):
+        """Flush the last chunk and write the index."""
+        self.flush()
+        index = {
+            'version': FORMAT_VERSION,
+            'frames': self.frames,
+            'chunks': self.chunks,
+            'metadata': self.metadata,
+        }
+        with open(os.path.join(self.path, INDEX_FILE), 'w') as f:
+            json.dump(index, f, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultReader:
+    """
+    Read a results directory written by ResultWriter.
+
+    Iterating yields one FrameRecord per frame, in the order written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        if self.index['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported results version: {self.index['version']}")
+
+    @property
+    def metadata(self):
+        return self.index['metadata']
+
+    @property
+    def chunks(self):
+        return self.index['chunks']
+
+    def __len__(self):
+        return self.index['frames']
+
+    def load_chunk(self, chunk):
+        """Return the arrays of one chunk entry from the index as a dict."""
+        with np.load(os.path.join(self.path, chunk['file'])) as data:
+            return {key: data[key] for key in data.files}
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            data = self.load_chunk(chunk)
+            point_offsets = data['point_offsets']
+            box_offsets = data['box_offsets']
+
+            for i, frame_index in enumerate(data['frame_index']):
+                p0, p1 = point_offsets[i], point_offsets[i + 1]
+                b0, b1 = box_offsets[i], box_offsets[i + 1]
+                yield FrameRecord(
+                    int(frame_index),
+                    data['points'][p0:p1],
+                    data['prev_points'][p0:p1],
+                    data['outliers'][p0:p1],
+                    data['camera_motion'][i],
+                    data['boxes'][b0:b1],
+                )
+
+
+def _offsets(arrays):
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    return offsets
@@ -0,0 +1,169 @@
+"""
+Lock-free single-writer ring of analysis results in shared memory.
+
+The analysis process publishes frames with their camera motion, integrated
+pitch/yaw and tracked points into a multiprocessing.shared_memory block; a
+display process in another interpreter reads the newest one. Neither side
+ever waits for the other:
+
+    writer (analysis process)               reader (display process)
+    ring = FrameRing.create(...)            ring = FrameRing.attach(name)
+    ring.publish(frame, ...)                i, seq = ring.latest()
+                                            ...render from ring.frames[i]...
+                                            if not ring.still_valid(i, seq): skip
+
+Every slot carries a sequence number used as a seqlock: it is odd while
+the writer fills the slot and even once the slot is complete. A reader
+works straight on the slot's memory, then checks the sequence is unchanged
+to know the writer did not lap it in the meantime. With a few slots the
+writer has to publish several frames during one render for that to happen.
+"""
+import struct
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# slots, height, width, channels, max points, published count
+HEADER_FORMAT = '<6Q'
+HEADER_SIZE = 64
+PUBLISHED_OFFSET = struct.calcsize('<5Q')
+
+
+def slot_dtype(width, height, channels, max_points):
+    return np.dtype([
+        ('sequence', '<u8'),
+        ('timestamp', '<f8'),
+        ('pitch', '<f8'),
+        ('yaw', '<f8'),
+        ('camera_motion', '<f4', (2,)),
+        ('point_count', '<u4'),
+        ('points', '<f4', (max_points, 2)),
+        ('outliers', 'u1', (max_points,)),
+        ('frame', 'u1', (height, width, channels)),
+    ], align=True)
+
+
+class FrameRing:
+    """
+    Ring of result slots in a shared memory block. Use FrameRing.create()
+    in the owning process and FrameRing.attach() everywhere else.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+
+        slots, height, width, channels, max_points, _ = struct.unpack_from(HEADER_FORMAT, shm.buf)
+        self.slot_count = slots
+        self.max_points = max_points
+        self.frame_shape = (height, width, channels)
+        self.dtype = slot_dtype(width, height, channels, max_points)
+        self.slots = np.ndarray((slots,), dtype=self.dtype, buffer=shm.buf, offset=HEADER_SIZE)
+        self.published = np.ndarray((), dtype='<u8', buffer=shm.buf, offset=PUBLISHED_OFFSET)
+
+        # Per-field views, indexed by slot
+        self.sequences = self.slots['sequence']
+        self.timestamps = self.slots['timestamp']
+        self.pitch = self.slots['pitch']
+        self.yaw = self.slots['yaw']
+        self.camera_motion = self.slots['camera_motion']
+        self.point_counts = self.slots['point_count']
+        self.points = self.slots['points']
+        self.outliers = self.slots['outliers']
+        self.frames = self.slots['frame']
+
+    @classmethod
+    def create(cls, width, height, channels=3, max_points=2000, slots=4, name=None):
+        """Allocate a new ring, owned (and unlinked on close) by this process."""
+        dtype = slot_dtype(width, height, channels, max_points)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + slots * dtype.itemsize)
+        struct.pack_into(HEADER_FORMAT, shm.buf, 0, slots, height, width, channels, max_points, 0)
+        ring = cls(shm, owner=True)
+        ring.sequences[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Open a ring created by another process. Attach from a process started
+        by the owner through multiprocessing: it shares the owner's resource
+        tracker, which would otherwise unlink the block when this process exits.
+        """
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    def publish(self, frame, pitch=0.0, yaw=0.0, camera_motion=(0.0, 0.0), points=None, outliers=None):
+        """
+        Write a result into the next slot. Never blocks; a slow reader just
+        misses frames. A frame of another size is resized straight into the
+        slot; points are stored as given. Points beyond max_points are left out.
+        """
+        count = int(self.published)
+        i = count % self.slot_count
+        sequence = 2 * count + 1
+
+        # Odd sequence: slot is being written
+        self.sequences[i] = sequence
+        self.timestamps[i] = time.time()
+        self.pitch[i] = pitch
+        self.yaw[i] = yaw
+        self.camera_motion[i] = camera_motion
+
+        n = 0
+        if points is not None:
+            points = points.reshape(-1, 2)
+            n = min(len(points), self.max_points)
+            self.points[i, :n] = points[:n]
+            self.outliers[i, :n] = outliers[:n] if outliers is not None else 0
+        self.point_counts[i] = n
+        if frame.shape == self.frame_shape:
+            np.copyto(self.frames[i], frame)
+        else:
+            cv2.resize(frame, (self.frame_shape[1], self.frame_shape[0]), dst=self.frames[i])
+
+        # Even sequence: slot is complete, then announce it
+        self.sequences[i] = sequence + 1
+        self.published[...] = count + 1
+
+    def latest(self, after=0):
+        """
+        Newest complete slot published after sequence `after`.
+        Returns (slot index, sequence), or None when there is nothing new.
+        The slot's fields are views into shared memory: check still_valid()
+        after using them.
+        """
+        count = int(self.published)
+        # The newest slot may already be written over again; fall back to older ones
+        for k in range(min(count, self.slot_count)):
+            i = (count - 1 - k) % self.slot_count
+            sequence = int(self.sequences[i])
+            if sequence <= after:
+                return None
+            if sequence % 2 == 0:
+                return i, sequence
+        return None
+
+    def pending(self, after=0):
+        """
+        Every complete slot published after sequence `after`, oldest first,
+        as (slot index, sequence) pairs. Meant for draining the ring once
+        the writer has stopped; with a live writer, prefer latest().
+        """
+        slots = [(i, int(self.sequences[i])) for i in range(self.slot_count)]
+        slots = [(i, sequence) for i, sequence in slots if sequence > after and sequence % 2 == 0]
+        return sorted(slots, key=lambda slot: slot[1])
+
+    def still_valid(self, i, sequence):
+        """True if slot i still holds the result it held at `sequence`."""
+        return int(self.sequences[i]) == sequence
+
+    def close(self):
+        # Views into the block have to go before it can be closed
+        self.slots = self.published = self.sequences = self.timestamps = None
+        self.pitch = self.yaw = self.camera_motion = self.point_counts = None
+        self.points = self.outliers = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,473 @@
+import numpy as np
+import cv2
+import fcntl
+import mmap
+import struct
+from collections import namedtuple
+
+# ioctl requests from linux/fb.h
+FBIOGET_VSCREENINFO = 0x4600
+FBIOGET_FSCREENINFO = 0x4602
+FBIOPAN_DISPLAY = 0x4606
+FBIO_WAITFORVSYNC = 0x40044620  # _IOW('F', 0x20, __u32)
+
+# struct fb_var_screeninfo: 40 __u32 fields
+VAR_SCREENINFO_FORMAT = '40I'
+VarScreenInfo = namedtuple('VarScreenInfo', [
+    'xres', 'yres', 'xres_virtual', 'yres_virtual', 'xoffset', 'yoffset',
+    'bits_per_pixel', 'grayscale',
+    'red_offset', 'red_length', 'red_msb_right',
+    'green_offset', 'green_length', 'green_msb_right',
+    'blue_offset', 'blue_length', 'blue_msb_right',
+    'transp_offset', 'transp_length', 'transp_msb_right',
+    'nonstd', 'activate', 'height', 'width', 'accel_flags',
+    'pixclock', 'left_margin', 'right_margin', 'upper_margin', 'lower_margin',
+    'hsync_len', 'vsync_len', 'sync', 'vmode', 'rotate', 'colorspace',
+    'reserved0', 'reserved1', 'reserved2', 'reserved3',
+])
+
+# struct fb_fix_screeninfo, with native alignment and trailing padding
+FIX_SCREENINFO_FORMAT = '@16sL4I3HIL2I3H0L'
+FixScreenInfo = namedtuple('FixScreenInfo', [
+    'id', 'smem_start', 'smem_len', 'type', 'type_aux', 'visual',
+    'xpanstep', 'ypanstep', 'ywrapstep', 'line_length',
+    'mmio_start', 'mmio_len', 'accel', 'capabilities', 'reserved0', 'reserved1',
+])
+
+# Bitfield layouts as (red, green, blue, transp) (offset, length) pairs
+PIXEL_FORMATS = {
+    'RGB565': (16, (11, 5), (5, 6), (0, 5), (0, 0)),
+    'BGR565': (16, (0, 5), (5, 6), (11, 5), (0, 0)),
+    'RGB888': (24, (16, 8), (8, 8), (0, 8), (0, 0)),
+    'BGR888': (24, (0, 8), (8, 8), (16, 8), (0, 0)),
+    'BGRA8888': (32, (16, 8), (8, 8), (0, 8), (24, 8)),
+    'RGBA8888': (32, (0, 8), (8, 8), (16, 8), (24, 8)),
+}
+
+
+def read_screeninfo(fd):
+    """Query the variable and fixed screen information of a framebuffer device."""
+    var_info = VarScreenInfo(*struct.unpack(VAR_SCREENINFO_FORMAT,
+        fcntl.ioctl(fd, FBIOGET_VSCREENINFO,
+                    bytes(struct.calcsize(VAR_SCREENINFO_FORMAT)))))
+
+    fix_info = FixScreenInfo(*struct.unpack(FIX_SCREENINFO_FORMAT,
+        fcntl.ioctl(fd, FBIOGET_FSCREENINFO,
+                    bytes(struct.calcsize(FIX_SCREENINFO_FORMAT))))[:16])
+
+    return var_info, fix_info
+
+
+def fake_screeninfo(xres, yres, pixel_format='RGB565', yres_virtual=None):
+    """Build screen information describing a framebuffer that is a regular file.
+
+    Args:
+        xres: visible width in pixels
+        yres: visible height in pixels
+        pixel_format: one of the keys of PIXEL_FORMATS
+        yres_virtual: virtual height in pixels, defaults to yres
+
+    Returns:
+        (VarScreenInfo, FixScreenInfo) tuple
+    """
+    bits_per_pixel, red, green, blue, transp = PIXEL_FORMATS[pixel_format]
+    if yres_virtual is None:
+        yres_virtual = yres
+
+    line_length = xres * bits_per_pixel // 8
+
+    fields = dict.fromkeys(VarScreenInfo._fields, 0)
+    fields.update(
+        xres=xres, yres=yres, xres_virtual=xres, yres_virtual=yres_virtual,
+        bits_per_pixel=bits_per_pixel,
+        red_offset=red[0], red_length=red[1],
+        green_offset=green[0], green_length=green[1],
+        blue_offset=blue[0], blue_length=blue[1],
+        transp_offset=transp[0], transp_length=transp[1],
+    )
+    var_info = VarScreenInfo(**fields)
+
+    fields = dict.fromkeys(FixScreenInfo._fields, 0)
+    fields.update(id=b'fake', smem_len=line_length * yres_virtual, line_length=line_length)
+    fix_info = FixScreenInfo(**fields)
+
+    return var_info, fix_info
+
+
+def create_fake_framebuffer(path, xres, yres, pixel_format='RGB565', yres_virtual=None):
+    """Create a zero filled file that can stand in for /dev/fb0.
+
+    Returns:
+        (VarScreenInfo, FixScreenInfo) tuple to pass to FrameBuffer
+    """
+    var_info, fix_info = fake_screeninfo(xres, yres, pixel_format, yres_virtual)
+    with open(path, 'wb') as f:
+        f.truncate(fix_info.smem_len)
+    return var_info, fix_info
+
+
+def subtract_rect(rect, cover):
+    """Split an (x, y, w, h) rectangle into the up to four parts outside cover."""
+    x, y, w, h = rect
+    cx, cy, cw, ch = cover
+    x0, y0 = max(x, cx), max(y, cy)
+    x1, y1 = min(x + w, cx + cw), min(y + h, cy + ch)
+    if x1 <= x0 or y1 <= y0:
+        return [rect]
+
+    parts = []
+    if y0 > y:
+        parts.append((x, y, w, y0 - y))
+    if y1 < y + h:
+        parts.append((x, y1, w, y + h - y1))
+    if x0 > x:
+        parts.append((x, y0, x0 - x, y1 - y0))
+    if x1 < x + w:
+        parts.append((x1, y0, x + w - x1, y1 - y0))
+    return parts
+
+
+def subtract_rects(rect, covers):
+    """Parts of rect that none of the covers overlap, as a list of rectangles."""
+    parts = [rect]
+    for cover in covers:
+        parts = [piece for part in parts for piece in subtract_rect(part, cover)]
+        if not parts:
+            break
+    return parts
+
+
+class FrameBuffer:
+    """Class to handle direct framebuffer access on Raspberry Pi.
+
+    Frames are converted straight into a numpy view of the memory mapped
+    framebuffer, using the channel offsets the device reports.
+
+    In double buffer mode frames are drawn into the page that is not being
+    scanned out and then shown with FBIOPAN_DISPLAY. This needs a virtual
+    height of at least twice the visible height; otherwise the framebuffer
+    falls back to a single buffer.
+
+    When var_info and fix_info are given, the device is treated as a regular
+    file: no ioctls are issued and page flips only update the tracked state.
+
+    Only the dirty parts of a frame are written when display_frame() is given
+    a list of changed rectangles, or when tile_size is set, in which case the
+    frame is compared tile by tile against a shadow copy of the last frame.
+
+    Args:
+        device: path of the framebuffer device, or of a regular file
+        var_info: VarScreenInfo to use instead of querying the device
+        fix_info: FixScreenInfo to use instead of querying the device
+        double_buffer: draw into a back page and flip instead of drawing
+            into the visible page
+        vsync: wait for vertical sync after each flip
+        tile_size: (width, height) of the tiles compared against the shadow
+            copy, or None to write whole frames
+    """
+
+    def __init__(self, device='/dev/fb0', var_info=None, fix_info=None, double_buffer=False, vsync=False,
+                 tile_size=None):
+        # Open the framebuffer device
+        self.fb = open(device, 'rb+')
+
+        # Get variable and fixed screen information
+        self.is_device = var_info is None or fix_info is None
+        if self.is_device:
+            var_info, fix_info = read_screeninfo(self.fb.fileno())
+        self.var_info = var_info
+        self.fix_info = fix_info
+
+        self.xres = var_info.xres
+        self.yres = var_info.yres
+        self.bits_per_pixel = var_info.bits_per_pixel
+        self.bytes_per_pixel = self.bits_per_pixel // 8
+        self.line_length = fix_info.line_length or var_info.xres_virtual * self.bytes_per_pixel
+
+        print(f"Screen size: {self.xres}x{self.yres}")
+
+        # Map the framebuffer to memory
+        self.fb_size = fix_info.smem_len or self.line_length * var_info.yres_virtual
+        self.fb_map = mmap.mmap(self.fb.fileno(), self.fb_size, mmap.MAP_SHARED, mmap.PROT_WRITE|mmap.PROT_READ)
+        self.fb_array = np.frombuffer(self.fb_map, dtype=np.uint8)
+
+        # Pages start at these rows of the virtual screen
+        self.page_offsets = [0]
+        if double_buffer:
+            if var_info.yres_virtual >= 2 * self.yres and self.fb_size >= 2 * self.yres * self.line_length:
+                self.page_offsets = [0, self.yres]
+            else:
+                print(f"Virtual height {var_info.yres_virtual} too small to flip, using a single buffer")
+        self.pages = [self.page_view(offset) for offset in self.page_offsets]
+
+        # The front page is scanned out, the back page is the one drawn into
+        self.vsync = vsync
+        self.front = 0
+        self.back = 0
+        if len(self.pages) > 1:
+            try:
+                self.pan(self.page_offsets[0])
+                self.back = 1
+            except OSError as e:
+                print(f"Page flipping not supported ({e}), using a single buffer")
+                self.page_offsets = self.page_offsets[:1]
+                self.pages = self.pages[:1]
+        self.screen = self.pages[self.back]
+
+        # Rectangles each page is missing because they changed while it was the front page
+        self.stale = [[] for _ in self.pages]
+
+        # Dirty tracking against a shadow copy of the last frame
+        self.tile_size = tile_size
+        self.shadow = None
+        if tile_size is not None:
+            tile_w, tile_h = tile_size
+            self.shadow = np.empty((self.yres, self.xres, 3), dtype=np.uint8)
+            self.shadow_valid = False
+            self.diff = np.empty((self.yres, self.xres * 3), dtype=bool)
+            self.tile_rows = np.arange(0, self.yres, tile_h)
+            self.tile_cols = np.arange(0, self.xres, tile_w)
+
+        # Bytes written into the framebuffer, for the last frame and in total
+        self.bytes_written = 0
+        self.total_bytes_written = 0
+        self.frames_written = 0
+
+        # Scratch buffers, allocated once
+        self.resized = np.empty((self.yres, self.xres, 3), dtype=np.uint8)
+        if self.bits_per_pixel == 16:
+            self.packed = np.empty((self.yres, self.xres), dtype=np.uint16)
+            self.channel = np.empty((self.yres, self.xres), dtype=np.uint16)
+
+        self.convert = self._select_converter()
+
+    def page_view(self, y_offset):
+        """Return a writable numpy view of the visible area starting at row y_offset.
+
+        The view has shape (yres, xres) with uint16 pixels for 16 bpp, and
+        (yres, xres, bytes_per_pixel) with uint8 channels otherwise.
+        """
+        start = y_offset * self.line_length
+        rows = self.fb_array[start:start + self.yres * self.line_length]
+        rows = rows.reshape(self.yres, self.line_length)
+
+        if self.bits_per_pixel == 16:
+            return rows.view(np.uint16)[:, :self.xres]
+        return rows[:, :self.xres * self.bytes_per_pixel].reshape(self.yres, self.xres, self.bytes_per_pixel)
+
+    @property
+    def double_buffered(self):
+        return len(self.pages) > 1
+
+    def pan(self, y_offset):
+        """Scan out the virtual screen starting at row y_offset."""
+        var_info = self.var_info._replace(xoffset=0, yoffset=y_offset)
+        if self.is_device:
+            fcntl.ioctl(self.fb.fileno(), FBIOPAN_DISPLAY, struct.pack(VAR_SCREENINFO_FORMAT, *var_info))
+        self.var_info = var_info
+
+    def wait_for_vsync(self):
+        if self.is_device:
+            fcntl.ioctl(self.fb.fileno(), FBIO_WAITFORVSYNC, struct.pack('I', 0))
+
+    def flip(self):
+        """Show the back page and start drawing into the other one.
+
+        Does nothing in single buffer mode.
+        """
+        if not self.double_buffered:
+            return
+
+        self.pan(self.page_offsets[self.back])
+        if self.vsync:
+            try:
+                self.wait_for_vsync()
+            except OSError as e:
+                print(f"Waiting for vsync not supported ({e})")
+                self.vsync = False
+
+        self.front, self.back = self.back, self.front
+        self.screen = self.pages[self.back]
+
+    def changed_tiles(self, frame):
+        """Return the rectangles of tiles that differ from the shadow copy.
+
+        Changed tiles are merged into horizontal runs, one (x, y, w, h)
+        rectangle per run, and copied into the shadow.
+        """
+        if not self.shadow_valid:
+            np.copyto(self.shadow, frame)
+            self.shadow_valid = True
+            return [(0, 0, self.xres, self.yres)]
+
+        tile_w, tile_h = self.tile_size
+
+        # Compare every byte, then OR the comparison down to one flag per tile
+        np.not_equal(frame.reshape(self.yres, -1), self.shadow.reshape(self.yres, -1), out=self.diff)
+        changed_rows = self.diff.any(axis=1)
+        if not changed_rows.any():
+            return []
+        tiles = np.logical_or.reduceat(self.diff, self.tile_rows, axis=0)
+        tiles = np.logical_or.reduceat(tiles, self.tile_cols * 3, axis=1)
+
+        rects = []
+        for row, col_flags in enumerate(tiles):
+            if not col_flags.any():
+                continue
+
+            # Start and end columns of each run of changed tiles
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], col_flags.view(np.int8), [0]))))
+            y = row * tile_h
+            h = min(tile_h, self.yres - y)
+            for start, end in zip(edges[::2], edges[1::2]):
+                x = start * tile_w
+                w = min(end * tile_w, self.xres) - x
+                rects.append((int(x), y, int(w), h))
+                np.copyto(self.shadow[y:y + h, x:x + w], frame[y:y + h, x:x + w])
+
+        return rects
+
+    def write_rects(self, frame, rects):
+        """Convert the given (x, y, w, h) rectangles of frame into the back page."""
+        # The back page also needs whatever changed while it was being shown,
+        # except for the parts this frame writes anyway
+        pending = list(rects)
+        for rect in self.stale[self.back]:
+            pending.extend(subtract_rects(rect, rects))
+        self.stale[self.back] = []
+        for page, stale in enumerate(self.stale):
+            if page != self.back:
+                stale.extend(rects)
+
+        written = 0
+        for x, y, w, h in pending:
+            self.convert(frame[y:y + h, x:x + w], self.screen[y:y + h, x:x + w])
+            written += w * h * self.bytes_per_pixel
+
+        self.bytes_written = written
+        self.total_bytes_written += written
+        self.frames_written += 1
+
+    def write_stats(self):
+        """Return framebuffer bandwidth statistics."""
+        full_frame = self.xres * self.yres * self.bytes_per_pixel
+        frames = max(self.frames_written, 1)
+        return {
+            'frames': self.frames_written,
+            'bytes_last_frame': self.bytes_written,
+            'bytes_per_frame': self.total_bytes_written / frames,
+            'fraction_of_full_frame': self.total_bytes_written / (frames * full_frame),
+        }
+
+    def channel_layout(self):
+        """Return the (offset, length) bitfields of red, green, blue and transp."""
+        info = self.var_info
+        return (
+            (info.red_offset, info.red_length),
+            (info.green_offset, info.green_length),
+            (info.blue_offset, info.blue_length),
+            (info.transp_offset, info.transp_length),
+        )
+
+    def _select_converter(self):
+        red, green, blue, transp = self.channel_layout()
+
+        if self.bits_per_pixel == 16:
+            if (red, green, blue) == ((11, 5), (5, 6), (0, 5)):
+                return self._convert_rgb565
+            return self._convert_packed16
+
+        if self.bits_per_pixel not in (24, 32):
+            raise ValueError(f"Unsupported framebuffer depth: {self.bits_per_pixel} bpp")
+
+        # Byte index of each channel inside a pixel (little endian)
+        self.byte_order = tuple(offset // 8 for offset, _ in (red, green, blue))
+        self.alpha_byte = transp[0] // 8 if transp[1] else None
+
+        if self.bits_per_pixel == 24:
+            if self.byte_order == (2, 1, 0):
+                return self._convert_cv(cv2.COLOR_RGB2BGR)
+            if self.byte_order == (0, 1, 2):
+                return self._convert_copy
+        else:
+            if self.byte_order == (2, 1, 0):
+                return self._convert_cv(cv2.COLOR_RGB2BGRA)
+            if self.byte_order == (0, 1, 2):
+                return self._convert_cv(cv2.COLOR_RGB2RGBA)
+        return self._convert_channels
+
+    def _convert_rgb565(self, frame, dst):
+        cv2.cvtColor(frame, cv2.COLOR_RGB2BGR565, dst=dst.view(np.uint8).reshape(dst.shape + (2,)))
+
+    def _convert_packed16(self, frame, dst):
+        (r_off, r_len), (g_off, g_len), (b_off, b_len), _ = self.channel_layout()
+        h, w = dst.shape
+        packed = self.packed[:h, :w]
+        channel = self.channel[:h, :w]
+
+        np.right_shift(frame[:, :, 0], 8 - r_len, out=packed)
+        np.left_shift(packed, r_off, out=packed)
+
+        np.right_shift(frame[:, :, 1], 8 - g_len, out=channel)
+        np.left_shift(channel, g_off, out=channel)
+        np.bitwise_or(packed, channel, out=packed)
+
+        np.right_shift(frame[:, :, 2], 8 - b_len, out=channel)
+        np.left_shift(channel, b_off, out=channel)
+        np.bitwise_or(packed, channel, out=dst)
+
+    def _convert_cv(self, code):
+        def convert(frame, dst):
+            cv2.cvtColor(frame, code, dst=dst)
+        return convert
+
+    def _convert_copy(self, frame, dst):
+        np.copyto(dst, frame)
+
+    def _convert_channels(self, frame, dst):
+        for i, byte in enumerate(self.byte_order):
+            dst[:, :, byte] = frame[:, :, i]
+        if self.alpha_byte is not None:
+            dst[:, :, self.alpha_byte] = 255
+
+    def display_frame(self, frame, dirty_rects=None):
+        """Display a numpy array as a frame.
+
+        Args:
+            frame: numpy array of shape (height, width, 3) with uint8 RGB values
+            dirty_rects: optional list of (x, y, w, h) rectangles, in framebuffer
+                pixels, that changed since the last frame
+        """
+        # Ensure frame matches framebuffer dimensions
+        if frame.shape[:2] != (self.yres, self.xres):
+            frame = cv2.resize(frame, (self.xres, self.yres), dst=self.resized)
+
+        if dirty_rects is not None:
+            rects = [rect for rect in map(self.clip_rect, dirty_rects) if rect is not None]
+            if self.shadow is not None:
+                for x, y, w, h in rects:
+                    np.copyto(self.shadow[y:y + h, x:x + w], frame[y:y + h, x:x + w])
+        elif self.tile_size is not None:
+            rects = self.changed_tiles(frame)
+        else:
+            rects = [(0, 0, self.xres, self.yres)]
+
+        # Convert straight into the mapped framebuffer memory
+        self.write_rects(frame, rects)
+        self.flip()
+
+    def clip_rect(self, rect):
+        x, y, w, h = rect
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.xres), min(y + h, self.yres)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def __del__(self):
+        # Views must be released before the mapping can be closed
+        self.screen = None
+        self.pages = None
+        self.fb_array = None
+        self.fb_map.close()
+        self.fb.close()
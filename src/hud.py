@@ -0,0 +1,305 @@
+import numpy as np
+import cv2
+
+
+class HUDTape:
+    """Pre-rendered RGBA scale that is blended into a frame one window at a time.
+
+    Args:
+        rgba: numpy array of shape (height, width, 4) with uint8 color and alpha
+    """
+
+    def __init__(self, rgba):
+        self.rgba = rgba
+
+        # Premultiply once so a blend is one scaled multiply and one add
+        alpha = rgba[:, :, 3:4].astype(np.uint16)
+        self.inverse_alpha = np.repeat(255 - alpha, 3, axis=2).astype(np.uint8)
+        self.premultiplied = ((rgba[:, :, :3] * alpha + 127) // 255).astype(np.uint8)
+
+        self.scratch = None
+
+    @classmethod
+    def from_canvas(cls, canvas, color):
+        """Build a tape from white-on-black drawing coverage in a 3 channel canvas."""
+        rgba = np.empty(canvas.shape[:2] + (4,), dtype=np.uint8)
+        rgba[:, :, :3] = color
+        rgba[:, :, 3] = canvas.max(axis=2)
+        return cls(rgba)
+
+    def blend(self, dst, x, y):
+        """Alpha-blend the window of the tape starting at (x, y) into dst in place.
+
+        Args:
+            dst: numpy array of shape (height, width, 3) with uint8 values, usually
+                a view into the frame
+            x: left column of the window in the tape
+            y: top row of the window in the tape
+        """
+        h, w = dst.shape[:2]
+        if self.scratch is None or self.scratch.shape != dst.shape:
+            self.scratch = np.empty(dst.shape, dtype=np.uint8)
+
+        cv2.multiply(dst, self.inverse_alpha[y:y + h, x:x + w], dst=self.scratch, scale=1/255)
+        cv2.add(self.scratch, self.premultiplied[y:y + h, x:x + w], dst=dst)
+
+
+class PitchYawHUD:
+    def __init__(self, width=800, height=600, use_tapes=True):
+        self.width = width
+        self.height = height
+        self.use_tapes = use_tapes
+        
+        # Colors (in BGR for OpenCV)
+        self.WHITE = (255, 255, 255)
+        self.GRAY = (128, 128, 128)
+        self.BLACK = (0, 0, 0)
+        
+        # HUD dimensions
+        self.YAW_HEIGHT = 40
+        self.PITCH_WIDTH = 40
+        
+        # Tick marks
+        self.MAJOR_TICK_LENGTH = 15
+        self.MINOR_TICK_LENGTH = 8
+        self.LABEL_OFFSET = 20
+        
+        # Font
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.font_scale = 0.4
+        
+        # Cardinal directions for yaw
+        self.cardinal_directions = {
+            0: "N", 45: "NE", 90: "E", 135: "SE",
+            180: "S", 225: "SW", 270: "W", 315: "NW"
+        }
+
+        # Pre-rendered scales, rebuilt by build_tapes() when the key changes
+        self.tape_key = None
+        self.yaw_tape = None
+        self.pitch_tape = None
+        self.pitch_tape_x = 0
+        self.pitch_tape_pad = 0
+    
+    def draw_text(self, img, text, pos, color=None):
+        if color is None:
+            color = self.WHITE
+        cv2.putText(img, text, pos, self.font, self.font_scale, color, 1, cv2.LINE_AA)
+    
+    def draw_yaw_indicator(self, img, yaw_angle):
+        # Normalize yaw angle to 0-360
+        yaw_angle = yaw_angle % 360
+        
+        # Draw background
+        # cv2.rectangle(img, (0, 0), (self.width, self.YAW_HEIGHT), self.GRAY, -1)
+        
+        # Calculate pixel per degree for yaw
+        pixels_per_degree = self.width / 360
+        
+        # Draw tick marks
+        for angle in range(0, 360, 5):  # Draw every 5 degrees
+            x_pos = int((angle - yaw_angle) * pixels_per_degree)
+            x_pos = x_pos % self.width
+            
+            # Determine tick length
+            if angle % 45 == 0:  # Cardinal and intercardinal directions
+                tick_length = self.MAJOR_TICK_LENGTH
+                # Draw direction label
+                if angle in self.cardinal_directions:
+                    text = self.cardinal_directions[angle]
+                    text_size = cv2.getTextSize(text, self.font, self.font_scale, 1)[0]
+                    text_x = int(x_pos - text_size[0]/2)
+                    self.draw_text(img, text, (text_x, self.LABEL_OFFSET + text_size[1]))
+            else:
+                tick_length = self.MINOR_TICK_LENGTH
+            
+            # Draw tick
+            cv2.line(img, (x_pos, 0), (x_pos, tick_length), self.WHITE, 1, cv2.LINE_AA)
+    
+    def draw_pitch_indicator(self, img, pitch_angle):
+        # Normalize pitch angle to -180 to 180
+        pitch_angle = max(-180, min(180, pitch_angle))
+        
+        # Draw background
+        # cv2.rectangle(img, 
+        #              (self.width - self.PITCH_WIDTH, 0),
+        #              (self.width, self.height),
+        #              self.GRAY, -1)
+        
+        # Calculate pixel per degree for pitch
+        pixels_per_degree = self.height / 360
+        
+        # Draw tick marks
+        for angle in range(-180, 181, 10):  # Draw every 10 degrees
+            y_pos = int(self.height/2 + (angle - pitch_angle) * pixels_per_degree)
+            
+            # Skip if outside screen
+            if y_pos < 0 or y_pos > self.height:
+                continue
+            
+            # Determine tick length
+            if angle % 30 == 0:  # Major ticks
+                tick_length = self.MAJOR_TICK_LENGTH
+                # Draw angle label
+                text = str(angle)
+                text_size = cv2.getTextSize(text, self.font, self.font_scale, 1)[0]
+                text_x = self.width - self.PITCH_WIDTH - text_size[0] - 5
+                text_y = int(y_pos + text_size[1]/2)
+                self.draw_text(img, text, (text_x, text_y))
+            else:
+                tick_length = self.MINOR_TICK_LENGTH
+            
+            # Draw tick
+            start_point = (self.width - self.PITCH_WIDTH, y_pos)
+            end_point = (self.width - self.PITCH_WIDTH + tick_length, y_pos)
+            cv2.line(img, start_point, end_point, self.WHITE, 1, cv2.LINE_AA)
+
+    def build_tapes(self):
+        """Render the yaw and pitch scales into wrap-around RGBA tapes.
+
+        The yaw tape is two screen widths wide so any 360 degree window is a
+        plain slice. The pitch tape covers -180 to 180 degrees with half a
+        screen of padding above and below.
+        """
+        width = self.width
+        height = self.height
+
+        # Yaw: every tick and label is drawn at x and at x +/- width so the
+        # window never has to wrap
+        yaw_ppd = width / 360
+        canvas = np.zeros((self.YAW_HEIGHT, width * 2, 3), dtype=np.uint8)
+        for angle in range(0, 360, 5):
+            base_x = int(angle * yaw_ppd)
+
+            if angle % 45 == 0:
+                tick_length = self.MAJOR_TICK_LENGTH
+            else:
+                tick_length = self.MINOR_TICK_LENGTH
+
+            text = self.cardinal_directions.get(angle)
+            if text is not None:
+                text_size = cv2.getTextSize(text, self.font, self.font_scale, 1)[0]
+
+            for x_pos in (base_x - width, base_x, base_x + width, base_x + width * 2):
+                if text is not None:
+                    text_x = int(x_pos - text_size[0]/2)
+                    self.draw_text(canvas, text, (text_x, self.LABEL_OFFSET + text_size[1]))
+                cv2.line(canvas, (x_pos, 0), (x_pos, tick_length), self.WHITE, 1, cv2.LINE_AA)
+
+        self.yaw_tape = HUDTape.from_canvas(canvas, self.WHITE)
+
+        # Pitch: the strip spans from the widest label to the end of a major tick
+        pitch_ppd = height / 360
+        label_sizes = {
+            angle: cv2.getTextSize(str(angle), self.font, self.font_scale, 1)
+            for angle in range(-180, 181, 30)
+        }
+        label_width = max(size[0][0] for size in label_sizes.values())
+        pad = max(size[0][1] + size[1] for size in label_sizes.values())
+
+        tick_x = self.width - self.PITCH_WIDTH
+        strip_x = max(0, tick_x - label_width - 5)
+        strip_end = min(self.width, tick_x + self.MAJOR_TICK_LENGTH + 1)
+
+        canvas = np.zeros((height * 2 + pad * 2, strip_end - strip_x, 3), dtype=np.uint8)
+        for angle in range(-180, 181, 10):
+            y_pos = int(pad + height/2 + (angle + 180) * pitch_ppd)
+
+            if angle % 30 == 0:
+                tick_length = self.MAJOR_TICK_LENGTH
+                (text_w, text_h), _ = label_sizes[angle]
+                text_x = tick_x - text_w - 5 - strip_x
+                text_y = int(y_pos + text_h/2)
+                self.draw_text(canvas, str(angle), (text_x, text_y))
+            else:
+                tick_length = self.MINOR_TICK_LENGTH
+
+            cv2.line(canvas, (tick_x - strip_x, y_pos),
+                     (tick_x - strip_x + tick_length, y_pos), self.WHITE, 1, cv2.LINE_AA)
+
+        self.pitch_tape = HUDTape.from_canvas(canvas, self.WHITE)
+        self.pitch_tape_x = strip_x
+        self.pitch_tape_pad = pad
+
+        self.tape_key = (width, height, self.font, self.font_scale)
+
+    def save_tapes(self, file):
+        """Write the tapes, building them first if needed, to a path or file as .npz."""
+        if self.tape_key != (self.width, self.height, self.font, self.font_scale):
+            self.build_tapes()
+        np.savez(file, yaw=self.yaw_tape.rgba, pitch=self.pitch_tape.rgba,
+                 layout=np.array([self.pitch_tape_x, self.pitch_tape_pad]),
+                 key=np.array(self.tape_key, dtype=np.float64))
+
+    def load_tapes(self, file):
+        """Load tapes written by save_tapes().
+
+        Returns False, leaving the HUD unchanged, if they were built for
+        another size or font.
+        """
+        with np.load(file) as data:
+            key = (self.width, self.height, self.font, self.font_scale)
+            if tuple(data['key']) != key:
+                return False
+            yaw, pitch = data['yaw'], data['pitch']
+            pitch_tape_x, pitch_tape_pad = (int(value) for value in data['layout'])
+
+        self.yaw_tape = HUDTape(yaw)
+        self.pitch_tape = HUDTape(pitch)
+        self.pitch_tape_x = pitch_tape_x
+        self.pitch_tape_pad = pitch_tape_pad
+        self.tape_key = key
+        return True
+
+    def blend_yaw_tape(self, img, yaw_angle):
+        yaw_angle = yaw_angle % 360
+        offset = int(round(yaw_angle * self.width / 360)) % self.width
+
+        self.yaw_tape.blend(img[:self.YAW_HEIGHT, :self.width], offset, 0)
+
+    def blend_pitch_tape(self, img, pitch_angle):
+        pitch_angle = max(-180, min(180, pitch_angle))
+        offset = self.pitch_tape_pad + int(round((pitch_angle + 180) * self.height / 360))
+
+        strip_w = self.pitch_tape.rgba.shape[1]
+        strip = img[:self.height, self.pitch_tape_x:self.pitch_tape_x + strip_w]
+        self.pitch_tape.blend(strip, 0, offset)
+
+    def draw_stats(self, img, lines, origin=None):
+        """Draw a small panel of text lines, e.g. Timings.summary_lines().
+
+        The panel sits below the yaw indicator on the left side by default.
+        """
+        if not lines:
+            return img
+
+        line_height = 14
+        width = 8 + 7 * max(len(line) for line in lines)
+        height = 6 + line_height * len(lines)
+        x, y = origin if origin is not None else (4, self.YAW_HEIGHT + 4)
+
+        # Darken the panel area so the text stays readable over video
+        panel = img[y:y + height, x:x + width]
+        panel //= 2
+
+        for i, line in enumerate(lines):
+            self.draw_text(img, line, (x + 4, y + line_height * (i + 1)))
+        return img
+
+    def update(self, img, pitch, yaw):
+        # Create blank image
+        # img = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+
+        if not self.use_tapes:
+            # Draw indicators
+            self.draw_yaw_indicator(img, yaw)
+            self.draw_pitch_indicator(img, pitch)
+            return img
+
+        if self.tape_key != (self.width, self.height, self.font, self.font_scale):
+            self.build_tapes()
+
+        self.blend_yaw_tape(img, yaw)
+        self.blend_pitch_tape(img, pitch)
+
+        return img
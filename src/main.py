@@ -1,240 +1,257 @@
-import numpy as np
-import fcntl
-import mmap
-import struct
 import time
-import os
 
-class FrameBuffer:
-    """Class to handle direct framebuffer access on Raspberry Pi."""
-    
-    def __init__(self, device='/dev/fb0'):
-        # Open the framebuffer device
-        self.fb = open(device, 'rb+')
-        
-        # Get fixed screen information
-        fix_info = struct.unpack('IIIIHH',
-            fcntl.ioctl(self.fb.fileno(),
-                       0x4602,  # FBIOGET_FSCREENINFO
-                       struct.pack('IIIIHH', 0, 0, 0, 0, 0, 0)))
-        
-        # Get variable screen information
-        var_info = struct.unpack('IIIIIIIIHHHHHH',
-            fcntl.ioctl(self.fb.fileno(),
-                       0x4600,  # FBIOGET_VSCREENINFO
-                       struct.pack('IIIIIIIIHHHHHH', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)))
-        
-        self.xres = var_info[0]
-        self.yres = var_info[1]
-        self.bits_per_pixel = var_info[6]
-        self.bytes_per_pixel = self.bits_per_pixel // 8
-
-        print(f"Screen size: {self.xres}x{self.yres}")
-        
-        # Map the framebuffer to memory
-        self.fb_size = fix_info[1]  # Length of framebuffer memory
-        self.fb_map = mmap.mmap(self.fb.fileno(), self.fb_size, mmap.MAP_SHARED, mmap.PROT_WRITE|mmap.PROT_READ)
-    
-    def display_frame(self, frame):
-        """Display a numpy array as a frame.
-        
-        Args:
-            frame: numpy array of shape (height, width, 3) with uint8 RGB values
-        """
-        # Ensure frame matches framebuffer dimensions
-        if frame.shape[:2] != (self.yres, self.xres):
-            frame = cv2.resize(frame, (self.xres, self.yres))
-        
-        # Convert frame to correct format (BGR888 to RGB565)
-        if self.bits_per_pixel == 16:
-            # Convert RGB888 to RGB565
-            r = (frame[:, :, 0] >> 3).astype(np.uint16) << 11
-            g = (frame[:, :, 1] >> 2).astype(np.uint16) << 5
-            b = (frame[:, :, 2] >> 3).astype(np.uint16)
-            frame_rgb565 = (r | g | b).astype(np.uint16)
-            buffer = frame_rgb565.tobytes()
-        else:
-            # Assume 24/32 bit color
-            buffer = frame.tobytes()
-        
-        # Write to framebuffer
-        self.fb_map.seek(0)
-        self.fb_map.write(buffer)
-    
-    def __del__(self):
-        self.fb_map.close()
-        self.fb.close()
-
-
-
-
-class PitchYawHUD:
-    def __init__(self, width=800, height=600):
-        self.width = width
-        self.height = height
-        
-        # Colors (in BGR for OpenCV)
-        self.WHITE = (255, 255, 255)
-        self.GRAY = (128, 128, 128)
-        self.BLACK = (0, 0, 0)
-        
-        # HUD dimensions
-        self.YAW_HEIGHT = 40
-        self.PITCH_WIDTH = 40
-        
-        # Tick marks
-        self.MAJOR_TICK_LENGTH = 15
-        self.MINOR_TICK_LENGTH = 8
-        self.LABEL_OFFSET = 20
-        
-        # Font
-        self.font = cv2.FONT_HERSHEY_SIMPLEX
-        self.font_scale = 0.4
-        
-        # Cardinal directions for yaw
-        self.cardinal_directions = {
-            0: "N", 45: "NE", 90: "E", 135: "SE",
-            180: "S", 225: "SW", 270: "W", 315: "NW"
-        }
-    
-    def draw_text(self, img, text, pos, color=None):
-        if color is None:
-            color = self.WHITE
-        cv2.putText(img, text, pos, self.font, self.font_scale, color, 1, cv2.LINE_AA)
-    
-    def draw_yaw_indicator(self, img, yaw_angle):
-        # Normalize yaw angle to 0-360
-        yaw_angle = yaw_angle % 360
-        
-        # Draw background
-        # cv2.rectangle(img, (0, 0), (self.width, self.YAW_HEIGHT), self.GRAY, -1)
-        
-        # Calculate pixel per degree for yaw
-        pixels_per_degree = self.width / 360
-        
-        # Draw tick marks
-        for angle in range(0, 360, 5):  # Draw every 5 degrees
-            x_pos = int((angle - yaw_angle) * pixels_per_degree)
-            x_pos = x_pos % self.width
-            
-            # Determine tick length
-            if angle % 45 == 0:  # Cardinal and intercardinal directions
-                tick_length = self.MAJOR_TICK_LENGTH
-                # Draw direction label
-                if angle in self.cardinal_directions:
-                    text = self.cardinal_directions[angle]
-                    text_size = cv2.getTextSize(text, self.font, self.font_scale, 1)[0]
-                    text_x = int(x_pos - text_size[0]/2)
-                    self.draw_text(img, text, (text_x, self.LABEL_OFFSET + text_size[1]))
-            else:
-                tick_length = self.MINOR_TICK_LENGTH
-            
-            # Draw tick
-            cv2.line(img, (x_pos, 0), (x_pos, tick_length), self.WHITE, 1, cv2.LINE_AA)
-    
-    def draw_pitch_indicator(self, img, pitch_angle):
-        # Normalize pitch angle to -180 to 180
-        pitch_angle = max(-180, min(180, pitch_angle))
-        
-        # Draw background
-        # cv2.rectangle(img, 
-        #              (self.width - self.PITCH_WIDTH, 0),
-        #              (self.width, self.height),
-        #              self.GRAY, -1)
-        
-        # Calculate pixel per degree for pitch
-        pixels_per_degree = self.height / 360
-        
-        # Draw tick marks
-        for angle in range(-180, 181, 10):  # Draw every 10 degrees
-            y_pos = int(self.height/2 + (angle - pitch_angle) * pixels_per_degree)
-            
-            # Skip if outside screen
-            if y_pos < 0 or y_pos > self.height:
-                continue
-            
-            # Determine tick length
-            if angle % 30 == 0:  # Major ticks
-                tick_length = self.MAJOR_TICK_LENGTH
-                # Draw angle label
-                text = str(angle)
-                text_size = cv2.getTextSize(text, self.font, self.font_scale, 1)[0]
-                text_x = self.width - self.PITCH_WIDTH - text_size[0] - 5
-                text_y = int(y_pos + text_size[1]/2)
-                self.draw_text(img, text, (text_x, text_y))
-            else:
-                tick_length = self.MINOR_TICK_LENGTH
-            
-            # Draw tick
-            start_point = (self.width - self.PITCH_WIDTH, y_pos)
-            end_point = (self.width - self.PITCH_WIDTH + tick_length, y_pos)
-            cv2.line(img, start_point, end_point, self.WHITE, 1, cv2.LINE_AA)
-
-    def update(self, img, pitch, yaw):
-        # Create blank image
-        # img = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        
-        # Draw indicators
-        self.draw_yaw_indicator(img, yaw)
-        self.draw_pitch_indicator(img, pitch)
-        
-        return img
+# Startup is timed from here; see --startup-log
+STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
 
+# Shared modules live in the repository root; deploy.sh copies them next to this file
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from startup import DEFAULT_CACHE_DIR, Background, StartupLog, WarmupCache, wait_for_frame
 
+FRAMEBUFFER_DEVICE = '/dev/fb0'
+# Camera size asked for before the display size is known, on a cold start
+DEFAULT_CAMERA_SIZE = (640, 480)
 
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Camera feed with pitch/yaw HUD")
+    parser.add_argument('--timing', action='store_true', help="collect per-stage latencies")
+    parser.add_argument('--timing-file', help="append latency reports to this file")
+    parser.add_argument('--stats-overlay', action='store_true', help="draw latency stats on the HUD")
+    parser.add_argument('--source', default='0',
+                        help="camera index, video file or frame recording (default: camera 0)")
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="per-frame processing budget for the adaptive quality (default: fixed quality)")
+    parser.add_argument('--split', action='store_true',
+                        help="run the optical flow analysis in a second process and show its pitch/yaw")
+    parser.add_argument('--show-points', action='store_true',
+                        help="with --split, draw the tracked points under the HUD")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="warm-up cache of the framebuffer geometry and HUD tapes")
+    parser.add_argument('--no-cache', action='store_true', help="build everything from scratch")
+    parser.add_argument('--first-frame-timeout', type=float, default=5.0,
+                        help="seconds to wait for the camera's first valid frame")
+    parser.add_argument('--startup-log', help="append the startup timeline to this file")
+    args = parser.parse_args()
+
+    startup = StartupLog(STARTED)
+    cache = None if args.no_cache else WarmupCache(args.cache_dir)
+    geometry = cache.load_geometry(FRAMEBUFFER_DEVICE) if cache else None
+
+    def open_framebuffer():
+        from framebuffer import FrameBuffer
+        fb = FrameBuffer(FRAMEBUFFER_DEVICE)
+        startup.mark('framebuffer')
+        return fb
+
+    def open_camera(width, height):
+        import cv2
+        from recording import open_capture, parse_source
+
+        # Recordings are replayed at their recorded pace, like a live camera
+        cap = open_capture(parse_source(args.source), realtime=True)
+        if not cap.isOpened():
+            return cap, None
+
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        # cap.set(cv2.CV_CAP_PROP_EXPOSURE, 0.1)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        startup.mark('camera')
+
+        frame = wait_for_frame(cap, args.first_frame_timeout)
+        startup.mark('first_frame')
+        return cap, frame
+
+    # The camera and the framebuffer open while the heavy modules import. The
+    # camera is opened at the cached display size, or a default one on a cold
+    # start, and reopened only if the display turns out to differ.
+    print("Opening framebuffer and camera...")
+    framebuffer_task = Background(open_framebuffer, name='framebuffer')
+    camera_size = (geometry['xres'], geometry['yres']) if geometry else DEFAULT_CAMERA_SIZE
+    camera_task = None if args.split else Background(open_camera, *camera_size, name='camera')
+
     print("Importing...")
     import cv2
-    import time
-    
-    # Initialize framebuffer
-    print("Framebuffer...")
-    fb = FrameBuffer()
+    from pipeline import END_OF_STREAM, FramePipeline
+    from hud import PitchYawHUD
+    from timing import Timings
+    from quality import QualityController
+    from frames import FramePool, FrameReader
+    from recording import parse_source
+    startup.mark('imports')
+
+    timings = Timings(enabled=args.timing or args.stats_overlay or bool(args.timing_file),
+                      dump_path=args.timing_file)
+    controller = QualityController(args.budget_ms) if args.budget_ms else None
+
+    fb = framebuffer_task.result()
+    if cache and (geometry is None or (geometry['xres'], geometry['yres']) != (fb.xres, fb.yres)):
+        cache.save_geometry(FRAMEBUFFER_DEVICE, fb)
+    if camera_task is not None and camera_size != (fb.xres, fb.yres):
+        # Opened for a stale or default size; reopen it for the real one
+        cap, _ = camera_task.result()
+        cap.release()
+        camera_task = Background(open_camera, fb.xres, fb.yres, name='camera')
 
     hud = PitchYawHUD(width=fb.xres, height=fb.yres)
-    
-    # Create a test pattern
-    print("Creating test pattern...")
-    test_frame = np.zeros((fb.yres, fb.xres, 3), dtype=np.uint8)
+    if cache is None or not cache.load_hud(hud):
+        hud.build_tapes()
+        if cache:
+            cache.save_hud(hud)
+    startup.mark('hud')
 
-    cap = cv2.VideoCapture(0)
+    display_shape = (fb.yres, fb.xres, 3)
+    last_dump = time.monotonic()
 
-    if not cap.isOpened():
-        print("Error: Could not open camera.")
-        exit()
+    def display(frame):
+        global last_dump
+        with timings.stage('display'):
+            # fb.display_frame(frame)
+            cv2.imshow("e", frame)
+            key = cv2.waitKey(1)
+        timings.tick()
+
+        if 'first_display' not in startup.steps:
+            startup.mark('first_display')
+            print(startup.format())
+            if args.startup_log:
+                startup.dump(args.startup_log)
+
+        if args.timing_file and time.monotonic() - last_dump > 5:
+            timings.dump()
+            last_dump = time.monotonic()
+
+        return key & 0xFF != ord('q')
+
+    def draw_overlays(frame, pitch, yaw):
+        with timings.stage('hud'):
+            hud.update(frame, pitch, yaw)
+            if args.stats_overlay:
+                lines = timings.summary_lines()
+                if controller:
+                    lines = lines + [f"quality {controller.level}"]
+                hud.draw_stats(frame, lines)
+
+    if args.split:
+        import multiprocessing
+        from overlay import FlowRenderer
+        from shared_ring import FrameRing
+        from split import run_analysis, run_display
+
+        # The display process owns the ring, the analysis process owns the camera
+        # and adapts its own quality to the budget
+        controller = None
+        ring = FrameRing.create(fb.xres, fb.yres)
+        pool = FramePool(count=2)
+        context = multiprocessing.get_context('spawn')
+        stop_event = context.Event()
+        analysis = context.Process(target=run_analysis, name='analysis',
+                                   args=(ring.name, parse_source(args.source), stop_event),
+                                   kwargs=dict(budget_ms=args.budget_ms or None))
+        analysis.start()
 
-    
+        # Frames are RGB by the time the points are drawn
+        renderer = FlowRenderer(outlier_color=(255, 0, 0))
 
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, fb.xres)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, fb.yres)
-    time.sleep(2)
+        def render(i):
+            frame = pool.acquire(display_shape)
+            with timings.stage('cvtColor'):
+                cv2.cvtColor(ring.frames[i], cv2.COLOR_BGR2RGB, dst=frame)
+            if args.show_points:
+                with timings.stage('points'):
+                    count = int(ring.point_counts[i])
+                    renderer.draw_vectors(frame, ring.points[i, :count],
+                                          outliers=ring.outliers[i, :count].astype(bool))
+            draw_overlays(frame, float(ring.pitch[i]), float(ring.yaw[i]))
+            return frame
 
+        try:
+            print(run_display(ring, render, display, analysis.is_alive, release=pool.release))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_event.set()
+            analysis.join(2)
+            if analysis.is_alive():
+                analysis.terminate()
+            ring.close()
+            cv2.destroyAllWindows()
+            if timings.enabled:
+                print(timings.format_report())
+                timings.dump()
+        sys.exit(0)
 
-    # cap.set(cv2.CV_CAP_PROP_FRAME_WIDTH, fb.xres)
-    # cap.set(cv2.CV_CAP_PROP_FRAME_HEIGHT, fb.yres)
-    # cap.set(cv2.CV_CAP_PROP_EXPOSURE, 0.1)
+    cap, first_frame = camera_task.result()
+    if not cap.isOpened():
+        print("Error: Could not open camera.")
+        exit()
+    if first_frame is None:
+        print(f"Error: No frame from the camera within {args.first_frame_timeout:g}s.")
+        cap.release()
+        exit()
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            # print("err") 
-            continue
+    # Camera frames and display frames come from fixed rings of buffers. Up to
+    # seven are live at once: the frame being captured, one in each queue,
+    # the frame being processed with its resized copy and its output, and the
+    # frame on display. When the camera runs at the display size both kinds
+    # share one ring, so each ring is sized for all of them.
+    pool = FramePool(count=7)
+    reader = FrameReader(cap, pool)
+    # The frame wait_for_frame returned is the first one shown
+    pending = [first_frame]
+    live = isinstance(parse_source(args.source), int)
 
-        print(frame.shape)
+    def capture():
+        if pending:
+            return pending.pop()
+        with timings.stage('capture'):
+            frame = reader.read()
+        if frame is None:
+            # print("err")
+            # A camera can miss a frame; a video or recording has ended
+            return None if live else END_OF_STREAM
+        return frame
+
+    def process(frame):
+        start = time.perf_counter()
+        interpolation = controller.settings.interpolation if controller else cv2.INTER_CUBIC
 
         # frame = frame[:fb.xres, :fb.yres]
-        frame = cv2.resize(frame, dsize=(fb.xres, fb.yres), interpolation=cv2.INTER_CUBIC)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with timings.stage('resize'):
+            resized = pool.acquire(display_shape)
+            cv2.resize(frame, dsize=(fb.xres, fb.yres), dst=resized, interpolation=interpolation)
+        with timings.stage('cvtColor'):
+            frame = pool.acquire(display_shape)
+            cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=frame)
+            pool.release(resized)
 
         # test_frame[y_offset:y_offset+frame.shape[0], x_offset:x_offset+frame.shape[1]] = frame
-        
-        frame = hud.update(frame, 0, 0)
 
-        # fb.display_frame(frame)
-        cv2.imshow("e", frame)
-        cv2.waitKey(1)
+        draw_overlays(frame, 0, 0)
+
+        if controller:
+            controller.update(time.perf_counter() - start)
+        return frame
+
+    pipeline = FramePipeline(capture, process, display, release=pool.release)
+    try:
+        pipeline.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        cap.release()
+        cv2.destroyAllWindows()
+        print(pipeline.stats())
+        print(pool.stats())
+        if timings.enabled:
+            print(timings.format_report())
+            timings.dump()
 
 # convert "/usr/share/rpd-wallpaper/raspberry-pi-logo.png"\["$fbw"x"$fbh"^\] +flip -strip -define bmp:subtype=RGB565 bmp2:- | tail -c $(( fbw * fbh * fbd / 8 )) > /dev/fb0
\ No newline at end of file
@@ -0,0 +1,234 @@
+import queue
+import threading
+import time
+
+# Returned by a pipeline's capture callable when the source has no more frames
+END_OF_STREAM = object()
+
+
+class LatestQueue:
+    """Bounded queue that keeps only the newest items.
+
+    When the queue is full, putting a new item discards the oldest one
+    instead of blocking the producer. Discarded items are counted in
+    `dropped` and passed to `on_drop`, if given.
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+
+            # Throw away the stale item so the consumer only sees fresh frames
+            try:
+                stale = self.queue.get_nowait()
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(stale)
+            except queue.Empty:
+                pass
+
+    def get(self, timeout=None):
+        """Return the oldest queued item, raising queue.Empty on timeout."""
+        return self.queue.get(timeout=timeout)
+
+    def empty(self):
+        return self.queue.empty()
+
+    def clear(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if self.on_drop is not None:
+                self.on_drop(item)
+
+
+class StageStats:
+    """Counters for a single pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.dropped = 0
+        self.busy_time = 0.0
+
+    def as_dict(self):
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'busy_time': self.busy_time,
+        }
+
+
+class FramePipeline:
+    """Capture -> process -> display pipeline running on separate threads.
+
+    Capture and processing run on worker threads, display runs on the thread
+    that calls `run()` (cv2.imshow and most display backends need the main
+    thread). Stages are connected by `LatestQueue`s so a slow stage makes
+    the stage before it drop old frames instead of building up latency.
+
+    When capture returns END_OF_STREAM, the frames already captured are
+    still processed and displayed, then `run()` returns.
+
+    Args:
+        capture: callable returning the next frame, None if no frame is
+            available yet, or END_OF_STREAM when the source has ended
+        process: callable taking a captured frame and returning the frame
+            to display
+        display: callable taking a processed frame. Returning False stops
+            the pipeline.
+        queue_size: number of frames buffered between stages
+        poll_interval: seconds a stage waits on its input before checking
+            for shutdown
+        retry_interval: seconds the capture stage waits after capture
+            returned None, so an idle source is not polled in a busy loop
+        release: optional callable handing a frame back when the pipeline
+            is done with it (e.g. frames.FramePool.release). It gets dropped
+            frames, captured frames once processed into a different frame,
+            and frames after they were displayed.
+    """
+
+    def __init__(self, capture, process, display, queue_size=1, poll_interval=0.1,
+                 retry_interval=0.005, release=None):
+        self.capture = capture
+        self.process = process
+        self.display = display
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.release = release or (lambda frame: None)
+
+        self.captured = LatestQueue(queue_size, on_drop=self.release)
+        self.processed = LatestQueue(queue_size, on_drop=self.release)
+
+        self.stop_event = threading.Event()
+        # Set by a worker stage once it has passed on its last frame
+        self.capture_ended = threading.Event()
+        self.process_ended = threading.Event()
+        self.error = None
+        self.threads = []
+
+        self.stats_by_stage = {
+            'capture': StageStats('capture'),
+            'process': StageStats('process'),
+            'display': StageStats('display'),
+        }
+
+    def start(self):
+        """Start the capture and processing threads."""
+        if self.threads:
+            return
+
+        self.stop_event.clear()
+        self.capture_ended.clear()
+        self.process_ended.clear()
+        self.threads = [
+            threading.Thread(target=self._run_stage, name='capture',
+                             args=(self._capture_step,), daemon=True),
+            threading.Thread(target=self._run_stage, name='process',
+                             args=(self._process_step,), daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        """Signal all stages to stop and wait for the worker threads."""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+        self.captured.clear()
+        self.processed.clear()
+
+    def run(self):
+        """Start the pipeline and run the display stage until stopped."""
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                if not self._display_step():
+                    break
+        finally:
+            self.stop()
+
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """Return per-stage frame and drop counters."""
+        # A frame dropped from a queue was produced by the stage feeding it
+        self.stats_by_stage['capture'].dropped = self.captured.dropped
+        self.stats_by_stage['process'].dropped = self.processed.dropped
+        return {name: stage.as_dict() for name, stage in self.stats_by_stage.items()}
+
+    def _run_stage(self, step):
+        try:
+            while not self.stop_event.is_set():
+                if step() is False:
+                    return
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+
+    def _capture_step(self):
+        stats = self.stats_by_stage['capture']
+        start = time.perf_counter()
+        frame = self.capture()
+        stats.busy_time += time.perf_counter() - start
+
+        if frame is END_OF_STREAM:
+            self.capture_ended.set()
+            return False
+        if frame is None:
+            self.stop_event.wait(self.retry_interval)
+            return
+
+        stats.frames += 1
+        self.captured.put(frame)
+
+    def _process_step(self):
+        try:
+            frame = self.captured.get(timeout=self.poll_interval)
+        except queue.Empty:
+            # The capture stage puts its last frame before it signals the end
+            if self.capture_ended.is_set() and self.captured.empty():
+                self.process_ended.set()
+                return False
+            return
+
+        stats = self.stats_by_stage['process']
+        start = time.perf_counter()
+        processed = self.process(frame)
+        stats.busy_time += time.perf_counter() - start
+
+        if processed is not frame:
+            self.release(frame)
+        if processed is None:
+            return
+
+        stats.frames += 1
+        self.processed.put(processed)
+
+    def _display_step(self):
+        try:
+            frame = self.processed.get(timeout=self.poll_interval)
+        except queue.Empty:
+            return not (self.process_ended.is_set() and self.processed.empty())
+
+        stats = self.stats_by_stage['display']
+        start = time.perf_counter()
+        keep_running = self.display(frame)
+        stats.busy_time += time.perf_counter() - start
+        stats.frames += 1
+        self.release(frame)
+
+        return keep_running is not False
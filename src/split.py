@@ -0,0 +1,125 @@
+"""Analysis and display in separate processes, connected by a shared memory ring.
+
+The analysis process owns the camera. It runs the optical flow analysis,
+integrates the camera motion into pitch/yaw and publishes every frame,
+resized to the display, into a shared_ring.FrameRing together with the
+tracked points. The display process renders the newest published slot.
+The ring never blocks: the analysis overwrites slots the display has not
+read, and the display skips whatever it was too slow to show.
+"""
+import time
+
+import cv2
+
+from optical_flow import AttitudeIntegrator, MotionAnalyzer
+from quality import QualityController
+from recording import open_capture
+from shared_ring import FrameRing
+
+
+def run_analysis(ring_name, source, stop_event, max_points=1000, min_points=600,
+                 fov=(62.2, 48.8), budget_ms=None):
+    """Entry point of the analysis process.
+
+    Args:
+        ring_name: Name of the FrameRing created by the display process
+        source: Camera index, video file or recording
+        stop_event: multiprocessing.Event set by the display process to stop
+        max_points: Number of points to track
+        min_points: Cells are refilled when they fall below their share of this
+        fov: Camera (horizontal, vertical) field of view in degrees
+        budget_ms: Per-frame analysis budget for the adaptive quality
+    """
+    ring = FrameRing.attach(ring_name)
+    height, width = ring.frame_shape[:2]
+
+    cap = open_capture(source, realtime=True)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    controller = QualityController(budget_ms) if budget_ms else None
+    analyzer = MotionAnalyzer(max_points, min_points, controller=controller)
+    integrator = None
+    pitch = yaw = 0.0
+
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            result = analyzer.process(frame)
+            frame_height, frame_width = frame.shape[:2]
+            if integrator is None:
+                integrator = AttitudeIntegrator(frame_width, frame_height, fov)
+
+            if result is None:
+                ring.publish(frame, pitch, yaw)
+                continue
+
+            pitch, yaw = integrator.update(result.camera_motion)
+            # Points in display coordinates, like the published frame
+            points = result.points.reshape(-1, 2) * (width / frame_width, height / frame_height)
+            ring.publish(frame, pitch, yaw, result.camera_motion, points, result.outliers)
+    finally:
+        cap.release()
+        ring.close()
+
+
+def run_display(ring, render, display, alive, release=None, poll_interval=0.002):
+    """Show the newest slot of the ring until display() returns False or alive() is False.
+
+    Once the analysis process has ended, the slots it published that were
+    not shown yet, like the last frames of a video file, are shown in order.
+
+    Args:
+        ring: FrameRing written by the analysis process
+        render: Callable taking a slot index and returning the frame to show,
+            rendered into memory of its own
+        display: Callable showing a rendered frame, returning False to stop
+        alive: Callable returning False once the analysis process has ended
+        release: Optional callable handing back a rendered frame once it is
+            shown or discarded, e.g. frames.FramePool.release
+        poll_interval: Seconds to sleep when no new slot has been published
+
+    Returns:
+        Dict with the number of frames shown and of slots overwritten while
+        they were being rendered
+    """
+    release = release or (lambda frame: None)
+    last = 0
+    shown = torn = 0
+    while alive():
+        latest = ring.latest(last)
+        if latest is None:
+            time.sleep(poll_interval)
+            continue
+
+        i, sequence = latest
+        frame = render(i)
+
+        # The analysis lapped the ring while this slot was being read
+        if not ring.still_valid(i, sequence):
+            torn += 1
+            release(frame)
+            continue
+
+        last = sequence
+        shown += 1
+        keep_running = display(frame)
+        release(frame)
+        if keep_running is False:
+            break
+    else:
+        # The writer is gone, so nothing is overwritten any more
+        for i, sequence in ring.pending(last):
+            frame = render(i)
+            last = sequence
+            shown += 1
+            keep_running = display(frame)
+            release(frame)
+            if keep_running is False:
+                break
+
+    return {'shown': shown, 'torn': torn, 'published': int(ring.published)}
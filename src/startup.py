@@ -0,0 +1,179 @@
+"""Startup helpers: opening devices in the background, waiting for the first
+frame, a warm-up cache on disk and a timeline of the startup steps.
+
+Only the standard library is imported here, so main.py can start its
+background work before cv2 and numpy have finished importing.
+"""
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'optical-flow-outliar')
+
+
+class StartupLog:
+    """Seconds from `start` to each named startup step.
+
+    Args:
+        start: time.perf_counter() value the steps are measured from,
+            usually taken first thing in the script
+    """
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.steps = {}
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        """Record that a step finished now. Returns its time since start."""
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            self.steps[name] = elapsed
+        return elapsed
+
+    def format(self):
+        with self.lock:
+            steps = sorted(self.steps.items(), key=lambda step: step[1])
+        return "Startup: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in steps)
+
+    def dump(self, path):
+        """Append the steps as one JSON line to path."""
+        with self.lock:
+            record = {'time': time.time(), 'steps': dict(self.steps)}
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+
+class Background(threading.Thread):
+    """Run fn(*args) in a daemon thread; result() waits for it.
+
+    Exceptions raised by fn are re-raised by result() in the waiting thread.
+    """
+
+    def __init__(self, fn, *args, name=None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.fn(*self.args)
+        except BaseException as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def wait_for_frame(cap, timeout=5.0, poll=0.005, max_poll=0.05):
+    """Read frames until one is not blank, instead of sleeping a fixed time.
+
+    Cameras often return nothing or all-black frames while the sensor and
+    the auto exposure settle. A failed read can return at once, so the wait
+    between retries starts at poll seconds and doubles up to max_poll,
+    rather than spinning on the camera.
+
+    A scene that really is black, like a dark room or a covered lens, never
+    gives a brighter frame; the last frame read is returned at the timeout.
+
+    Returns:
+        The first frame that is not blank, else the last frame read, or
+        None if the capture ended or returned nothing before the timeout
+    """
+    deadline = time.perf_counter() + timeout
+    delay = poll
+    last = None
+    while time.perf_counter() < deadline:
+        ret, frame = cap.read()
+        if not ret:
+            if not cap.isOpened():
+                return None
+            time.sleep(min(delay, max(0.0, deadline - time.perf_counter())))
+            delay = min(delay * 2, max_poll)
+            continue
+        delay = poll
+        if frame is None or not frame.size:
+            continue
+        if frame.max() > 0:
+            return frame
+        last = frame
+    return last
+
+
+class WarmupCache:
+    """Startup artifacts kept on disk between runs.
+
+    The framebuffer geometry is stored per device, so the display size is
+    known before the device is opened and the camera, HUD and buffers can
+    be set up for it in parallel. Artifacts that depend on the display size,
+    like the pre-rendered HUD tapes, are stored per resolution:
+
+        cache_dir/framebuffer.json          {device: geometry}
+        cache_dir/<width>x<height>/hud.npz  HUD tapes
+
+    A stale or unreadable entry is treated as missing and rewritten.
+
+    Args:
+        cache_dir: Directory of the cache, created on the first write
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.geometry_path = os.path.join(cache_dir, 'framebuffer.json')
+
+    def resolution_dir(self, width, height):
+        return os.path.join(self.cache_dir, f"{width}x{height}")
+
+    def _geometries(self):
+        try:
+            with open(self.geometry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load_geometry(self, device):
+        """Cached geometry of a framebuffer device as a dict, or None."""
+        geometry = self._geometries().get(device)
+        if not isinstance(geometry, dict) or not {'xres', 'yres'} <= geometry.keys():
+            return None
+        return geometry
+
+    def save_geometry(self, device, fb):
+        """Store the geometry of an opened framebuffer.FrameBuffer."""
+        geometries = self._geometries()
+        geometries[device] = {
+            'xres': fb.xres,
+            'yres': fb.yres,
+            'bits_per_pixel': fb.bits_per_pixel,
+            'line_length': fb.line_length,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._replace(self.geometry_path, lambda f: f.write(json.dumps(geometries, indent=1).encode()))
+
+    def load_hud(self, hud):
+        """Load cached tapes into a hud.PitchYawHUD. Returns True on a hit."""
+        path = os.path.join(self.resolution_dir(hud.width, hud.height), 'hud.npz')
+        try:
+            return hud.load_tapes(path)
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def save_hud(self, hud):
+        directory = self.resolution_dir(hud.width, hud.height)
+        os.makedirs(directory, exist_ok=True)
+        self._replace(os.path.join(directory, 'hud.npz'), hud.save_tapes)
+
+    @staticmethod
+    def _replace(path, write):
+        """Write through a temporary file, so a crash never leaves half a cache entry."""
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'wb') as f:
+            write(f)
+        os.replace(temp, path)
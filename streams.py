@@ -0,0 +1,277 @@
+"""
+Motion analysis of several video streams over one shared worker pool.
+
+Every source (camera index, video file or frame recording) gets a capture
+thread that keeps only the newest `queue_size` frames, dropping the oldest
+one when the workers fall behind. A fixed pool of worker threads serves
+the streams round robin, one frame at a time per stream, so a busy stream
+cannot starve the others and each stream's frames are analyzed in order.
+OpenCV releases the GIL, so the workers run in parallel.
+
+Recordings are replayed at their recorded pace by default, like cameras.
+Video files are read as fast as they decode, so with slow workers most of
+their frames are dropped; use batch.py or parallel.py to analyze every
+frame of a file.
+
+Example:
+    python streams.py 0 1 recording.rec --workers 2 --duration 60
+"""
+import argparse
+import collections
+import os
+import threading
+import time
+
+from diffrence import MotionDetector
+from optical_flow import MotionAnalyzer
+from recording import open_capture, parse_source
+from timing import StageTimer
+
+
+class Stream:
+    """
+    One source with its own analyzers, frame queue and counters.
+
+    Args:
+        name: Label used in reports
+        source: Camera index, video file or recording
+        queue_size: Frames kept waiting for a worker; older ones are dropped
+        realtime: Replay recordings at their recorded pace, like a camera
+        flow: Run the optical flow analysis
+        diff: Run the frame differencing motion detector
+        max_points, min_points: MotionAnalyzer point budget
+        scale_factor, min_area: MotionDetector settings
+    """
+
+    def __init__(self, name, source, queue_size=1, realtime=True, flow=True, diff=True,
+                 max_points=1000, min_points=600, scale_factor=0.5, min_area=500):
+        self.name = name
+        self.source = source
+        self.cap = open_capture(source, realtime=realtime)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open {source}")
+
+        self.queue = collections.deque(maxlen=queue_size)
+        self.busy = False
+        self.finished = False
+
+        self.analyzer = MotionAnalyzer(max_points, min_points) if flow else None
+        self.detector = MotionDetector(scale_factor, min_area) if diff else None
+
+        self.captured = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency = StageTimer('latency')
+        self.process_time = StageTimer('process')
+
+    @property
+    def idle(self):
+        """True once the source has ended and every frame has been handled."""
+        return self.finished and not self.queue and not self.busy
+
+    def process(self, frame):
+        """Analyze one frame. Returns (flow_result, boxes)."""
+        flow_result = self.analyzer.process(frame) if self.analyzer else None
+        boxes = self.detector.process(frame) if self.detector else None
+        return flow_result, boxes
+
+    def stats(self, elapsed):
+        latency = self.latency.summary() or {}
+        process = self.process_time.summary() or {}
+        return {
+            'captured': self.captured,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'fps': self.processed / elapsed if elapsed > 0 else 0.0,
+            'latency_p50': latency.get('p50', 0.0),
+            'latency_p99': latency.get('p99', 0.0),
+            'process_p50': process.get('p50', 0.0),
+        }
+
+
+class StreamScheduler:
+    """
+    Run several Streams over a bounded pool of worker threads.
+
+    Args:
+        sources: Camera indices, video files and/or recordings
+        workers: Worker threads shared by all streams, defaults to the CPU count
+        on_result: Optional callable(stream, frame_index, flow_result, boxes),
+            called from the worker threads
+        stream_options: Passed on to every Stream
+    """
+
+    def __init__(self, sources, workers=None, on_result=None, **stream_options):
+        self.streams = [Stream(f"{i}:{source}", source, **stream_options)
+                        for i, source in enumerate(sources)]
+        self.workers = workers or os.cpu_count()
+        self.on_result = on_result
+
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.next_stream = 0
+        self.error = None
+        self.start_time = None
+
+    def start(self):
+        if self.threads:
+            return
+        self.stop_event.clear()
+        self.start_time = time.perf_counter()
+        for stream in self.streams:
+            self.threads.append(threading.Thread(target=self._guard, args=(self._capture, stream),
+                                                 name=f"capture {stream.name}", daemon=True))
+        for i in range(self.workers):
+            self.threads.append(threading.Thread(target=self._guard, args=(self._work,),
+                                                 name=f"worker {i}", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+        for stream in self.streams:
+            stream.cap.release()
+
+    def run(self, duration=None, report_interval=None):
+        """
+        Process until every source has ended, or for duration seconds.
+        Prints a report every report_interval seconds when given.
+        """
+        self.start()
+        last_report = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                with self.condition:
+                    if all(stream.idle for stream in self.streams):
+                        break
+                    self.condition.wait(0.1)
+
+                now = time.perf_counter()
+                if duration is not None and now - self.start_time >= duration:
+                    break
+                if report_interval and now - last_report >= report_interval:
+                    print(self.format_report())
+                    last_report = now
+        finally:
+            self.stop()
+
+        if self.error is not None:
+            raise self.error
+
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+            with self.condition:
+                self.condition.notify_all()
+
+    def _capture(self, stream):
+        index = 0
+        while not self.stop_event.is_set():
+            ret, frame = stream.cap.read()
+            if not ret:
+                break
+            captured_at = time.perf_counter()
+
+            with self.condition:
+                if len(stream.queue) == stream.queue.maxlen:
+                    # deque drops the oldest frame on append
+                    stream.dropped += 1
+                stream.queue.append((index, captured_at, frame))
+                stream.captured += 1
+                self.condition.notify()
+            index += 1
+
+        with self.condition:
+            stream.finished = True
+            self.condition.notify_all()
+
+    def _take(self):
+        """Next stream with a waiting frame and no frame in progress, round robin."""
+        count = len(self.streams)
+        for k in range(count):
+            i = (self.next_stream + k) % count
+            stream = self.streams[i]
+            if stream.queue and not stream.busy:
+                self.next_stream = (i + 1) % count
+                stream.busy = True
+                return stream, stream.queue.popleft()
+        return None, None
+
+    def _work(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                stream, item = self._take()
+                if stream is None:
+                    self.condition.wait(0.1)
+                    continue
+
+            index, captured_at, frame = item
+            succeeded = False
+            try:
+                start = time.perf_counter()
+                flow_result, boxes = stream.process(frame)
+                succeeded = True
+                done = time.perf_counter()
+                stream.process_time.add(done - start)
+                stream.latency.add(done - captured_at)
+                if self.on_result is not None:
+                    self.on_result(stream, index, flow_result, boxes)
+            finally:
+                with self.condition:
+                    stream.busy = False
+                    # Only analyzed frames count towards the fps
+                    if succeeded:
+                        stream.processed += 1
+                    else:
+                        stream.failed += 1
+                    self.condition.notify_all()
+
+    def stats(self):
+        """Per-stream throughput, drops and latency (milliseconds)."""
+        elapsed = time.perf_counter() - self.start_time if self.start_time else 0.0
+        return {stream.name: stream.stats(elapsed) for stream in self.streams}
+
+    def format_report(self):
+        lines = [f"{'stream':<24} {'fps':>6} {'done':>7} {'failed':>7} {'dropped':>8} {'lat p50':>8} {'lat p99':>8} {'proc p50':>9}"]
+        for name, s in self.stats().items():
+            lines.append(f"{name[:24]:<24} {s['fps']:>6.1f} {s['processed']:>7} {s['failed']:>7} {s['dropped']:>8} "
+                         f"{s['latency_p50']:>8.1f} {s['latency_p99']:>8.1f} {s['process_p50']:>9.1f}")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motion analysis of several streams on a shared worker pool")
+    parser.add_argument('sources', nargs='+', help="camera indices, video files or recordings")
+    parser.add_argument('--workers', type=int, default=None, help="worker threads (default: CPU count)")
+    parser.add_argument('--queue-size', type=int, default=1, help="frames kept per stream before dropping")
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    parser.add_argument('--fast', action='store_true', help="replay recordings as fast as possible")
+    parser.add_argument('--no-flow', action='store_true', help="skip the optical flow analysis")
+    parser.add_argument('--no-diff', action='store_true', help="skip the frame differencing detector")
+    args = parser.parse_args()
+
+    scheduler = StreamScheduler(
+        [parse_source(source) for source in args.sources],
+        workers=args.workers, queue_size=args.queue_size, realtime=not args.fast,
+        flow=not args.no_flow, diff=not args.no_diff,
+    )
+    try:
+        scheduler.run(args.duration, report_interval=5)
+    except KeyboardInterrupt:
+        pass
+    print(scheduler.format_report())
+
+
+if __name__ == "__main__":
+    main()
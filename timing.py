@@ -0,0 +1,166 @@
+"""
+Lightweight per-stage latency instrumentation.
+
+    timings = Timings()
+    with timings.stage('flow'):
+        ...
+    timings.tick()  # once per frame, for the FPS counter
+    print(timings.format_report())
+
+Durations go into fixed-size ring buffers allocated up front, so timing a
+stage costs two perf_counter() calls and an array store. A disabled
+Timings hands out a shared no-op context manager instead.
+"""
+import functools
+import json
+import time
+
+import numpy as np
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class StageTimer:
+    """Context manager recording the durations of one stage in a ring buffer."""
+
+    def __init__(self, name, size=512):
+        self.name = name
+        self.samples = np.zeros(size)
+        self.count = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.add(time.perf_counter() - self.start)
+        return False
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+
+    def recent(self):
+        """Durations currently held in the ring buffer, in seconds."""
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def summary(self):
+        """Rolling statistics in milliseconds."""
+        samples = self.recent()
+        if len(samples) == 0:
+            return None
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {
+            'count': self.count,
+            'mean': float(samples.mean() * 1000),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+        }
+
+
+class Timings:
+    """
+    Collection of named stage timers plus a frame rate counter.
+
+    Args:
+        enabled: When False, stage() returns a no-op and nothing is recorded
+        size: Number of samples kept per stage
+        dump_path: File that dump() appends JSON summaries to
+    """
+
+    def __init__(self, enabled=True, size=512, dump_path=None):
+        self.enabled = enabled
+        self.size = size
+        self.dump_path = dump_path
+        self.stages = {}
+
+        # Frame timestamps for the FPS counter
+        self.frame_times = np.zeros(size)
+        self.frames = 0
+
+        self.cached_lines = []
+        self.cached_at = 0.0
+
+    def stage(self, name):
+        """Return the context manager timing the named stage."""
+        if not self.enabled:
+            return NULL_STAGE
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer(name, self.size)
+        return timer
+
+    def timed(self, name):
+        """Decorator timing every call of a function as the named stage."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def tick(self):
+        """Mark the end of a frame."""
+        if not self.enabled:
+            return
+        self.frame_times[self.frames % self.size] = time.perf_counter()
+        self.frames += 1
+
+    def fps(self):
+        n = min(self.frames, self.size)
+        if n < 2:
+            return 0.0
+        times = self.frame_times[:n]
+        span = times.max() - times.min()
+        return (n - 1) / span if span > 0 else 0.0
+
+    def report(self):
+        """Rolling p50/p95/p99 per stage, in milliseconds."""
+        report = {name: timer.summary() for name, timer in self.stages.items()}
+        return {name: summary for name, summary in report.items() if summary is not None}
+
+    def format_report(self):
+        lines = [f"{'stage':<16} {'count':>7} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)"]
+        for name, s in self.report().items():
+            lines.append(f"{name:<16} {s['count']:>7} {s['mean']:>8.2f} {s['p50']:>8.2f} "
+                         f"{s['p95']:>8.2f} {s['p99']:>8.2f}")
+        lines.append(f"fps {self.fps():.1f}")
+        return "\n".join(lines)
+
+    def summary_lines(self, max_age=0.5):
+        """
+        Short per-stage lines for an on-screen panel. The text is rebuilt at
+        most every max_age seconds.
+        """
+        now = time.perf_counter()
+        if now - self.cached_at >= max_age:
+            lines = [f"{self.fps():5.1f} fps"]
+            for name, s in self.report().items():
+                lines.append(f"{name[:10]:<10} {s['p50']:5.1f} {s['p99']:5.1f}")
+            self.cached_lines = lines
+            self.cached_at = now
+        return self.cached_lines
+
+    def dump(self, path=None):
+        """Append the current report as one JSON line to path or dump_path."""
+        path = path or self.dump_path
+        if path is None or not self.enabled:
+            return
+        with open(path, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'fps': self.fps(), 'stages': self.report()}) + "\n")
+
+
+# Shared disabled instance, used when no timings are passed in
+NULL_TIMINGS = Timings(enabled=False, size=1)
@@ -1,8 +1,16 @@
-import cv2
+import sys
 
-cap = cv2.VideoCapture(0)
-while True:
-    ret, frame = cap.read()
-    with open('/dev/fb0', 'rb+') as buf:
-       buf.write(frame)
+from recording import open_capture, parse_source
+
+# Camera index, video file or frame recording
+cap = open_capture(parse_source(sys.argv[1]) if len(sys.argv) > 1 else 0)
+
+# Open the framebuffer once and rewind for every frame
+with open('/dev/fb0', 'rb+') as buf:
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        buf.seek(0)
+        buf.write(frame)
 cap.release()